@@ -0,0 +1,279 @@
+"""
+Local Answer Verification for Generated Questions
+
+The model's finalAnswer is recomputed or cross-checked without calling a model:
+
+- arithmetic:  every "a op b ... = c" written in the steps or the final
+               answer (+ - × ÷ with the usual precedence, no brackets) is
+               recomputed; c may be rounded to the decimals shown, a
+               fraction (4/16 = 1/4) or a percentage (3/5 = 60%)
+- mathTool:    for tools whose parameters pin the answer down, the numbers in
+               finalAnswer must include one the parameters imply:
+               rightTriangle / elevationDepression (missing side, angles, trig
+               ratios, area, perimeter), anglesOnLine / anglesAtPoint (the
+               missing angle), generalTriangle (angle sum and the angles)
+
+A check only fails when it has enough numbers to be sure; questions it can't
+check (no numbers, text answers, unsupported tools) pass. Failures are Issues
+with rule 'answer' (see question_validator.py), so the generator re-requests
+just those slots and `generate_questions.py verify` reports them.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from question_validator import Issue, display_text
+
+# Relative slack for answers computed from rounded intermediate values
+RELATIVE_TOLERANCE = 0.01
+
+_FRAC = re.compile(r'\\[dt]?frac\{(-?\d+(?:\.\d+)?)\}\{(-?\d+(?:\.\d+)?)\}')
+_SQRT = re.compile(r'(\d+(?:\.\d+)?)?\s*(?:\\sqrt\{(\d+(?:\.\d+)?)\}|√\s*\{?(\d+(?:\.\d+)?)\}?)')
+_THOUSANDS = re.compile(r'(?<=\d),(?=\d{3}(?!\d))')
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?')
+_DEGREES = re.compile(r'\s*(?:°|\^\s*\{?\\circ|degrees?\b)')
+_AROUND_OPERATORS = re.compile(r'\s*([-+*/=])\s*')
+# "a op b ... = c" with nothing binding tighter on either side (checked after spaces around operators are removed).
+# Skipped: anything after a power, bracket, variable or "|" (x^2+1=5, (a+b)*2=..., 2x+3=11, stem-and-leaf),
+# ratios (12 ÷ 3 : 15 ÷ 3 = 4 : 5), mixed numbers on either side (1 3/7), "= c + x", "= 5^2" and "= c remainder r"
+_EQUATION = re.compile(r'(?<![\w.^*/+\-)}|])(?<!\d:)(?<!\d : )(?<!\d )(-?\d+(?:\.\d+)?(?:[-+*/]\d+(?:\.\d+)?)+)'
+                       r'=(-?\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?)(%?)'
+                       r'(?![\w^(/*+\-]|\.\d)(?!:\d| : \d)(?!\s*(?:\d|r\d|r\b|rem|with a rem))', re.IGNORECASE)
+_TOKEN = re.compile(r'[-+*/]|\d+(?:\.\d+)?')
+_OPERATORS = [('^{\\circ}', '°'), ('^\\circ', '°'), ('\\times', '*'), ('\\cdot', '*'), ('×', '*'), ('·', '*'),
+              ('\\div', '/'), ('÷', '/'), ('−', '-'),
+              ('\\left', ''), ('\\right', ''), ('\\,', ''), ('\\;', ''), ('$', '')]
+
+
+def _normalize(text: str) -> str:
+    for old, new in _OPERATORS:
+        text = text.replace(old, new)
+    text = _FRAC.sub(r'(\1/\2)', text)
+    return _THOUSANDS.sub('', text)
+
+
+def _decimals(literal: str) -> int:
+    return len(literal.split('.')[1]) if '.' in literal else 0
+
+
+def _close(value: float, literal: str, expected: float) -> bool:
+    """value (written as literal) equals expected, allowing for the rounding the literal shows"""
+    tolerance = 0.5 * 10 ** -_decimals(literal) + 1e-9
+    return abs(value - expected) <= max(tolerance, RELATIVE_TOLERANCE * abs(expected))
+
+
+def extract_numbers(text: str) -> List[Tuple[float, str, bool]]:
+    """(value, literal, is an angle in degrees) for every number in a text: decimals, fractions (a/b, \\frac)
+    and surds (k√n)"""
+    text = _normalize(text)
+    numbers = []
+    for match in _SQRT.finditer(text):
+        coefficient = float(match.group(1)) if match.group(1) else 1.0
+        radicand = float(match.group(2) or match.group(3))
+        numbers.append((coefficient * math.sqrt(radicand), '0.01', False))
+    text = _SQRT.sub(' ', text)
+    for match in _NUMBER.finditer(text):
+        literal = match.group(0).replace(' ', '')
+        degrees = _DEGREES.match(text, match.end()) is not None
+        if '/' in literal:
+            numerator, denominator = literal.split('/')
+            if float(denominator) == 0:
+                continue
+            numbers.append((float(numerator) / float(denominator), '0.001', degrees))
+            numbers.append((float(numerator), numerator, degrees))  # "18/2" may also just be a ratio or a date
+        else:
+            numbers.append((float(literal), literal, degrees))
+    return numbers
+
+
+def _equations(text: str) -> List[Tuple[List[str], str, str]]:
+    """(expression tokens, c, percent) for every "a op b ... = c" in a text"""
+    compact = _AROUND_OPERATORS.sub(r'\1', _normalize(text))
+    # A leading minus is a negative first number: 0 - a ...
+    return [((['0'] if expression.startswith('-') else []) + _TOKEN.findall(expression), c, percent)
+            for expression, c, percent in _EQUATION.findall(compact)]
+
+
+def _evaluate(tokens: List[str]) -> Optional[float]:
+    """Value of number/operator tokens with × and ÷ before + and - (None on division by zero)"""
+    total, term, sign = 0.0, float(tokens[0]), 1.0
+    for operator, literal in zip(tokens[1::2], tokens[2::2]):
+        number = float(literal)
+        if operator in '+-':
+            total, term, sign = total + sign * term, number, 1.0 if operator == '+' else -1.0
+        elif operator == '*':
+            term *= number
+        elif number == 0:
+            return None
+        else:
+            term /= number
+    return total + sign * term
+
+
+def _value(literal: str) -> float:
+    if '/' in literal:
+        numerator, denominator = literal.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else math.nan
+    return float(literal)
+
+
+def check_arithmetic(text: str) -> Optional[str]:
+    """The first arithmetic equation in a text that doesn't hold, if any"""
+    for tokens, c, percent in _equations(text):
+        value, result = _evaluate(tokens), _value(c)
+        if value is None or math.isnan(result):
+            continue
+        if tokens[1:2] == ['+'] and len(tokens) == 3 and c == tokens[0] + tokens[2]:
+            continue  # Digits being joined, not added ("35 | 1" -> "35 + 1 = 351" in a stem-and-leaf)
+        if tokens[1:2] == ['/'] and len(tokens) == 3 and float(tokens[0]) < float(tokens[2]) and not percent \
+                and result >= 1 and result.is_integer():
+            continue  # "1/60 = 2" means 1/60 of the total is 2: a proper fraction is never a whole number
+        # "3/5 = 60%" converts to a percentage; "46 - 18 = 28%" works in percentage points
+        values = [value * 100, value] if percent else [value]
+        slack = 1e-9 if '/' in c else 0.5 * 10 ** -_decimals(c) + 1e-9
+        if all(abs(v - result) > slack + 0.001 * abs(v) for v in values):
+            return f"{' '.join(tokens)} = {c}{percent} (should be {values[0]:.4g}{percent})"
+    return None
+
+
+def _number(value: Any) -> Optional[float]:
+    """A numeric parameter ("15 cm" -> 15.0); None for labels, placeholders and "variable" """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?)\s*[a-zA-Z°²³]*\s*', value)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _right_triangle_values(opposite: Optional[float], adjacent: Optional[float], hypotenuse: Optional[float],
+                           angle: Optional[float]) -> Optional[List[float]]:
+    """Every quantity a right triangle's known parts determine (None if they don't determine it)"""
+    if angle is not None and not 0 < angle < 90:
+        angle = None
+    if hypotenuse is not None and ((opposite or 0) >= hypotenuse or (adjacent or 0) >= hypotenuse):
+        return None  # Not a consistent right triangle; nothing reliable to compare against
+    theta = math.radians(angle) if angle is not None else None
+    if opposite is None or adjacent is None or hypotenuse is None:
+        if theta is not None and opposite is not None:
+            adjacent, hypotenuse = opposite / math.tan(theta), opposite / math.sin(theta)
+        elif theta is not None and adjacent is not None:
+            opposite, hypotenuse = adjacent * math.tan(theta), adjacent / math.cos(theta)
+        elif theta is not None and hypotenuse is not None:
+            opposite, adjacent = hypotenuse * math.sin(theta), hypotenuse * math.cos(theta)
+        elif opposite is not None and adjacent is not None:
+            hypotenuse = math.hypot(opposite, adjacent)
+        elif opposite is not None and hypotenuse is not None:
+            adjacent = math.sqrt(hypotenuse ** 2 - opposite ** 2)
+        elif adjacent is not None and hypotenuse is not None:
+            opposite = math.sqrt(hypotenuse ** 2 - adjacent ** 2)
+        else:
+            return None
+    if angle is None:
+        angle = math.degrees(math.atan2(opposite, adjacent))
+    values = [opposite, adjacent, hypotenuse, angle, 90 - angle,
+              opposite / hypotenuse, adjacent / hypotenuse, opposite / adjacent, adjacent / opposite,
+              hypotenuse / opposite, hypotenuse / adjacent,
+              opposite * adjacent / 2, opposite + adjacent + hypotenuse, opposite ** 2 + adjacent ** 2]
+    return values
+
+
+# Tools whose implied values are angles: only answer numbers marked as degrees are compared
+ANGLE_TOOLS = ('anglesOnLine', 'anglesAtPoint', 'generalTriangle')
+
+
+def expected_values(math_tool: Any) -> Optional[List[float]]:
+    """Values the answer should contain one of, implied by the mathTool parameters (None: can't tell)"""
+    if not isinstance(math_tool, dict) or not isinstance(math_tool.get('parameters'), dict):
+        return None
+    name, parameters = math_tool.get('toolName'), math_tool['parameters']
+    if name == 'rightTriangle':
+        return _right_triangle_values(_number(parameters.get('opposite')), _number(parameters.get('adjacent')),
+                                      _number(parameters.get('hypotenuse')), _number(parameters.get('angle')))
+    if name == 'elevationDepression':
+        return _right_triangle_values(_number(parameters.get('height')), _number(parameters.get('distance')),
+                                      None, _number(parameters.get('angle')))
+    if name in ('anglesOnLine', 'anglesAtPoint'):
+        angles = parameters.get('angles')
+        if not isinstance(angles, list) or len(angles) < 2:
+            return None
+        known = [_number(angle) for angle in angles]
+        if sum(angle is None for angle in known) != 1:
+            return None  # Several unknowns (2x, 3x, ...): the answer isn't one number
+        total = 180.0 if name == 'anglesOnLine' else 360.0
+        missing = total - sum(angle for angle in known if angle is not None)
+        return [missing] if missing > 0 else None
+    if name == 'generalTriangle':
+        angles = [_number(parameters.get(key)) for key in ('angleA', 'angleB', 'angleC')]
+        if any(angle is None for angle in angles):
+            return None
+        return angles + [180 - angle for angle in angles]
+    return None
+
+
+def parameter_problem(math_tool: Any) -> Optional[str]:
+    """A contradiction inside the mathTool parameters themselves (e.g. triangle angles not summing to 180°)"""
+    if not isinstance(math_tool, dict) or not isinstance(math_tool.get('parameters'), dict):
+        return None
+    parameters = math_tool['parameters']
+    if math_tool.get('toolName') == 'generalTriangle':
+        angles = [_number(parameters.get(key)) for key in ('angleA', 'angleB', 'angleC')]
+        if all(angle is not None and angle > 0 for angle in angles) and abs(sum(angles) - 180) > 0.5:
+            return f"generalTriangle angles sum to {sum(angles):g}°, not 180°"
+    return None
+
+
+def _offset_values(steps: List[str], expected: List[float]) -> List[float]:
+    """Results of step equations that add to or subtract from an expected value ("71.51 + 1.6 = 73.11" for a
+    height above eye level), which the arithmetic check has already recomputed"""
+    values = []
+    for step in steps:
+        for tokens, c, percent in _equations(step):
+            if len(tokens) == 3 and tokens[1] in '+-' and '/' not in c and not percent \
+                    and any(_close(float(operand), operand, target) for operand in tokens[::2] for target in expected):
+                values.append(float(c))
+    return values
+
+
+def check_answer(question: Dict[str, Any]) -> Tuple[bool, List[Issue]]:
+    """(whether anything could be checked, answer issues) for one question"""
+    final_answer = question.get('finalAnswer')
+    if isinstance(final_answer, (int, float)) and not isinstance(final_answer, bool):
+        final_answer = str(final_answer)
+    final_answer = display_text(final_answer) or ''
+    steps = [display_text(step) or '' for step in question.get('stepByStepGuideline') or []]
+
+    for text in steps + [final_answer]:
+        problem = check_arithmetic(text)
+        if problem:
+            return True, [Issue('answer', f"arithmetic slip: {problem}")]
+    checked = any(_equations(text) for text in steps + [final_answer])
+
+    math_tool = question.get('mathTool')
+    problem = parameter_problem(math_tool)
+    if problem:
+        return True, [Issue('answer', problem)]
+
+    expected = expected_values(math_tool)
+    numbers = extract_numbers(final_answer)
+    if expected and math_tool.get('toolName') in ANGLE_TOOLS:
+        # Only angles count, and "angles on a line sum to 180°" states a rule rather than an answer
+        numbers = [n for n in numbers if n[2] and n[0] not in (180.0, 360.0)]
+    if not expected or not numbers:
+        return checked, []
+    # The steps usually restate the expected value, so only finalAnswer itself can show the answer is right
+    targets = expected + _offset_values(steps, expected)
+    if any(_close(value, literal, target) for value, literal, _ in numbers for target in targets):
+        return True, []
+    given = ', '.join(f"{value:.4g}" for value in expected[:3])
+    return True, [Issue('answer', f"finalAnswer {final_answer[:40]!r} doesn't match the mathTool parameters "
+                                  f"(expected one of {given}...)")]
+
+
+def verify_question(question: Dict[str, Any]) -> List[Issue]:
+    """Answer issues for one question (empty list: verified or not checkable)"""
+    return check_answer(question)[1]
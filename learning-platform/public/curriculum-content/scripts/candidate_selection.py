@@ -0,0 +1,96 @@
+"""
+Best-of-K Question Selection for the Question Generator
+
+With --candidates K, a node's batch is requested K times in parallel and the
+questions of all K candidate batches are pooled. Selection is local:
+
+1. Drop questions that fail validation (question_validator.py)
+2. Drop near-duplicates of the persistent bank (dedup_index.py) and exact
+   repeats within the pool
+3. Pick `count` questions greedily, each time taking the one least similar to
+   everything already chosen and to the topic's earlier questions (farthest-
+   point selection over MinHash similarities, computed as one matrix)
+
+The node's avatarIntro is taken from the first candidate batch that has a
+valid one and moved onto the first selected question.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from dedup_index import DEFAULT_THRESHOLD, DedupIndex, minhash_signature, similarity_matrix
+from question_validator import QuestionValidator
+
+
+@dataclass
+class SelectionStats:
+    """What selection did with one node's candidate pool"""
+    batches: int = 0
+    pooled: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    selected: int = 0
+    max_similarity: float = 0.0  # Highest similarity of a selected question to the others or the topic
+
+    def describe(self) -> str:
+        return (f"picked {self.selected} of {self.pooled} questions from {self.batches} candidate batches "
+                f"({self.invalid} invalid, {self.duplicates} duplicates dropped; "
+                f"max similarity {self.max_similarity:.0%})")
+
+
+def select_questions(batches: List[List[Dict[str, Any]]], count: int, validator: Optional[QuestionValidator] = None,
+                     index: Optional[DedupIndex] = None, threshold: float = DEFAULT_THRESHOLD,
+                     topic_texts: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], SelectionStats]:
+    """Choose the `count` most diverse valid questions from several candidate batches"""
+    stats = SelectionStats(batches=len(batches))
+    intros = [batch[0].get('avatarIntro') for batch in batches if batch and batch[0].get('avatarIntro')]
+
+    pool: List[Dict[str, Any]] = []
+    signatures = []
+    seen_texts = set()
+    for batch in batches:
+        for question in batch:
+            stats.pooled += 1
+            question.pop('avatarIntro', None)
+            # Position 1: no question in the pool should carry an avatarIntro any more
+            if validator and validator.validate(question, 1):
+                stats.invalid += 1
+                continue
+            text = question.get('problemText', '')
+            signature = minhash_signature(text)
+            if text in seen_texts or (index is not None and index.find_similar(text, threshold, signature)):
+                stats.duplicates += 1
+                continue
+            seen_texts.add(text)
+            pool.append(question)
+            signatures.append(signature)
+
+    if not pool:
+        return [], stats
+
+    # One matrix for question-vs-question and one for question-vs-topic similarities
+    pair_similarity = similarity_matrix(signatures, signatures)
+    topic_signatures = [minhash_signature(text) for text in (topic_texts or [])]
+    topic_similarity = similarity_matrix(signatures, topic_signatures)
+    closest = [max(row, default=0.0) for row in topic_similarity]
+
+    selected: List[int] = []
+    remaining = list(range(len(pool)))
+    while remaining and len(selected) < count:
+        # Least similar to anything already in the topic or the selection (ties: earliest candidate)
+        best = min(remaining, key=lambda i: (closest[i], i))
+        selected.append(best)
+        remaining.remove(best)
+        stats.max_similarity = max(stats.max_similarity, closest[best])
+        for i in remaining:
+            closest[i] = max(closest[i], pair_similarity[i][best])
+
+    # Keep the candidates' original order so the node reads like one batch
+    questions = [pool[i] for i in sorted(selected)]
+    stats.selected = len(questions)
+    for intro in intros:
+        first = {'problemText': questions[0].get('problemText'), 'avatarIntro': intro, **questions[0]}
+        if not validator or not validator.validate(first, 0):
+            questions[0] = first
+            break
+    return questions, stats
@@ -0,0 +1,236 @@
+"""
+Near-Duplicate Question Index for the Question Generator
+
+Keeps a MinHash signature of every generated problemText (across topics and
+runs) and answers "is this question a near-copy of one we already have?" via
+locality-sensitive hashing, so lookups stay sub-linear as the bank grows.
+
+Entries belong to a node, keyed by (topic, node id) where topic is the output
+YAML's file name. Writing a node replaces its entries, and each run first
+re-syncs a topic's entries with the nodes on disk, so regenerated, replaced or
+deleted questions never count as duplicates of their successors.
+
+Texts are normalized before shingling: lower-cased, LaTeX commands and
+punctuation stripped, and every number replaced by '#', so the same scenario
+with new numbers still counts as a repeat. Similarity is the Jaccard index of
+word 3-shingles, estimated from 64 MinHash values; LSH uses 16 bands of 4 rows
+(candidates from roughly 0.5 similarity up, then checked against the threshold).
+
+NumPy is used to compute signatures when it is installed; the pure-Python path
+produces identical signatures, just more slowly.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from node_journal import write_file_atomic
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 31) - 1
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'homecampus-question-generator', 'dedup-index.json')
+INDEX_VERSION = 2  # 2: entries keyed by (topic, node)
+
+# Fixed seed: signatures must be comparable across runs
+_rng = random.Random(20240601)
+_PERM_A = [_rng.randrange(1, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)]
+_PERM_B = [_rng.randrange(0, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)]
+if np is not None:
+    _NP_PERM_A = np.array(_PERM_A, dtype=np.uint64)[:, None]
+    _NP_PERM_B = np.array(_PERM_B, dtype=np.uint64)[:, None]
+
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+_NON_WORD = re.compile(r'[^a-z#]+')
+
+
+def normalize_text(text: str) -> List[str]:
+    """Lower-case word tokens with LaTeX commands dropped and numbers replaced by '#'"""
+    text = _LATEX_COMMAND.sub(' ', text.lower())
+    text = _NUMBER.sub(' # ', text)
+    return [token for token in _NON_WORD.split(text) if token]
+
+
+def shingle_hashes(text: str) -> List[int]:
+    """31-bit hashes of the word shingles in a text"""
+    tokens = normalize_text(text)
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {' '.join(tokens)}
+    else:
+        shingles = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    return [zlib.crc32(s.encode('utf-8')) & MERSENNE_PRIME for s in shingles]
+
+
+def minhash_signature(text: str) -> Tuple[int, ...]:
+    """MinHash signature of a text (NUM_PERMUTATIONS values)"""
+    hashes = shingle_hashes(text)
+    if np is not None:
+        values = np.array(hashes, dtype=np.uint64)[None, :]
+        return tuple(int(v) for v in ((_NP_PERM_A * values + _NP_PERM_B) % MERSENNE_PRIME).min(axis=1))
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in zip(_PERM_A, _PERM_B))
+
+
+def estimated_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity between two signatures"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERMUTATIONS
+
+
+def similarity_matrix(rows: List[Tuple[int, ...]], columns: List[Tuple[int, ...]]) -> List[List[float]]:
+    """Estimated similarity of every row signature to every column signature (vectorized with NumPy)"""
+    if not rows or not columns:
+        return [[] for _ in rows]
+    if np is not None:
+        a = np.array(rows, dtype=np.uint64)[:, None, :]
+        b = np.array(columns, dtype=np.uint64)[None, :, :]
+        return (a == b).mean(axis=2).tolist()
+    return [[estimated_similarity(row, column) for column in columns] for row in rows]
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]) for band in range(BANDS)]
+
+
+NodeKey = Tuple[str, str]  # (topic, node id)
+
+
+class DedupIndex:
+    """Persistent MinHash/LSH index over every generated question text"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: List[Optional[Dict]] = []  # {'topic', 'node', 'text', 'sig'}; None once removed
+        self._nodes: Dict[NodeKey, List[int]] = {}  # Entry ids per node
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.flagged = 0
+        self.replaced = 0
+
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                for entry in data.get('entries', []):
+                    self._insert((entry['topic'], entry['node']), entry['text'], tuple(entry['sig']))
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._nodes.values())
+
+    def _insert(self, node: NodeKey, text: str, signature: Tuple[int, ...]):
+        entry_id = len(self.entries)
+        self.entries.append({'topic': node[0], 'node': node[1], 'text': text, 'sig': signature})
+        self._nodes.setdefault(node, []).append(entry_id)
+        for band_key in _band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(entry_id)
+
+    def _remove(self, node: NodeKey):
+        for entry_id in self._nodes.pop(node, []):
+            self.entries[entry_id] = None  # Bucket lists skip removed ids; save() compacts them away
+
+    def node_texts(self, node: NodeKey) -> List[str]:
+        with self._lock:
+            return [self.entries[i]['text'] for i in self._nodes.get(node, [])]
+
+    def replace_node(self, topic: str, node_id: str, texts: List[str]):
+        """Make a node's entries exactly these question texts (the node was just written)"""
+        node = (topic, node_id)
+        texts = list(dict.fromkeys(text for text in texts if text))
+        if self.node_texts(node) == texts:
+            return
+        signatures = [minhash_signature(text) for text in texts]
+        with self._lock:
+            self._remove(node)
+            for text, signature in zip(texts, signatures):
+                self._insert(node, text, signature)
+            self._dirty = True
+
+    def sync_topic(self, topic: str, node_texts: Dict[str, List[str]]) -> int:
+        """Match a topic's entries to its nodes on disk: nodes no longer there are dropped, the rest replaced.
+        Returns the number of entries added"""
+        with self._lock:
+            gone = [node for node in self._nodes if node[0] == topic and node[1] not in node_texts]
+            for node in gone:
+                self._remove(node)
+            self._dirty = self._dirty or bool(gone)
+        before = len(self)
+        for node_id, texts in node_texts.items():
+            self.replace_node(topic, node_id, texts)
+        return max(0, len(self) - before)
+
+    def find_similar(self, text: str, threshold: float = DEFAULT_THRESHOLD,
+                     signature: Optional[Tuple[int, ...]] = None) -> List[Tuple[float, Dict]]:
+        """Indexed entries whose estimated similarity to text is >= threshold, most similar first"""
+        signature = signature or minhash_signature(text)
+        with self._lock:
+            candidate_ids = set()
+            for band_key in _band_keys(signature):
+                candidate_ids.update(self._buckets.get(band_key, ()))
+            candidates = [self.entries[i] for i in candidate_ids if self.entries[i] is not None]
+
+        matches = []
+        for entry in candidates:
+            similarity = estimated_similarity(signature, entry['sig'])
+            if similarity >= threshold:
+                matches.append((similarity, entry))
+        matches.sort(key=lambda match: -match[0])
+        return matches
+
+    def record(self, flagged: int, replaced: int):
+        """Count near-duplicates found in a node and how many of them were regenerated"""
+        with self._lock:
+            self.flagged += flagged
+            self.replaced += replaced
+
+    def summary(self) -> str:
+        return f"{len(self):,} questions indexed, {self.flagged} near-duplicates flagged, {self.replaced} regenerated"
+
+    def save(self):
+        """Persist the index (atomically) if anything changed"""
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock:
+            data = {
+                'version': INDEX_VERSION,
+                'entries': [{'topic': e['topic'], 'node': e['node'], 'text': e['text'], 'sig': list(e['sig'])}
+                            for e in self.entries if e is not None],
+            }
+            self._dirty = False
+        write_file_atomic(self.path, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+
+
+def find_batch_duplicates(texts: List[str], index: Optional[DedupIndex], threshold: float = DEFAULT_THRESHOLD
+                          ) -> Dict[int, Tuple[float, str]]:
+    """Slots in a batch that near-duplicate the index or an earlier slot of the same batch.
+
+    Returns {slot: (similarity, matched text)}.
+    """
+    duplicates = {}
+    signatures = [minhash_signature(text) for text in texts]
+    for slot, (text, signature) in enumerate(zip(texts, signatures)):
+        if index is not None:
+            matches = index.find_similar(text, threshold, signature)
+            if matches:
+                duplicates[slot] = (matches[0][0], matches[0][1]['text'])
+                continue
+        for earlier in range(slot):
+            if earlier in duplicates:
+                continue
+            similarity = estimated_similarity(signature, signatures[earlier])
+            if similarity >= threshold:
+                duplicates[slot] = (similarity, texts[earlier])
+                break
+    return duplicates
@@ -3,13 +3,50 @@
 Question Bank Generator using Exemplar Templates
 
 This script reads exemplar templates and uses AI (Claude or Gemini) to generate
-practice questions for each node, outputting a complete YAML file.
+practice questions for each node, outputting a complete YAML file. Offline
+mock/replay providers are available for benchmarking (see providers.py).
 
 Features:
-- Auto-save progress after each node (crash resilient)
-- Automatic retry with exponential backoff for failed questions
+- Crash-safe progress: each finished node is fsync'd to an append-only journal,
+  and the YAML is written once (atomically) at the end of the run
+- Error-aware retries: rate limits wait for Retry-After, transient errors back off with
+  jitter, parse errors retry at once, fatal errors stop; partial batches are kept and
+  retries only request the missing questions
+- Shared requests/min and tokens/min limits across all workers (--rpm, --tpm)
 - Resume capability (skips already-generated nodes)
+- Incremental regeneration (--incremental): each node records a hash of its exemplar
+  entry and generation settings, and only nodes whose inputs changed are regenerated
+  and spliced into the YAML (every other node stays byte-identical)
 - Works with any topic (generic file paths)
+- Concurrent node generation with a bounded worker pool (--concurrency)
+- On-disk response cache: identical prompts are never paid for twice (--no-cache to bypass)
+- Run telemetry: stage timings (p50/p95), tokens, retries and cache hits, written as a
+  JSON or CSV run report with --report
+- Batch mode: every topic in a directory/glob through one provider client and work queue
+- Bulk mode (--mode bulk): all pending nodes go to the provider's asynchronous batch API
+  as one job, for cheaper offline regeneration
+- Streaming (--stream): questions are parsed and checked as they arrive, and a bad
+  response is abandoned early instead of after the full completion
+- Question validation: every question is checked against the output contract and the
+  exemplar's mathTool spec; failing slots are re-requested with the reasons (--validation),
+  and `generate_questions.py validate` checks existing YAML files
+- Best-of-K candidates (--candidates K): K batches per node are requested in parallel
+  and the most diverse valid, non-duplicate questions are picked locally
+- Near-duplicate detection: a persistent MinHash index over every generated question
+  (across topics and runs); duplicate slots are regenerated individually (--dedup)
+- Compiled artifacts: `generate_questions.py compile` (or --compile) writes a minified
+  JSON bank per topic (one line per node), plus a bank-manifest.json with content
+  hashes; no app loader reads them yet
+- Planning (--plan): every pending prompt is built and the run's prompt/output tokens,
+  cost and wall-clock time at the given concurrency are forecast, with no API calls
+  (provider SDKs are only imported on the first real call)
+- Answer verification: arithmetic in the steps and answers pinned down by the mathTool
+  parameters are recomputed locally; wrong answers are re-requested like any invalid
+  question (--answer-check), and `generate_questions.py verify` checks whole grades in
+  a process pool
+- Prompt caching: prompts are a stable system + exemplar prefix and a per-call suffix,
+  sent with provider cache breakpoints (Claude) or a context cache (Gemini); cached
+  prompt tokens are reported per node and in the run report
 
 Usage:
     # Generate all nodes for trigonometry
@@ -35,15 +72,46 @@ Usage:
         ../S3/Maths/s3-math-trigonometry-exemplars.json \
         ../S3/Maths/s3-math-trigonometry.yaml \
         --nodes all
+
+    # Generate 4 nodes at a time
+    python generate_questions.py \
+        ../S3/Maths/s3-math-trigonometry-exemplars.json \
+        ../S3/Maths/s3-math-trigonometry.yaml \
+        --nodes all --concurrency 4
+
+    # Offline run against the mock provider (no API keys needed)
+    python generate_questions.py \
+        ../S2/Maths/s2-math-pythagoras-exemplars.json /tmp/pythagoras-mock.yaml \
+        --provider mock --mock-latency 0.5 --mock-failure-rate 0.2
+
+    # Batch: every S2 and S3 topic in one process, max 50 requests/min
+    python generate_questions.py batch ../S2/Maths ../S3/Maths --concurrency 6 --rpm 50
+
+    # Forecast tokens, cost and run time of that batch without calling the provider
+    python generate_questions.py batch ../S2/Maths ../S3/Maths --concurrency 6 --rpm 50 --plan
+
+    # Full regeneration through the provider's batch API
+    python generate_questions.py batch ../S2/Maths ../S3/Maths --mode bulk --provider claude
+
+    # Compiled question-bank artifacts for every topic
+    python generate_questions.py compile
+
+    # Recompute the answers of every S3 question
+    python generate_questions.py verify ../S3/Maths
 """
 
+import glob
+import hashlib
 import json
-import yaml
 import os
 import sys
 import time
 import argparse
-from typing import Dict, List, Any, Optional
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
 
 # Load environment variables from .env file
 try:
@@ -53,52 +121,153 @@ except ImportError:
     print("⚠️  python-dotenv not installed. Install with: pip install python-dotenv")
     print("⚠️  Falling back to system environment variables only")
 
-# API Configuration - Support both providers
-CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY") or os.environ.get("VITE_CLAUDE_API_KEY")
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("VITE_GEMINI_API_KEY")
-
-# Global variables for clients (initialized based on provider choice)
-anthropic_client = None
-genai = None
-
-
-def initialize_ai_provider(provider: str):
-    """Initialize the selected AI provider"""
-    global anthropic_client, genai
-
-    if provider == "claude":
-        if not CLAUDE_API_KEY:
-            print("ERROR: CLAUDE_API_KEY or VITE_CLAUDE_API_KEY environment variable not set")
-            print("Set it with: export CLAUDE_API_KEY='your-key-here'")
-            sys.exit(1)
-
-        try:
-            import anthropic
-            anthropic_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
-            print(f"✓ Initialized Claude Sonnet 4.5 provider")
-        except ImportError:
-            print("ERROR: anthropic package not installed. Install with: pip install anthropic")
-            sys.exit(1)
-
-    elif provider == "gemini":
-        if not GEMINI_API_KEY:
-            print("ERROR: GEMINI_API_KEY or VITE_GEMINI_API_KEY environment variable not set")
-            print("Set it with: export GEMINI_API_KEY='your-key-here'")
-            sys.exit(1)
-
-        try:
-            import google.generativeai as genai_module
-            genai = genai_module
-            genai.configure(api_key=GEMINI_API_KEY)
-            print(f"✓ Initialized Gemini Flash 3 Preview provider")
-        except ImportError:
-            print("ERROR: google-generativeai package not installed. Install with: pip install google-generativeai")
-            sys.exit(1)
+from answer_verifier import check_answer, verify_question
+from candidate_selection import select_questions
+from dedup_index import DEFAULT_INDEX_PATH, DEFAULT_THRESHOLD, DedupIndex, find_batch_duplicates
+from json_stream import JsonArrayStream, StreamFormatError
+from node_journal import append_journal_entry, journal_path_for, remove_journal, replay_journal, write_file_atomic
+from prompt_builder import DEFAULT_PROMPT_TOKEN_BUDGET, PromptBuilder, estimate_tokens
+from question_bank_compiler import ARTIFACT_SUFFIX, compile_topic, update_manifest
+from providers import AIProvider, PROVIDERS, ProviderError, ProviderResponse, ProviderStream, create_provider
+from question_validator import EXEMPLAR_SUFFIX, QuestionValidator, validate_yaml_file
+from rate_limit import (FATAL, PARSE, RateLimitedProvider, RateLimiter, backoff_delay, classify_error,
+                        retry_after_seconds, take_throttled_seconds)
+from response_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, ResponseCache, cache_key
+from run_plan import RunPlan
+from telemetry import recorder as telemetry
+from yaml_store import dump_yaml, load_progress_index, load_yaml_file, splice_nodes, summarize_nodes, write_progress_index
+
+# Sampling settings for every generation call (part of the response cache key)
+TEMPERATURE = 0.8  # Higher for diversity
+MAX_OUTPUT_TOKENS = 8000  # Increased for batch
+
+# Seconds between batch job status checks in --mode bulk
+DEFAULT_BULK_POLL_INTERVAL = 30.0
+
+
+@dataclass
+class GenerationOptions:
+    """Per-run settings shared by every node (built once from the CLI arguments)"""
+    count: int = 5
+    max_retries: int = 3
+    prompt_token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET
+    cache: Optional[ResponseCache] = None
+    dedup_index: Optional[DedupIndex] = None
+    dedup_threshold: float = DEFAULT_THRESHOLD
+    dedup_mode: str = 'reject'  # 'reject' regenerates duplicate slots, 'flag' only reports them
+    stream: bool = False
+    rate_limiter: Optional[RateLimiter] = None
+    mode: str = 'interactive'  # 'bulk' submits every pending node through the provider's batch API
+    bulk_poll_interval: float = DEFAULT_BULK_POLL_INTERVAL
+    report_path: Optional[str] = None  # --report: where to write the run report
+    validation: str = 'reject'  # 'reject' re-requests invalid questions, 'flag' only reports them
+    candidates: int = 1  # Candidate batches requested per call (best questions are picked across them)
+    answer_check: bool = True  # Recompute answers (answer_verifier.py) as part of validation
+
+
+@dataclass
+class NodeStats:
+    """Provider calls and token usage for one node (cached responses cost nothing)"""
+    calls: int = 0
+    cached_calls: int = 0
+    questions_requested: int = 0
+    questions_received: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0  # Part of input_tokens read from the provider's prompt cache
+    output_tokens: int = 0
+    salvaged: int = 0  # Questions kept from partial batches instead of being re-requested
+    aborted_streams: int = 0
+    provider_seconds: float = 0.0
+    first_question_seconds: Optional[float] = None  # Streaming: first valid question of the node's first call
+    errors: Dict[str, int] = field(default_factory=dict)  # Error class -> count
+    last_error: Optional[str] = None
+    last_retry_after: Optional[float] = None
+    attempts: int = 0
+    backoff_seconds: float = 0.0
+    duplicates_replaced: int = 0
+    invalid: int = 0  # Questions that failed validation
+    # Candidate batches (--candidates) record from several threads at once
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, response: ProviderResponse, cached: bool, requested: int, received: int, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.provider_seconds += seconds
+            self.questions_requested += requested
+            self.questions_received += received
+            if cached:
+                self.cached_calls += 1
+            else:
+                self.input_tokens += response.input_tokens
+                self.cached_input_tokens += response.cached_input_tokens
+                self.output_tokens += response.output_tokens
+        if not cached:
+            telemetry.count('inputTokens', response.input_tokens)
+            telemetry.count('cachedInputTokens', response.cached_input_tokens)
+            telemetry.count('outputTokens', response.output_tokens)
+
+    def record_error(self, error_class: str, retry_after: Optional[float] = None):
+        with self._lock:
+            self.errors[error_class] = self.errors.get(error_class, 0) + 1
+            self.last_error = error_class
+            self.last_retry_after = retry_after
+        telemetry.count(f"errors.{error_class}")
+
+    def report_row(self, topic: str, node_id: str, questions: int, seconds: float) -> Dict[str, Any]:
+        """This node's row in the telemetry run report"""
+        return {
+            'topic': topic,
+            'nodeId': node_id,
+            'questions': questions,
+            'seconds': round(seconds, 4),
+            'calls': self.calls,
+            'retries': max(0, self.attempts - 1),
+            'cachedCalls': self.cached_calls,
+            'inputTokens': self.input_tokens,
+            'cachedInputTokens': self.cached_input_tokens,
+            'outputTokens': self.output_tokens,
+            'providerSeconds': round(self.provider_seconds, 4),
+            'backoffSeconds': round(self.backoff_seconds, 4),
+            'firstQuestionSeconds': round(self.first_question_seconds, 4) if self.first_question_seconds is not None else None,
+            'salvaged': self.salvaged,
+            'duplicatesReplaced': self.duplicates_replaced,
+            'invalid': self.invalid,
+            'errors': dict(self.errors),
+        }
 
-    else:
-        print(f"ERROR: Unknown provider '{provider}'. Use 'claude' or 'gemini'")
+    def describe(self) -> str:
+        line = (f"{self.calls} call(s), {self.questions_requested} questions requested, "
+                f"{self.input_tokens:,} in / {self.output_tokens:,} out tokens")
+        if self.cached_input_tokens:
+            line += f" ({self.cached_input_tokens:,} in from the prompt cache)"
+        if self.cached_calls:
+            line += f", {self.cached_calls} cached"
+        if self.aborted_streams:
+            line += f", {self.aborted_streams} stream(s) aborted early"
+        if self.first_question_seconds is not None:
+            line += f", first valid question after {self.first_question_seconds:.2f}s"
+        line += f", {self.provider_seconds:.2f}s total latency"
+        if self.errors:
+            line += ", errors: " + ', '.join(f"{count} {error_class}" for error_class, count in sorted(self.errors.items()))
+        if self.invalid:
+            line += f", {self.invalid} failed validation"
+        if self.salvaged:
+            tokens_per_question = self.output_tokens / self.questions_received if self.questions_received else 0
+            line += f", {self.salvaged} kept instead of re-requested (~{int(self.salvaged * tokens_per_question):,} output tokens saved)"
+        return line
+
+
+def initialize_ai_provider(provider: str, **options) -> AIProvider:
+    """Initialize the selected AI provider (see providers.PROVIDERS for the registry)"""
+    try:
+        ai_provider = create_provider(provider, **options)
+    except ProviderError as e:
+        print(f"ERROR: {e}")
         sys.exit(1)
 
+    print(f"✓ Initialized {ai_provider.display_name} provider")
+    return ai_provider
+
 
 def load_exemplars(file_path: str) -> Dict[str, Any]:
     """Load exemplar templates from JSON file"""
@@ -106,230 +275,481 @@ def load_exemplars(file_path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
-def create_batch_generation_prompt(exemplar: Dict[str, Any], count: int, node_number: int, previous_questions: List[str] = None) -> str:
+def create_batch_generation_prompt(exemplar: Dict[str, Any], count: int, node_number: int, previous_questions: List[str] = None,
+                                   token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET) -> str:
     """Create prompt for AI to generate ALL questions at once with diversity enforcement"""
+    return PromptBuilder(exemplar, token_budget).build(count, previous_questions)
+
+
+def expected_tool_name(exemplar: Dict[str, Any]) -> Optional[str]:
+    """toolName every generated question must use (None when the exemplar doesn't pin one)"""
+    math_tool = exemplar.get('mathTool')
+    if isinstance(math_tool, dict) and isinstance(math_tool.get('toolName'), str):
+        return math_tool['toolName']
+    return None
+
+
+def check_streamed_question(question: Any, tool_name: Optional[str]) -> Optional[str]:
+    """Why a streamed question is unusable, or None if it passes the early checks"""
+    if not isinstance(question, dict):
+        return f"expected an object, got {type(question).__name__}"
+    if not isinstance(question.get('problemText'), str) or not question['problemText'].strip():
+        return "missing problemText"
+    if tool_name:
+        math_tool = question.get('mathTool')
+        actual = math_tool.get('toolName') if isinstance(math_tool, dict) else None
+        if actual != tool_name:
+            return f"mathTool.toolName is {actual!r}, expected {tool_name!r}"
+    return None
+
+
+@contextmanager
+def provider_call_timer(stage: str) -> Iterator[None]:
+    """Time a provider call as one sample of stage, minus any wait for the rate limiter (its own 'throttle' stage)"""
+    take_throttled_seconds()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        throttled = take_throttled_seconds()
+        if throttled:
+            telemetry.add_sample('throttle', throttled)
+        telemetry.add_sample(stage, time.perf_counter() - start - throttled)
+
+
+def receive_streamed_batch(provider: AIProvider, prompt: str, count: int, tool_name: Optional[str],
+                           stats: Optional[NodeStats] = None) -> Tuple[List[Dict[str, Any]], ProviderStream, Optional[str]]:
+    """Stream a completion, checking each question as it closes.
+
+    Returns (valid questions received, the stream, reason it was aborted or None).
+    """
+    parser = JsonArrayStream()
+    questions: List[Dict[str, Any]] = []
+    error = None
+    start = time.perf_counter()
+    stream = provider.stream(prompt, temperature=TEMPERATURE, max_tokens=MAX_OUTPUT_TOKENS)
+    try:
+        for chunk in stream:
+            for question in parser.feed(chunk):
+                error = check_streamed_question(question, tool_name)
+                if error:
+                    error = f"question {len(questions) + 1}: {error}"
+                    break
+                questions.append(question)
+                if len(questions) == 1 and stats and stats.first_question_seconds is None:
+                    stats.first_question_seconds = time.perf_counter() - start
+            # Stop reading at the first bad question, or if the model runs past the requested count;
+            # otherwise drain the stream so usage is reported and the response can be cached
+            if error or len(questions) > count:
+                break
+        else:
+            parser.finish()
+    except StreamFormatError as e:
+        error = str(e)
+    finally:
+        stream.close()
 
-    prompt = f"""You are generating {count} diverse practice problems for Secondary 3 students.
+    if error and stats:
+        stats.aborted_streams += 1
+    return questions[:count], stream, error
 
-# NODE INFORMATION
-**Title**: {exemplar['title']}
-**Learning Focus**: {', '.join(exemplar['learningFocus'])}
-**Section**: {exemplar['section']}
 
-# EXEMPLAR PROBLEMS (USE AS TEMPLATES, DO NOT COPY)
-"""
+class ResponseFormatError(ValueError):
+    """A completion parsed as JSON but isn't a question array"""
 
-    for ex in exemplar['exemplarProblems']:
-        prompt += f"\nProblem: {ex['problemText']}\n"
-        if 'correctAnswer' in ex:
-            prompt += f"Answer: {json.dumps(ex['correctAnswer'], indent=2)}\n"
 
-    prompt += f"""
-# VARIATION RULES
-Apply these rules when generating variations:
+def parse_questions_response(response_text: str) -> List[Dict[str, Any]]:
+    """Parse a batch completion into question dicts (raises JSONDecodeError / ResponseFormatError)"""
+    # Remove markdown code blocks if present
+    if response_text.startswith("```"):
+        lines = response_text.split("\n")
+        response_text = "\n".join(lines[1:-1])
 
-**Available Options**:
-{json.dumps(exemplar.get('variationRules', {}), indent=2)}
+    # Parse JSON array
+    questions_array = json.loads(response_text)
 
-# MATHTOOL SPECIFICATION
-{json.dumps(exemplar.get('mathTool'), indent=2)}
+    # Validate it's an array
+    if not isinstance(questions_array, list):
+        raise ResponseFormatError(f"Expected array, got {type(questions_array)}")
+    return questions_array
 
-# GENERATION GUIDELINES
-{chr(10).join('- ' + g for g in exemplar.get('generationGuidelines', []))}
 
-# CRITICAL DIVERSITY REQUIREMENTS (FOR BATCH OF {count} QUESTIONS)
+def cache_response(cache: ResponseCache, key: str, provider: AIProvider, response: ProviderResponse):
+    """Store a parsed-OK response under its prompt's cache key"""
+    cache.put(key, {
+        'provider': provider.name,
+        'model': provider.model,
+        'text': response.text,
+        'inputTokens': response.input_tokens,
+        'outputTokens': response.output_tokens,
+    })
 
-**YOU MUST GENERATE {count} QUESTIONS THAT ARE SUBSTANTIALLY DIFFERENT:**
-"""
 
-    # Add anti-repetition section if previous questions exist
-    if previous_questions and len(previous_questions) > 0:
-        # Show last 20 questions (or all if less than 20) to avoid huge prompts
-        recent_questions = previous_questions[-20:] if len(previous_questions) > 20 else previous_questions
+def cached_response(cache: Optional[ResponseCache], key: Optional[str]) -> Optional[ProviderResponse]:
+    """The cached response for a key, if any"""
+    cached = cache.get(key) if cache and key else None
+    if not cached:
+        return None
+    return ProviderResponse(text=cached['text'], input_tokens=cached.get('inputTokens', 0),
+                            output_tokens=cached.get('outputTokens', 0))
 
-        prompt += f"""
 
-# ANTI-REPETITION: PREVIOUSLY GENERATED QUESTIONS
+def generate_questions_batch(exemplar: Dict[str, Any], count: int, node_number: int, provider: AIProvider, previous_questions: List[str] = None,
+                             cache: Optional[ResponseCache] = None, attempt: int = 1,
+                             prompt_builder: Optional[PromptBuilder] = None,
+                             exclusions: Optional[List[str]] = None,
+                             stats: Optional[NodeStats] = None, streaming: bool = False,
+                             corrections: Optional[List[str]] = None,
+                             candidate: int = 0, log: Callable[..., None] = print) -> Optional[List[Dict[str, Any]]]:
+    """Generate ALL questions for a node in a single batch (with diversity enforcement)
 
-**CRITICAL**: The following {len(recent_questions)} questions have ALREADY been generated in previous nodes of this topic.
+    candidate numbers parallel samples of the same prompt, so each gets its own cache entry.
+    Progress goes to log (print, or a worker's OutputBuffer).
+    """
 
-"""
-        for i, prev_q in enumerate(recent_questions, 1):
-            # Truncate very long questions to keep prompt manageable
-            truncated_q = prev_q[:200] + "..." if len(prev_q) > 200 else prev_q
-            prompt += f"{i}. {truncated_q}\n\n"
-
-        prompt += f"""
-**YOU MUST NOT repeat contexts/scenarios from above questions:**
-- Review the {len(recent_questions)} questions above carefully
-- Identify which contexts/scenarios were used
-- Try to use DIFFERENT contexts for this batch
-- Rotate through ALL available variation options in the exemplar
+    if prompt_builder is None:
+        prompt_builder = PromptBuilder(exemplar)
+    with telemetry.timer('prompt_build'):
+        prompt = prompt_builder.build(count, previous_questions, exclusions, corrections)
 
-"""
-
-    prompt += """
-# REQUIRED OUTPUT FORMAT
-
-Return a JSON array with exactly {count} questions:
-
-[
-  {{
-    "problemText": "Question 1 with unique context A...",
-    "avatarIntro": "Encouraging 1-2 sentence intro (ONLY for question 1). This is for TTS service. CRITICAL: It can have only plain text",
-    "mathTool": {{
-      "toolName": "exact tool name from MATHTOOL SPECIFICATION above",
-      "parameters": {{ ... exact parameters for this specific problem }}
-    }},
-    "finalAnswer": "The correct answer",
-    "stepByStepGuideline": [
-      "Step 1: Clear explanation...",
-      "Step 2: Next step...",
-      "Step 3: Continue..."
-    ]
-  }},
-  {{
-    "problemText": "Question 2 with DIFFERENT context B...",
-    "mathTool": {{ ... }},
-    "finalAnswer": "...",
-    "stepByStepGuideline": ["...", "...", "..."]
-  }},
-  {{
-    "problemText": "Question 3 with DIFFERENT context C...",
-    "mathTool": {{ ... }},
-    "finalAnswer": "...",
-    "stepByStepGuideline": ["...", "...", "..."]
-  }}
-  ... continue for all {count} questions
-]
-
-**CRITICAL RULES**:
-- Return ONLY valid JSON array (no markdown, no code blocks, no extra text)
-- Each question must be mathematically correct
-- avatarIntro ONLY in first question and PLAIN TEXT ONLY (omit from others)
-- mathTool.toolName must exactly match specification
-- Ensure MAXIMUM diversity - use ALL available variation options
-
-**CRITICAL FORMATTING - CURRENCY & LATEX**:
-- CURRENCY: For money amounts, use \\$ (backslash-dollar) so it renders as $
-  - WRONG: "costs $25" ← unescaped $ triggers LaTeX mode, garbles text
-  - CORRECT: "costs \\$25" ← renders properly as: costs $25
-- LATEX: Use $...$ ONLY for complex math expressions (fractions, square roots)
-  - For fractions: $\\frac{{1}}{{2}}$ renders as ½
-  - Simple symbols: Use Unicode instead (×, ÷, °, θ, π)
-
-Generate {count} diverse questions now:"""
-
-    return prompt
-
-
-def generate_questions_batch(exemplar: Dict[str, Any], count: int, node_number: int, provider: str, previous_questions: List[str] = None) -> Optional[List[Dict[str, Any]]]:
-    """Generate ALL questions for a node in a single batch (with diversity enforcement)"""
-
-    prompt = create_batch_generation_prompt(exemplar, count, node_number, previous_questions)
-
-    print(f"  Generating batch of {count} questions...", end=" ", flush=True)
+    log(f"  Prompt: {prompt_builder.describe_last()}")
+    log(f"  Generating batch of {count} questions...", end=" ", flush=True)
 
     try:
         response_text = None
+        questions_array = None
+        complete = True  # False for streams that were cut short (never cached)
+        start = time.perf_counter()
+
+        # Serve byte-identical prompts from the response cache when possible
+        key = cache_key(provider.name, provider.model, TEMPERATURE, MAX_OUTPUT_TOKENS, prompt, attempt, candidate) if cache else None
+        with telemetry.timer('cache_lookup'):
+            cached = cached_response(cache, key)
+        if cached:
+            response = cached
+            telemetry.count('cacheHits')
+            log("(cached)", end=" ", flush=True)
+        elif streaming:
+            telemetry.count('providerCalls')
+            with provider_call_timer('provider_stream'):
+                questions_array, stream, error = receive_streamed_batch(provider, prompt, count,
+                                                                        expected_tool_name(exemplar), stats)
+            response = stream.response
+            complete = stream.finished and not error
+            if error:
+                log(f"✗ Stream aborted: {error}", end=" ")
+                if not questions_array:
+                    log()
+                    if stats:
+                        stats.record_error(PARSE)
+                    return None
+                log(f"(keeping {len(questions_array)} valid)", end=" ", flush=True)
+        else:
+            telemetry.count('providerCalls')
+            with provider_call_timer('provider_call'):
+                response = provider.generate(prompt, temperature=TEMPERATURE, max_tokens=MAX_OUTPUT_TOKENS)
+        response_text = response.text
 
-        if provider == "claude":
-            message = anthropic_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=8000,  # Increased for batch
-                temperature=0.8,  # Higher for diversity
-                messages=[{"role": "user", "content": prompt}]
-            )
-            response_text = message.content[0].text.strip()
-
-        elif provider == "gemini":
-            model = genai.GenerativeModel('gemini-3-flash-preview')
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.8,
-                    max_output_tokens=8000,
-                )
-            )
-            response_text = response.text.strip()
-
-        # Remove markdown code blocks if present
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1])
-
-        # Parse JSON array
-        questions_array = json.loads(response_text)
-
-        # Validate it's an array
-        if not isinstance(questions_array, list):
-            print(f"✗ Expected array, got {type(questions_array)}")
-            return None
+        if questions_array is None:
+            with telemetry.timer('parse'):
+                questions_array = parse_questions_response(response_text)
 
         # Validate we got requested count
         if len(questions_array) != count:
-            print(f"⚠️  Requested {count}, got {len(questions_array)} questions")
+            log(f"⚠️  Requested {count}, got {len(questions_array)} questions")
 
         # Add metadata to each question
-        for i, question_data in enumerate(questions_array, start=1):
-            question_data['id'] = f"q{node_number}-{i}"
-            question_data['questionGroup'] = f"q{node_number}"
+        number_questions(questions_array, node_number)
+        if stats:
+            stats.record(response, bool(cached), count, len(questions_array), time.perf_counter() - start)
+
+        # Only cache responses that parsed - a retry must never be served a broken batch
+        if cache and not cached and complete:
+            cache_response(cache, key, provider, response)
 
-        print(f"✓")
+        log(f"✓")
         return questions_array
 
     except json.JSONDecodeError as e:
-        print(f"✗ JSON Parse Error: {e}")
+        log(f"✗ JSON Parse Error: {e}")
         if response_text:
-            print(f"Response preview: {response_text[:300]}...")
+            log(f"Response preview: {response_text[:300]}...")
+        if stats:
+            stats.record_error(PARSE)
         return None
 
-    except Exception as e:
-        print(f"✗ Error: {e}")
+    except ResponseFormatError as e:
+        log(f"✗ {e}")
+        if stats:
+            stats.record_error(PARSE)
         return None
 
+    except Exception as e:
+        error_class = classify_error(e)
+        log(f"✗ Error ({error_class}): {e}")
+        if stats:
+            stats.record_error(error_class, retry_after_seconds(e))
+        return None
 
-def generate_node_questions(node_id: str, exemplar: Dict[str, Any], node_number: int, provider: str, count: int = 5, max_retries: int = 3, previous_questions: List[str] = None) -> List[Dict[str, Any]]:
-    """Generate all questions for a node using BATCH generation (with retry until complete)"""
 
-    print(f"\n{'='*60}")
-    print(f"NODE: {node_id} - {exemplar['title']}")
-    print(f"{'='*60}")
+def create_validator(exemplar: Dict[str, Any], options: GenerationOptions) -> Optional[QuestionValidator]:
+    """The node's question validator (None with --validation off)"""
+    if options.validation == 'off':
+        return None
+    return QuestionValidator(exemplar, [verify_question] if options.answer_check else [])
+
+
+class OutputBuffer:
+    """print() stand-in that collects one worker's progress lines so they can be printed in one piece when it
+    finishes (parallel candidates and concurrent nodes would otherwise interleave them)"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+
+    def __call__(self, *values: Any, sep: str = ' ', end: str = '\n', flush: bool = False):
+        self.parts.append(sep.join(map(str, values)) + end)
+
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+def generate_candidate_batches(exemplar: Dict[str, Any], count: int, node_number: int, provider: AIProvider,
+                               previous_questions: Optional[List[str]], options: GenerationOptions, attempt: int,
+                               prompt_builder: PromptBuilder, exclusions: Optional[List[str]] = None,
+                               stats: Optional[NodeStats] = None,
+                               corrections: Optional[List[str]] = None,
+                               log: Callable[..., None] = print) -> Optional[List[Dict[str, Any]]]:
+    """Request options.candidates batches in parallel and keep the best count questions across them"""
+    results: Dict[int, Optional[List[Dict[str, Any]]]] = {}
+    with ThreadPoolExecutor(max_workers=options.candidates) as executor:
+        futures = {}
+        for candidate in range(1, options.candidates + 1):
+            output = OutputBuffer()
+            future = executor.submit(generate_questions_batch, exemplar, count, node_number, provider,
+                                     previous_questions, options.cache, attempt, prompt_builder, exclusions, stats,
+                                     options.stream, corrections, candidate, output)
+            futures[future] = (candidate, output)
+        # Each candidate's progress lines come out together when it finishes
+        for future in as_completed(futures):
+            candidate, output = futures[future]
+            results[candidate] = future.result()
+            log(output.text(), end='')
+    batches = [results[candidate] for candidate in sorted(results) if results[candidate]]
+    if not batches:
+        return None
 
-    # Try batch generation with retries
+    validator = create_validator(exemplar, options) if options.validation == 'reject' else None
+    with telemetry.timer('pick_candidates'):
+        questions, selection = select_questions(batches, count, validator, options.dedup_index,
+                                                options.dedup_threshold, (previous_questions or []) + (exclusions or []))
+    log(f"  🎯 {selection.describe()}")
+    telemetry.count('candidateQuestions', selection.pooled)
+    number_questions(questions, node_number)
+    return questions
+
+
+def number_questions(questions: List[Dict[str, Any]], node_number: int):
+    """(Re)assign contiguous ids (q<node>-1, q<node>-2, ...) and the node's questionGroup"""
+    for i, question_data in enumerate(questions, start=1):
+        question_data['id'] = f"q{node_number}-{i}"
+        question_data['questionGroup'] = f"q{node_number}"
+
+
+def screen_questions(validator: Optional[QuestionValidator], questions: List[Dict[str, Any]], first_position: int,
+                     node_number: int, options: GenerationOptions, stats: Optional[NodeStats] = None,
+                     log: Callable[..., None] = print) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Validate a batch that will fill the node from first_position on.
+
+    Returns the questions to keep (all of them in 'flag' mode) and the problems
+    found, to pass back to the model when the rejected slots are re-requested.
+    """
+    if validator is None or not questions:
+        return questions, []
+    with telemetry.timer('validate'):
+        failures = validator.validate_batch(questions, first_position)
+    if not failures:
+        return questions, []
+
+    problems = []
+    for slot, issues in sorted(failures.items()):
+        log(f"  🚫 q{node_number}-{first_position + slot + 1} failed validation: {'; '.join(map(str, issues))}")
+        problems.extend(str(issue) for issue in issues)
+    telemetry.count('invalidQuestions', len(failures))
+    telemetry.count('wrongAnswers', sum(any(issue.rule == 'answer' for issue in issues) for issues in failures.values()))
+    if stats:
+        stats.invalid += len(failures)
+    if options.validation == 'flag':
+        return questions, []
+    return [q for slot, q in enumerate(questions) if slot not in failures], sorted(set(problems))
+
+
+def replace_near_duplicates(node_id: str, exemplar: Dict[str, Any], node_number: int, provider: AIProvider,
+                            questions: List[Dict[str, Any]], previous_questions: Optional[List[str]],
+                            options: GenerationOptions, prompt_builder: PromptBuilder,
+                            stats: Optional[NodeStats] = None, log: Callable[..., None] = print) -> List[Dict[str, Any]]:
+    """Check a batch against the dedup index and regenerate only the near-duplicate slots"""
+    index = options.dedup_index
+    if index is None or not questions:
+        return questions
+
+    validator = create_validator(exemplar, options)
+    flagged = set()
+    replaced = 0
+    for round_number in range(1, options.max_retries + 2):
+        texts = [q.get('problemText', '') for q in questions]
+        with telemetry.timer('dedup_check'):
+            duplicates = find_batch_duplicates(texts, index, options.dedup_threshold)
+        if not duplicates:
+            break
+
+        for slot, (similarity, match) in sorted(duplicates.items()):
+            flagged.add(texts[slot])
+            log(f"  ♻️  q{node_number}-{slot + 1} is a near-duplicate ({similarity:.0%}) of: {match[:80]}...")
+        if options.dedup_mode == 'flag' or round_number > options.max_retries:
+            log(f"  ⚠️  Keeping {len(duplicates)} flagged near-duplicate question(s)")
+            break
+
+        # Ask only for the duplicate slots, with the rest of the batch and the rejects as context
+        slots = sorted(duplicates)
+        kept_texts = [text for slot, text in enumerate(texts) if slot not in duplicates]
+        replacements = generate_questions_batch(exemplar, len(slots), node_number, provider,
+                                                (previous_questions or []) + kept_texts, options.cache,
+                                                round_number, prompt_builder, exclusions=[texts[s] for s in slots],
+                                                stats=stats, streaming=options.stream, log=log)
+        for slot, replacement in zip(slots, replacements or []):
+            # avatarIntro belongs to the first question of the node only
+            intro = questions[slot].get('avatarIntro')
+            replacement.pop('avatarIntro', None)
+            if slot == 0 and intro:
+                replacement = {'problemText': replacement.get('problemText'), 'avatarIntro': intro, **replacement}
+            # An invalid replacement leaves the duplicate in place for the next round
+            issues = validator.validate(replacement, slot) if validator else []
+            if issues:
+                log(f"  🚫 Replacement for q{node_number}-{slot + 1} failed validation: {'; '.join(map(str, issues))}")
+                if stats:
+                    stats.invalid += 1
+                if options.validation == 'reject':
+                    continue
+            questions[slot] = replacement
+            replaced += 1
+        number_questions(questions, node_number)
+
+    index.record(len(flagged), replaced)
+    if stats:
+        stats.duplicates_replaced += replaced
+    return questions
+
+
+def generate_node_questions(node_id: str, exemplar: Dict[str, Any], node_number: int, provider: AIProvider,
+                            previous_questions: List[str] = None, options: Optional[GenerationOptions] = None,
+                            initial_questions: Optional[List[Dict[str, Any]]] = None,
+                            topic: str = '', log: Callable[..., None] = print) -> List[Dict[str, Any]]:
+    """Generate all questions for a node using BATCH generation (retries only ask for the missing questions).
+
+    initial_questions are already-accepted questions (e.g. a partial bulk result) to complete.
+    topic labels the node's row in the run report; progress goes to log.
+    """
+
+    options = options or GenerationOptions()
+    count, max_retries = options.count, options.max_retries
+
+    log(f"\n{'='*60}")
+    log(f"NODE: {node_id} - {exemplar['title']}")
+    log(f"{'='*60}")
+
+    # Static prompt sections are rendered once and reused by every retry
+    prompt_builder = PromptBuilder(exemplar, options.prompt_token_budget)
+    validator = create_validator(exemplar, options)
+    stats = NodeStats()
+    node_start = time.perf_counter()
+    corrections: List[str] = []
+
+    # Valid questions are kept across attempts; each retry requests just the shortfall
+    accepted: List[Dict[str, Any]] = list(initial_questions or [])[:count]
+    salvaged = 0  # How many of accepted are already counted in stats.salvaged
     for attempt in range(1, max_retries + 1):
-        questions = generate_questions_batch(exemplar, count, node_number, provider, previous_questions)
+        needed = count - len(accepted)
+        if needed <= 0:
+            break
+        accepted_texts = [q.get('problemText', '') for q in accepted]
+        stats.attempts = attempt
+        if attempt > 1:
+            telemetry.count('retries')
+        if options.candidates > 1:
+            questions = generate_candidate_batches(exemplar, needed, node_number, provider, previous_questions, options,
+                                                   attempt, prompt_builder, accepted_texts or None, stats,
+                                                   corrections or None, log)
+        else:
+            questions = generate_questions_batch(exemplar, needed, node_number, provider, previous_questions,
+                                                 options.cache, attempt, prompt_builder,
+                                                 exclusions=accepted_texts or None, stats=stats,
+                                                 streaming=options.stream, corrections=corrections or None, log=log)
+
+        received = bool(questions)
+        if questions:
+            if accepted:
+                # Only the questions accepted since the last retry are newly salvaged
+                stats.salvaged += len(accepted) - salvaged
+                salvaged = len(accepted)
+                # avatarIntro belongs to the node's first question, which we already have
+                for question in questions:
+                    question.pop('avatarIntro', None)
+            # Invalid questions are dropped here, so the next attempt re-requests just those slots
+            questions, corrections = screen_questions(validator, questions[:needed], len(accepted), node_number,
+                                                      options, stats, log)
+            accepted.extend(questions)
+            number_questions(accepted, node_number)
 
         # Success: Got exactly the number of questions requested
-        if questions and len(questions) == count:
-            print(f"  ✓ Generated {len(questions)}/{count} questions")
-            return questions
+        if len(accepted) == count:
+            log(f"  ✓ Generated {len(accepted)}/{count} questions")
+            break
 
-        # Partial batch: Retry to get complete set
-        elif questions and len(questions) > 0:
-            print(f"  ⚠️  Partial batch: {len(questions)}/{count} questions (need all {count})")
+        # Partial batch (or questions that failed validation): keep the valid ones and request the rest
+        if received:
+            log(f"  ⚠️  Partial batch: {len(accepted)}/{count} questions")
             if attempt < max_retries:
-                wait_time = 2 ** (attempt - 1)
-                print(f"  ⚠️  Retrying to get complete batch (attempt {attempt + 1}/{max_retries}) in {wait_time}s...")
-                time.sleep(wait_time)
+                log(f"  ⚠️  Requesting the missing {count - len(accepted)} (attempt {attempt + 1}/{max_retries})...")
             else:
-                print(f"  ⚠️  Exhausted retries - accepting partial batch of {len(questions)} questions")
-                return questions  # Last resort: accept partial after all retries
+                log(f"  ⚠️  Exhausted retries - accepting partial batch of {len(accepted)} questions")
 
-        # Failed batch: Retry
+        # Fatal error (bad request, auth): retrying can't help
+        elif stats.last_error == FATAL:
+            log(f"  ✗ Fatal provider error - not retrying this node")
+            break
+
+        # Failed batch: Retry after a delay that fits the error
         elif attempt < max_retries:
-            wait_time = 2 ** (attempt - 1)
-            print(f"  ⚠️  Batch failed - retrying (attempt {attempt + 1}/{max_retries}) in {wait_time}s...")
+            wait_time = backoff_delay(stats.last_error, attempt, stats.last_retry_after)
+            log(f"  ⚠️  Batch failed ({stats.last_error}) - retrying (attempt {attempt + 1}/{max_retries}) in {wait_time:.1f}s...")
+            if options.rate_limiter:
+                options.rate_limiter.record_backoff(wait_time)
+            stats.backoff_seconds += wait_time
+            telemetry.add_sample('backoff', wait_time)
             time.sleep(wait_time)
+        elif not accepted:
+            log(f"  ✗ Failed to generate questions after {max_retries} attempts")
         else:
-            print(f"  ✗ Failed to generate questions after {max_retries} attempts")
-            return []
+            log(f"  ⚠️  Exhausted retries - accepting partial batch of {len(accepted)} questions")
+
+    accepted = replace_near_duplicates(node_id, exemplar, node_number, provider, accepted,
+                                       previous_questions, options, prompt_builder, stats, log)
+    log(f"  📈 {stats.describe()}")
+    node_seconds = time.perf_counter() - node_start
+    telemetry.add_sample('node', node_seconds)
+    telemetry.record_node(stats.report_row(topic, node_id, len(accepted), node_seconds))
+    return accepted
 
-    return []
 
+def node_source_hash(exemplar: Dict[str, Any], count: int) -> str:
+    """Hash of everything a node was generated from: its exemplar entry and the generation settings"""
+    source = {'exemplar': exemplar, 'count': count, 'temperature': TEMPERATURE}
+    return hashlib.sha256(json.dumps(source, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
 
-def create_yaml_node(node_id: str, node_number: int, exemplar: Dict[str, Any], questions: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Create a YAML node entry with generated questions"""
+
+def create_yaml_node(node_id: str, node_number: int, exemplar: Dict[str, Any], questions: List[Dict[str, Any]],
+                     source_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Create a YAML node entry with generated questions (source_hash: see node_source_hash)"""
 
     # Filter out any None values (defensive programming)
     valid_questions = [q for q in questions if q is not None]
@@ -349,6 +769,7 @@ def create_yaml_node(node_id: str, node_number: int, exemplar: Dict[str, Any], q
         'layer': 'foundation',  # All are foundation for now
         'problemsRequired': 5,
         'prerequisites': [],
+        **({'sourceHash': source_hash} if source_hash else {}),
         'descriptor': {
             'aiGeneratedQuestions': False,  # Flag to indicate pre-written questions
             'difficulty': 'easy',
@@ -361,37 +782,122 @@ def create_yaml_node(node_id: str, node_number: int, exemplar: Dict[str, Any], q
 
 
 def load_existing_yaml(output_path: str) -> Dict[str, Any]:
-    """Load existing YAML file if it exists (for resume capability)"""
+    """Load existing YAML file if it exists (full parse - resume normally uses the sidecar index instead)"""
     if not os.path.exists(output_path):
         return {'nodes': []}
 
     try:
-        with open(output_path, 'r') as f:
-            # Skip comment lines and load YAML
-            lines = f.readlines()
-            yaml_content = ''.join([line for line in lines if not line.strip().startswith('#')])
-            data = yaml.safe_load(yaml_content)
-            return data if data else {'nodes': []}
+        data = load_yaml_file(output_path)
+        return data if data else {'nodes': []}
     except Exception as e:
         print(f"⚠️  Warning: Could not load existing file: {e}")
         return {'nodes': []}
 
 
-def get_completed_node_ids(yaml_data: Dict[str, Any]) -> List[str]:
-    """Extract list of already-generated node IDs from YAML data"""
-    nodes = yaml_data.get('nodes', [])
-    return [node['id'] for node in nodes if 'id' in node]
+def assign_node_numbers(node_ids: List[str], existing_nodes: List[Dict]) -> Dict[str, int]:
+    """Assign nodeNumbers to pending nodes up front (deterministic regardless of completion order)"""
+    used_numbers = {node.get('nodeNumber') for node in existing_nodes}
+    node_numbers = {}
+    next_number = len(existing_nodes) + 1
+
+    for node_id in node_ids:
+        # Skip numbers already taken by nodes saved out of order in a previous run
+        while next_number in used_numbers:
+            next_number += 1
+        node_numbers[node_id] = next_number
+        next_number += 1
+
+    return node_numbers
+
+
+def insert_node_in_order(all_nodes: List[Dict], yaml_node: Dict):
+    """Insert a node before the first node with a higher nodeNumber (keeps YAML in node order)"""
+    for i, node in enumerate(all_nodes):
+        if node.get('nodeNumber', 0) > yaml_node['nodeNumber']:
+            all_nodes.insert(i, yaml_node)
+            return
+    all_nodes.append(yaml_node)
+
+
+def yaml_header(topic_name: str) -> str:
+    """Comment block at the top of every generated YAML file"""
+    return (f"# {topic_name} - Unified Practice Path\n"
+            "# Generated using exemplar-based AI question generation\n"
+            "# All nodes are accessible (no locks), with smart prerequisite suggestions\n\n")
+
 
+def save_yaml(output_path: str, all_nodes: List[Dict], topic_name: str):
+    """Write the complete YAML file atomically (temp file + rename)"""
+    write_file_atomic(output_path, yaml_header(topic_name) + dump_yaml({'nodes': all_nodes}))
 
-def save_yaml_incremental(output_path: str, all_nodes: List[Dict], topic_name: str):
-    """Save YAML with all nodes (for incremental auto-saves and final save)"""
-    yaml_output = {'nodes': all_nodes}
 
-    with open(output_path, 'w') as f:
-        f.write(f"# {topic_name} - Unified Practice Path\n")
-        f.write("# Generated using exemplar-based AI question generation\n")
-        f.write("# All nodes are accessible (no locks), with smart prerequisite suggestions\n\n")
-        yaml.dump(yaml_output, f, default_flow_style=False, allow_unicode=True, sort_keys=False, width=120)
+def yaml_ends_with_node_list(output_path: str) -> bool:
+    """True if the file is a generated YAML whose only top-level key is a block 'nodes:' list"""
+    with open(output_path, 'r') as f:
+        top_level_keys = [line.rstrip() for line in f
+                          if line.strip() and not line.startswith(('#', ' ', '-'))]
+    return top_level_keys == ['nodes:']
+
+
+def materialize_topic_output(run: 'TopicRun'):
+    """Write the journaled nodes into the YAML output once, refresh the sidecar index, then drop the journal.
+
+    When the new nodes all sort after the nodes already in the file, they are
+    appended as extra list items (the existing YAML is copied, not parsed or
+    re-serialized). Regenerated nodes and nodes that land between existing ones
+    are spliced into the text, so every other node stays byte-identical; only
+    if the file's layout can't be spliced is it parsed, merged and rewritten.
+    All paths replace the file atomically.
+    """
+    if not run.new_nodes:
+        remove_journal(run.journal_path)
+        return
+
+    existing_ids = {node['id'] for node in run.existing_nodes}
+    replacing = any(node['id'] in existing_ids for node in run.new_nodes)
+    last_existing_number = max((node.get('nodeNumber') or 0 for node in run.existing_nodes), default=0)
+    can_append = (run.existing_nodes
+                  and not replacing
+                  and run.new_nodes[0]['nodeNumber'] > last_existing_number
+                  and yaml_ends_with_node_list(run.output_path))
+    spliced = None
+    if run.existing_nodes and not can_append:
+        with open(run.output_path, 'r') as f:
+            spliced = splice_nodes(f.read(), run.new_nodes)
+
+    if can_append:
+        with open(run.output_path, 'r') as f:
+            existing_yaml = f.read()
+        if not existing_yaml.endswith("\n"):
+            existing_yaml += "\n"
+        with telemetry.timer('yaml_write'):
+            write_file_atomic(run.output_path, existing_yaml + dump_yaml(run.new_nodes))
+
+        new_summary = summarize_nodes(run.new_nodes)
+        summary = {'nodes': run.existing_nodes + new_summary['nodes'],
+                   'problemTexts': run.existing_problem_texts + new_summary['problemTexts']}
+    elif spliced:
+        yaml_text, all_nodes = spliced
+        with telemetry.timer('yaml_write'):
+            write_file_atomic(run.output_path, yaml_text)
+        summary = summarize_nodes(all_nodes)
+    else:
+        # No file yet (or one we can't splice): full merge
+        new_ids = {node['id'] for node in run.new_nodes}
+        all_nodes = load_existing_yaml(run.output_path).get('nodes', []) if run.existing_nodes else []
+        all_nodes = [node for node in all_nodes if node.get('id') not in new_ids]
+        for node in run.new_nodes:
+            insert_node_in_order(all_nodes, node)
+        with telemetry.timer('yaml_write'):
+            save_yaml(run.output_path, all_nodes, run.topic_name)
+        summary = summarize_nodes(all_nodes)
+
+    with telemetry.timer('index_write'):
+        write_progress_index(run.output_path, summary)
+    run.existing_nodes = summary['nodes']
+    run.existing_problem_texts = summary['problemTexts']
+    run.new_nodes = []
+    remove_journal(run.journal_path)
 
 
 def extract_topic_name(output_path: str) -> str:
@@ -404,7 +910,917 @@ def extract_topic_name(output_path: str) -> str:
     return name.title()
 
 
+def collect_question_texts(nodes: List[Dict]) -> List[str]:
+    """Collect every problemText already in the given nodes (for anti-repetition)"""
+    texts = []
+    for node in nodes:
+        for q in node.get('descriptor', {}).get('preWrittenQuestions', []):
+            question_text = q.get('problemText', '')
+            if question_text:
+                texts.append(question_text)
+    return texts
+
+
+class TopicRun:
+    """Generation state for one exemplar file / output YAML pair"""
+
+    def __init__(self, exemplar_file: str, output_path: str, topic_name: str, exemplars: Dict[str, Any],
+                 existing_nodes: List[Dict], existing_problem_texts: List[str]):
+        self.exemplar_file = exemplar_file
+        self.output_path = output_path
+        self.topic_name = topic_name
+        self.exemplars = exemplars
+        self.existing_nodes = existing_nodes  # Summaries ({id, nodeNumber, questionCount, textCount}) of nodes in the YAML
+        self.existing_problem_texts = existing_problem_texts
+        self.new_nodes: List[Dict] = []  # Full nodes generated (or replayed from the journal) this run, in node order
+        self.journal_path = journal_path_for(output_path)
+        self.completed_node_ids = [node['id'] for node in existing_nodes]
+        self.previous_question_texts = list(existing_problem_texts)
+        self.pending_node_ids: List[str] = []
+        self.stale_node_ids: List[str] = []  # Completed nodes whose exemplar/settings changed (--incremental)
+        self.node_numbers: Dict[str, int] = {}
+        self.generated = 0
+        self.refreshed = 0  # Stale nodes regenerated this run
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def dedup_topic(self) -> str:
+        """The topic half of this topic's node keys in the near-duplicate index"""
+        return os.path.basename(self.output_path)
+
+    def node_question_texts(self) -> Dict[str, List[str]]:
+        """problemTexts per completed node that is being kept: the YAML's nodes, overridden by journaled ones.
+        Stale nodes are left out - their questions are about to be replaced"""
+        texts: Dict[str, List[str]] = {}
+        position = 0
+        for node in self.existing_nodes:
+            count = node.get('textCount', 0)
+            texts[node['id']] = self.existing_problem_texts[position:position + count]
+            position += count
+        for node in self.new_nodes:
+            texts[node['id']] = collect_question_texts([node])
+        for node_id in self.stale_node_ids:
+            texts.pop(node_id, None)
+        return texts
+
+    def total_nodes(self) -> int:
+        new_ids = {node['id'] for node in self.new_nodes}
+        return sum(1 for node in self.existing_nodes if node['id'] not in new_ids) + len(self.new_nodes)
+
+    def total_questions(self) -> int:
+        new_ids = {node['id'] for node in self.new_nodes}
+        return (sum(node.get('questionCount', 0) for node in self.existing_nodes if node['id'] not in new_ids)
+                + sum(len(node['descriptor'].get('preWrittenQuestions', [])) for node in self.new_nodes))
+
+
+def find_stale_nodes(run: TopicRun, node_ids: List[str], count: int) -> Tuple[List[str], List[str]]:
+    """Completed nodes whose recorded sourceHash no longer matches their exemplar, and those with no hash"""
+    recorded = {node['id']: node.get('sourceHash') for node in run.existing_nodes}
+    for node in run.new_nodes:
+        recorded[node['id']] = node.get('sourceHash')
+    stale, untracked = [], []
+    for node_id in node_ids:
+        if node_id not in recorded or node_id not in run.exemplars:
+            continue
+        if not recorded[node_id]:
+            untracked.append(node_id)
+        elif recorded[node_id] != node_source_hash(run.exemplars[node_id], count):
+            stale.append(node_id)
+    return stale, untracked
+
+
+def prepare_topic_run(exemplar_file: str, output_path: str, topic_name: str, nodes: str = 'all', test: bool = False,
+                      incremental: bool = False, count: int = 5) -> TopicRun:
+    """Load exemplars and existing progress, and work out which nodes still need generating.
+
+    With incremental, completed nodes whose exemplar or settings (count) changed are regenerated too.
+    """
+
+    # Load exemplars
+    print("Loading exemplar templates...")
+    with telemetry.timer('load_exemplars'):
+        exemplars = load_exemplars(exemplar_file)
+    print(f"Loaded {len(exemplars)} node templates\n")
+
+    # Load existing YAML if resuming
+    print("Checking for existing progress...")
+    try:
+        with telemetry.timer('load_progress'):
+            progress = load_progress_index(output_path)
+    except Exception as e:
+        print(f"⚠️  Warning: Could not load existing file: {e}")
+        progress = None
+    progress = progress or {'nodes': [], 'problemTexts': []}
+    run = TopicRun(exemplar_file, output_path, topic_name, exemplars, progress['nodes'], progress['problemTexts'])
+
+    # Replay nodes finished by an interrupted run (not yet materialized into the YAML).
+    # A journaled node with an id already in the YAML is a regenerated (stale) node - it replaces that one.
+    recorded_hashes = {node['id']: node.get('sourceHash') for node in run.existing_nodes}
+    journaled_nodes = [node for node in replay_journal(run.journal_path)
+                       if node['id'] not in recorded_hashes or node.get('sourceHash') != recorded_hashes[node['id']]]
+    if journaled_nodes:
+        for node in journaled_nodes:
+            insert_node_in_order(run.new_nodes, node)
+            if node['id'] not in run.completed_node_ids:
+                run.completed_node_ids.append(node['id'])
+        run.previous_question_texts.extend(collect_question_texts(journaled_nodes))
+        print(f"📓 Replayed {len(journaled_nodes)} nodes from interrupted run ({run.journal_path})")
+
+    completed_node_ids = run.completed_node_ids
+
+    if completed_node_ids:
+        print(f"📂 Found existing file with {len(completed_node_ids)} completed nodes")
+        print(f"   Completed: {', '.join(completed_node_ids[:5])}{'...' if len(completed_node_ids) > 5 else ''}")
+        print(f"   Will skip these and continue from where we left off\n")
+    else:
+        print("   No existing file found - starting fresh\n")
+
+    # Determine which nodes to generate
+    if test:
+        node_ids = list(exemplars.keys())[:3]
+        print(f"TEST MODE: Generating for first 3 nodes only")
+    elif nodes == 'all':
+        node_ids = list(exemplars.keys())
+    else:
+        node_ids = [n.strip() for n in nodes.split(',')]
+
+    # Completed nodes whose inputs changed since they were generated
+    stale, untracked = find_stale_nodes(run, node_ids, count)
+    if stale:
+        print(f"🔁 {len(stale)} completed node(s) are stale (exemplar or settings changed): "
+              f"{', '.join(stale[:5])}{'...' if len(stale) > 5 else ''}")
+        if incremental:
+            run.stale_node_ids = stale
+            # Their old questions are being replaced: not listed for anti-repetition, not seeded for dedup
+            run.previous_question_texts = [text for texts in run.node_question_texts().values() for text in texts]
+            print(f"   Regenerating them (--incremental); all other nodes are kept byte-identical")
+        else:
+            print(f"   Kept as-is - rerun with --incremental to regenerate them")
+    if untracked and incremental:
+        print(f"ℹ️  {len(untracked)} completed node(s) have no sourceHash (generated before it was recorded) - kept as-is")
+    if stale or (untracked and incremental):
+        print()
+
+    # Filter out already-completed (and up-to-date) nodes
+    run.pending_node_ids = [nid for nid in node_ids if nid not in completed_node_ids or nid in run.stale_node_ids]
+
+    if not run.pending_node_ids:
+        if journaled_nodes:
+            # Crashed after the last node but before the final write
+            materialize_topic_output(run)
+            print(f"💾 Wrote {len(journaled_nodes)} journaled nodes to {output_path}")
+        print("✅ All requested nodes already generated! Nothing to do.")
+        if not incremental:
+            print(f"   Use --incremental to regenerate nodes whose exemplar changed, or delete {output_path} to regenerate from scratch.")
+        return run
+
+    print(f"🔄 {len(run.pending_node_ids)} nodes remaining to generate")
+    print(f"   (Total requested: {len(node_ids)}, Already done: {len(completed_node_ids)})\n")
+
+    if run.previous_question_texts:
+        print(f"📝 Loaded {len(run.previous_question_texts)} previous questions for anti-repetition\n")
+
+    # Number pending nodes up front so parallel completion order can't change ids (stale nodes keep theirs)
+    known_numbers = {node['id']: node.get('nodeNumber') for node in run.existing_nodes + run.new_nodes}
+    run.node_numbers = assign_node_numbers([nid for nid in run.pending_node_ids if nid not in run.stale_node_ids],
+                                           run.existing_nodes + run.new_nodes)
+    run.node_numbers.update({nid: known_numbers[nid] for nid in run.stale_node_ids})
+
+    return run
+
+
+def build_work_queue(runs: List[TopicRun]) -> List[Tuple[TopicRun, str]]:
+    """Pending nodes of every topic, interleaved round-robin (unknown node ids are skipped)"""
+    topic_queues = []
+    for run in runs:
+        runnable_node_ids = []
+        for node_id in run.pending_node_ids:
+            if node_id not in run.exemplars:
+                print(f"⚠️  Node {node_id} not found in exemplars, skipping...")
+                continue
+            runnable_node_ids.append(node_id)
+        topic_queues.append([(run, node_id) for node_id in runnable_node_ids])
+
+    # Round-robin across topics so every topic makes progress and same-topic nodes are spread out
+    work_queue = []
+    for position in range(max((len(q) for q in topic_queues), default=0)):
+        work_queue.extend(q[position] for q in topic_queues if position < len(q))
+    return work_queue
+
+
+def record_node_result(runs: List[TopicRun], run: TopicRun, yaml_node: Optional[Dict],
+                       dedup_index: Optional[DedupIndex] = None) -> bool:
+    """Add a finished node to its topic and journal it (main thread only). Returns False for failures."""
+    if not yaml_node:
+        run.failed += 1
+        return False
+    if dedup_index is not None:
+        # The node's questions (a regenerated node's new ones) replace whatever was indexed for it
+        dedup_index.replace_node(run.dedup_topic, yaml_node['id'], collect_question_texts([yaml_node]))
+
+    insert_node_in_order(run.new_nodes, yaml_node)
+    run.generated += 1
+    if yaml_node['id'] in run.stale_node_ids:
+        run.refreshed += 1
+
+    # Journal after each node (only this thread touches the output files)
+    with telemetry.timer('journal_append'):
+        append_journal_entry(run.journal_path, yaml_node)
+    print(f"\n📓 Journaled {yaml_node['id']} ({run.total_nodes()} nodes completed) - safe to resume if interrupted")
+    if len(runs) > 1:
+        print(f"📈 {run.topic_name}: {run.generated + run.failed}/{len(run.pending_node_ids)} pending nodes processed")
+    print()
+    return True
+
+
+def generate_pending_nodes(runs: List[TopicRun], provider: AIProvider, options: GenerationOptions, concurrency: int = 1,
+                           work_queue: Optional[List[Tuple[TopicRun, str]]] = None,
+                           initial_questions: Optional[Dict[Tuple[str, str], List[Dict]]] = None) -> int:
+    """Generate the pending nodes of every topic through one bounded worker pool.
+
+    Topics are interleaved round-robin in a single work queue, and every finished
+    node is appended to its topic's journal (the YAML is written once, at the end,
+    by materialize_topic_output). Each worker snapshots its
+    topic's anti-repetition list when it starts a node, so nodes that are in flight
+    at the same time cannot see each other's questions. Returns the number of nodes
+    generated.
+
+    work_queue overrides the nodes to generate; initial_questions maps
+    (output_path, node_id) to questions already accepted for that node.
+    """
+
+    def generate_one(run: TopicRun, node_id: str, log: Callable[..., None]) -> Optional[Dict]:
+        exemplar = run.exemplars[node_id]
+        node_number = run.node_numbers[node_id]
+
+        with run.lock:
+            previous_questions = list(run.previous_question_texts)
+
+        questions = generate_node_questions(node_id, exemplar, node_number, provider, previous_questions, options,
+                                            (initial_questions or {}).get((run.output_path, node_id)), run.topic_name,
+                                            log)
+        if not questions:
+            return None
+
+        # Make this node's question texts visible to nodes started after it
+        with run.lock:
+            for q in questions:
+                question_text = q.get('problemText', '')
+                if question_text:
+                    run.previous_question_texts.append(question_text)
+
+        return create_yaml_node(node_id, node_number, exemplar, questions, node_source_hash(exemplar, options.count))
+
+    if work_queue is None:
+        work_queue = build_work_queue(runs)
+
+    generated = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # One worker prints as it goes; concurrent workers' output is printed here as each node finishes
+        futures = {}
+        for run, node_id in work_queue:
+            output = OutputBuffer() if concurrency > 1 else None
+            futures[executor.submit(generate_one, run, node_id, output or print)] = (run, output)
+
+        for future in as_completed(futures):
+            run, output = futures[future]
+            yaml_node = future.result()
+            if output:
+                print(output.text(), end='', flush=True)
+            if record_node_result(runs, run, yaml_node, options.dedup_index):
+                generated += 1
+
+    return generated
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def generate_pending_nodes_bulk(runs: List[TopicRun], provider: AIProvider, options: GenerationOptions,
+                                concurrency: int = 1) -> int:
+    """Generate every pending node through the provider's asynchronous batch API (--mode bulk).
+
+    All prompts are built up front (each node sees the topic's questions from
+    before the run, not those of other nodes in the same job - the dedup index
+    catches repeats afterwards), submitted as one job, and polled until done.
+    Results go through the same parse/cache/dedup/journal path as interactive
+    runs; nodes the job couldn't complete are finished interactively.
+    """
+    work_queue = build_work_queue(runs)
+    if not work_queue:
+        return 0
+
+    # Build prompts; anything already in the response cache skips the job
+    requests: Dict[str, str] = {}
+    responses: Dict[str, ProviderResponse] = {}
+    keys: Dict[str, str] = {}
+    for position, (run, node_id) in enumerate(work_queue):
+        request_id = f"node-{position:05d}"  # Node ids may repeat across topics
+        with telemetry.timer('prompt_build'):
+            prompt = PromptBuilder(run.exemplars[node_id], options.prompt_token_budget).build(
+                options.count, run.previous_question_texts)
+        keys[request_id] = cache_key(provider.name, provider.model, TEMPERATURE, MAX_OUTPUT_TOKENS, prompt)
+        cached = cached_response(options.cache, keys[request_id])
+        if cached:
+            responses[request_id] = cached
+            telemetry.count('cacheHits')
+        else:
+            requests[request_id] = prompt
+
+    print(f"\n📦 Bulk mode: {len(work_queue)} nodes, {len(responses)} served from cache, {len(requests)} to submit")
+    errors: Dict[str, str] = {}
+    if requests:
+        start = time.perf_counter()
+        telemetry.count('bulkRequests', len(requests))
+        try:
+            job_id = provider.submit_bulk(requests, TEMPERATURE, MAX_OUTPUT_TOKENS)
+            print(f"📤 Submitted batch job {job_id} to {provider.display_name}")
+            while not provider.bulk_done(job_id):
+                print(f"⏳ Waiting for {job_id} ({format_duration(time.perf_counter() - start)} elapsed)...")
+                time.sleep(options.bulk_poll_interval)
+            for request_id, result in provider.bulk_results(job_id).items():
+                if result.response:
+                    responses[request_id] = result.response
+                else:
+                    errors[request_id] = result.error or 'unknown error'
+            telemetry.add_sample('bulk_wait', time.perf_counter() - start)
+            print(f"📥 Batch job finished in {format_duration(time.perf_counter() - start)}: "
+                  f"{len(requests) - len(errors)} responses, {len(errors)} errors")
+        except Exception as e:
+            print(f"✗ Bulk job failed ({classify_error(e)}): {e}")
+            print(f"  Falling back to interactive generation for all nodes")
+
+    # Parse results in work-queue order; incomplete nodes are queued for interactive generation
+    input_tokens = sum(r.input_tokens for request_id, r in responses.items() if request_id in requests)
+    cached_input_tokens = sum(r.cached_input_tokens for request_id, r in responses.items() if request_id in requests)
+    output_tokens = sum(r.output_tokens for request_id, r in responses.items() if request_id in requests)
+    fallback_queue: List[Tuple[TopicRun, str]] = []
+    partial: Dict[Tuple[str, str], List[Dict]] = {}
+    generated = 0
+    for position, (run, node_id) in enumerate(work_queue):
+        request_id = f"node-{position:05d}"
+        exemplar = run.exemplars[node_id]
+        node_number = run.node_numbers[node_id]
+        response = responses.get(request_id)
+
+        questions = []
+        if response is None:
+            print(f"✗ {node_id}: {errors.get(request_id, 'no result')}")
+        else:
+            try:
+                with telemetry.timer('parse'):
+                    questions = parse_questions_response(response.text)[:options.count]
+            except ValueError as e:
+                print(f"✗ {node_id}: unusable response ({e})")
+        validator = create_validator(exemplar, options)
+        questions, _ = screen_questions(validator, questions, 0, node_number, options)
+        number_questions(questions, node_number)
+
+        if len(questions) < options.count:
+            if questions:
+                print(f"⚠️  {node_id}: {len(questions)}/{options.count} questions - completing interactively")
+                partial[(run.output_path, node_id)] = questions
+            fallback_queue.append((run, node_id))
+            continue
+
+        if options.cache and request_id in requests:
+            cache_response(options.cache, keys[request_id], provider, response)
+        print(f"✓ {node_id}: {len(questions)}/{options.count} questions from the batch job")
+
+        stats = NodeStats(attempts=1)
+        stats.record(response, request_id not in requests, options.count, len(questions), 0.0)
+        questions = replace_near_duplicates(node_id, exemplar, node_number, provider, questions,
+                                            run.previous_question_texts, options,
+                                            PromptBuilder(exemplar, options.prompt_token_budget), stats)
+        telemetry.record_node(stats.report_row(run.topic_name, node_id, len(questions), 0.0))
+        run.previous_question_texts.extend(q['problemText'] for q in questions if q.get('problemText'))
+        if record_node_result(runs, run, create_yaml_node(node_id, node_number, exemplar, questions,
+                                                             node_source_hash(exemplar, options.count)),
+                              options.dedup_index):
+            generated += 1
+
+    print(f"📦 Bulk usage: {input_tokens:,} in ({cached_input_tokens:,} from the prompt cache) / {output_tokens:,} out tokens "
+          f"for {len(requests)} submitted nodes")
+    if fallback_queue:
+        print(f"\n🔁 Generating {len(fallback_queue)} incomplete node(s) interactively")
+        generated += generate_pending_nodes(runs, provider, options, concurrency, fallback_queue, partial)
+    return generated
+
+
+def add_generation_arguments(parser: argparse.ArgumentParser):
+    """Options shared by single-topic and batch runs"""
+    parser.add_argument('--test', action='store_true', help='Test mode: generate only first 3 nodes')
+    parser.add_argument('--count', type=int, default=5, help='Questions per node (default: 5)')
+    parser.add_argument('--max-retries', type=int, default=3, help='Maximum retry attempts per question (default: 3)')
+    parser.add_argument('--provider', default='gemini', choices=list(PROVIDERS),
+                        help='AI provider to use (default: gemini; mock/replay run offline)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of nodes to generate in parallel (default: 1)')
+    parser.add_argument('--rpm', type=float, help='Maximum provider requests per minute across all workers (default: unlimited)')
+    parser.add_argument('--tpm', type=float,
+                        help='Maximum provider tokens (input + output) per minute across all workers (default: unlimited)')
+    parser.add_argument('--record-file', help='Append every provider response to this JSONL file (for --provider replay)')
+    parser.add_argument('--replay-file', help='Recorded responses to serve with --provider replay')
+    parser.add_argument('--mock-latency', type=float, default=0.0,
+                        help='Simulated seconds per call for mock/replay providers (default: 0)')
+    parser.add_argument('--mock-jitter', type=float, default=0.0,
+                        help='Random extra latency (0..N seconds) for mock/replay providers (default: 0)')
+    parser.add_argument('--mock-failure-rate', type=float, default=0.0,
+                        help='Probability a mock/replay call raises an error (default: 0)')
+    parser.add_argument('--mock-partial-rate', type=float, default=0.0,
+                        help='Probability the mock provider returns fewer questions than requested (default: 0)')
+    parser.add_argument('--mock-malformed-rate', type=float, default=0.0,
+                        help='Probability the mock provider truncates its response mid-JSON (default: 0)')
+    parser.add_argument('--mock-rate-limit-rate', type=float, default=0.0,
+                        help='Probability a mock/replay call returns a simulated 429 (default: 0)')
+    parser.add_argument('--mock-seed', type=int, help='Random seed for mock/replay simulation')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Response cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_MB,
+                        help=f'Evict least-recently-used responses above this size (default: {DEFAULT_MAX_MB})')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the provider (skip the response cache)')
+    parser.add_argument('--prompt-token-budget', type=int, default=DEFAULT_PROMPT_TOKEN_BUDGET,
+                        help=f'Estimated prompt size cap; fills the anti-repetition list up to it (default: {DEFAULT_PROMPT_TOKEN_BUDGET})')
+    parser.add_argument('--mode', default='interactive', choices=['interactive', 'bulk'],
+                        help='interactive: one call per node; bulk: submit all pending nodes as one provider batch job '
+                             '(slower to finish, cheaper per question) (default: interactive)')
+    parser.add_argument('--bulk-poll-interval', type=float, default=DEFAULT_BULK_POLL_INTERVAL,
+                        help=f'Seconds between batch job status checks in bulk mode (default: {DEFAULT_BULK_POLL_INTERVAL:g})')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream responses: check each question as it arrives and abort bad responses early')
+    parser.add_argument('--dedup', default='reject', choices=['reject', 'flag', 'off'],
+                        help='Near-duplicate questions: regenerate their slots, only report them, or skip the check (default: reject)')
+    parser.add_argument('--dedup-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Estimated shingle similarity at which two questions count as duplicates (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--dedup-index', default=DEFAULT_INDEX_PATH,
+                        help=f'Persistent near-duplicate index shared by all topics (default: {DEFAULT_INDEX_PATH})')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Also regenerate completed nodes whose exemplar entry or generation settings changed '
+                             '(other nodes stay byte-identical)')
+    parser.add_argument('--candidates', type=int, default=1,
+                        help='Candidate batches requested in parallel per node; the most diverse valid questions '
+                             'across them are kept (default: 1)')
+    parser.add_argument('--validation', default='reject', choices=['reject', 'flag', 'off'],
+                        help='Questions that fail validation: re-request their slots, only report them, '
+                             'or skip the check (default: reject)')
+    parser.add_argument('--answer-check', default='on', choices=['on', 'off'],
+                        help='Recompute each answer from its steps and mathTool parameters as part of validation '
+                             '(default: on)')
+    parser.add_argument('--report',
+                        help='Write a run report (stage timings, tokens, retries, per-node rows) to this file: '
+                             '.json for the full report, .csv for per-node rows')
+    parser.add_argument('--compile', action='store_true',
+                        help=f'Also build the compiled *{ARTIFACT_SUFFIX} artifact and bank manifest for each output')
+    parser.add_argument('--plan', action='store_true',
+                        help='Build every pending prompt and forecast tokens, cost and wall-clock time at --concurrency '
+                             '(no API calls, no API key needed)')
+
+
+def setup_generation(args: argparse.Namespace) -> Tuple[AIProvider, GenerationOptions]:
+    """Create the provider (rate limited if requested) and the options shared by every topic"""
+    print(f"Initializing AI provider: {args.provider}")
+    provider = initialize_ai_provider(
+        args.provider,
+        record_file=args.record_file,
+        replay_file=args.replay_file,
+        latency=args.mock_latency,
+        jitter=args.mock_jitter,
+        failure_rate=args.mock_failure_rate,
+        partial_rate=args.mock_partial_rate,
+        malformed_rate=args.mock_malformed_rate,
+        rate_limit_rate=args.mock_rate_limit_rate,
+        seed=args.mock_seed,
+    )
+    # Always wrapped: even without limits, a 429 pauses every worker and time is accounted for
+    rate_limiter = RateLimiter(args.rpm, args.tpm)
+    provider = RateLimitedProvider(provider, rate_limiter)
+    if args.rpm or args.tpm:
+        print(f"✓ Rate limited to {rate_limiter.describe()}")
+    print()
+
+    options = GenerationOptions(
+        count=args.count,
+        max_retries=args.max_retries,
+        prompt_token_budget=args.prompt_token_budget,
+        cache=None if args.no_cache else ResponseCache(args.cache_dir, args.cache_max_mb * 1024 * 1024),
+        dedup_index=None if args.dedup == 'off' else DedupIndex(args.dedup_index),
+        dedup_threshold=args.dedup_threshold,
+        dedup_mode=args.dedup,
+        stream=args.stream,
+        rate_limiter=rate_limiter,
+        mode=args.mode,
+        bulk_poll_interval=args.bulk_poll_interval,
+        report_path=args.report,
+        validation=args.validation,
+        candidates=max(1, args.candidates),
+        answer_check=args.answer_check == 'on',
+    )
+    telemetry.run_info = {
+        'command': ' '.join(sys.argv[1:]),
+        'provider': provider.name,
+        'model': provider.model,
+        'mode': args.mode,
+        'concurrency': args.concurrency,
+        'count': args.count,
+        'stream': args.stream,
+        'candidates': args.candidates,
+        'cache': not args.no_cache,
+    }
+    return provider, options
+
+
+def plan_generation(runs: List[TopicRun], args: argparse.Namespace) -> RunPlan:
+    """--plan: build each pending node's first prompt and forecast the run (no provider is created)"""
+    simulated = args.provider in ('mock', 'replay')
+    plan = RunPlan(PROVIDERS[args.provider], args.mode,
+                   simulated_latency=args.mock_latency + args.mock_jitter / 2 if simulated else 0.0)
+    with telemetry.timer('plan'):
+        for run, node_id in build_work_queue(runs):
+            prompt = create_batch_generation_prompt(run.exemplars[node_id], args.count, run.node_numbers.get(node_id, 0),
+                                                    run.previous_question_texts, args.prompt_token_budget)
+            plan.add_node(estimate_tokens(prompt), args.count, MAX_OUTPUT_TOKENS, max(1, args.candidates),
+                          estimate_tokens(prompt.system), estimate_tokens(prompt.exemplar))
+
+    print(f"\n{'='*60}")
+    print(f"🧮 RUN PLAN (no API calls made)")
+    print(f"{'='*60}")
+    for line in plan.describe(args.concurrency, args.rpm, args.tpm):
+        print(f"   {line}")
+    print(f"   Retries and re-requested slots are extra; run without --plan to generate")
+    return plan
+
+
+def seed_dedup_index(index: Optional[DedupIndex], run: TopicRun):
+    """Sync the near-duplicate index with a topic's existing (and journaled) nodes"""
+    if index is None:
+        return
+    added = index.sync_topic(run.dedup_topic, run.node_question_texts())
+    if added:
+        print(f"🔎 Indexed {added} existing questions for near-duplicate detection ({len(index):,} total)")
+
+
+def run_generation(runs: List[TopicRun], provider: AIProvider, options: GenerationOptions, concurrency: int) -> int:
+    """Generate every pending node in the selected mode"""
+    if options.mode == 'bulk':
+        return generate_pending_nodes_bulk(runs, provider, options, concurrency)
+    return generate_pending_nodes(runs, provider, options, concurrency)
+
+
+def finish_generation(options: GenerationOptions):
+    """Persist run-wide state and print its summary lines"""
+    if options.cache:
+        print(f"   Response cache: {options.cache.summary()}")
+    if options.dedup_index is not None:
+        options.dedup_index.save()
+        print(f"   Near-duplicates: {options.dedup_index.summary()}")
+    if options.rate_limiter:
+        print(f"   Provider time: {options.rate_limiter.metrics.summary()}")
+    print(f"   ⏱️  Stage timings:")
+    for line in telemetry.summary_lines():
+        print(f"   {line}")
+    if options.report_path:
+        telemetry.write_report(options.report_path)
+        print(f"   📋 Run report: {options.report_path}")
+
+
+def exemplar_to_output_path(exemplar_file: str) -> str:
+    """Map a topic's exemplar file to its YAML output (x-exemplars.json -> x.yaml)"""
+    if not exemplar_file.endswith(EXEMPLAR_SUFFIX):
+        raise ValueError(f"Not an exemplar file (expected *{EXEMPLAR_SUFFIX}): {exemplar_file}")
+    return exemplar_file[:-len(EXEMPLAR_SUFFIX)] + '.yaml'
+
+
+def find_exemplar_files(inputs: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted list of exemplar files"""
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, f"*{EXEMPLAR_SUFFIX}")
+        found.update(path for path in glob.glob(pattern) if path.endswith(EXEMPLAR_SUFFIX))
+    return sorted(found)
+
+
+def batch_main(argv: List[str]):
+    """Generate every topic matched by a directory or glob in one process"""
+    parser = argparse.ArgumentParser(
+        prog='generate_questions.py batch',
+        description='Generate questions for many topics with one provider client and one work queue',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Regenerate every S2 and S3 topic, 6 nodes at a time, max 50 requests/min
+  python generate_questions.py batch ../S2/Maths ../S3/Maths --concurrency 6 --rpm 50
+
+  # Only the trigonometry topics
+  python generate_questions.py batch '../S*/Maths/*trigonometr*-exemplars.json'
+        """
+    )
+    parser.add_argument('inputs', nargs='+', help=f'Directories or glob patterns of *{EXEMPLAR_SUFFIX} files')
+    add_generation_arguments(parser)
+    args = parser.parse_args(argv)
+
+    exemplar_files = find_exemplar_files(args.inputs)
+    if not exemplar_files:
+        print(f"ERROR: No *{EXEMPLAR_SUFFIX} files found in: {', '.join(args.inputs)}")
+        sys.exit(1)
+
+    print(f"📚 Batch mode: {len(exemplar_files)} topics\n")
+
+    runs = []
+    for exemplar_file in exemplar_files:
+        output_file = exemplar_to_output_path(exemplar_file)
+        output_path = output_file if not args.test else output_file.replace('.yaml', '-TEST.yaml')
+
+        print(f"{'='*60}")
+        print(f"TOPIC: {os.path.basename(exemplar_file)}")
+        print(f"{'='*60}")
+        run = prepare_topic_run(exemplar_file, output_path, extract_topic_name(output_file), test=args.test,
+                                incremental=args.incremental, count=args.count)
+        runs.append(run)
+
+    if not any(run.pending_node_ids for run in runs):
+        print("✅ All topics already generated! Nothing to do.")
+        return
+    if args.plan:
+        plan_generation(runs, args)
+        return
+
+    # The provider is only created once there is work for it
+    provider, options = setup_generation(args)
+    for run in runs:
+        seed_dedup_index(options.dedup_index, run)
+
+    with telemetry.timer('generation'):
+        run_generation(runs, provider, options, args.concurrency)
+
+    # Materialize every topic that changed
+    for run in runs:
+        materialize_topic_output(run)
+    if args.compile:
+        compile_topics([run.output_path for run in runs if os.path.exists(run.output_path)])
+
+    print(f"\n{'='*60}")
+    print(f"📊 BATCH SUMMARY")
+    print(f"{'='*60}")
+    for run in runs:
+        status = '✓' if not run.failed else '⚠️ '
+        print(f"{status} {run.topic_name}: {run.generated} generated, {run.failed} failed, "
+              f"{run.total_nodes()} nodes / {run.total_questions()} questions in {run.output_path}")
+    print(f"\n   Topics: {len(runs)}")
+    print(f"   Newly generated nodes: {sum(run.generated for run in runs)}")
+    if any(run.stale_node_ids for run in runs):
+        print(f"   Regenerated stale nodes: {sum(run.refreshed for run in runs)}/{sum(len(run.stale_node_ids) for run in runs)}")
+    print(f"   Failed nodes: {sum(run.failed for run in runs)}")
+    finish_generation(options)
+
+
+def find_yaml_files(inputs: List[str]) -> List[str]:
+    """Expand directories (recursively) and glob patterns into a sorted list of topic YAML files"""
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*.yaml')
+        found.update(path for path in glob.glob(pattern, recursive=True) if path.endswith('.yaml'))
+    return sorted(found)
+
+
+def validate_main(argv: List[str]):
+    """Check every question in existing topic YAML files against the output contract"""
+    curriculum_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(
+        prog='generate_questions.py validate',
+        description='Validate generated questions (output contract and exemplar mathTool specs) in topic YAML files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every topic in the curriculum
+  python generate_questions.py validate
+
+  # One level, listing every problem
+  python generate_questions.py validate ../S3/Maths --verbose
+        """
+    )
+    parser.add_argument('inputs', nargs='*', default=[curriculum_root],
+                        help='YAML files, directories or glob patterns (default: all curriculum content)')
+    parser.add_argument('--verbose', action='store_true', help='List every problem, not just the counts per file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Files validated in parallel (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    yaml_files = find_yaml_files(args.inputs)
+    if not yaml_files:
+        print(f"ERROR: No YAML files found in: {', '.join(args.inputs)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    # Parsing dominates, so files are spread over processes rather than threads
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(yaml_files)))) as executor:
+        results = list(executor.map(validate_yaml_file, yaml_files))
+
+    total_questions = 0
+    rule_counts: Dict[str, int] = {}
+    for path, (checked, failures) in zip(yaml_files, results):
+        total_questions += checked
+        display_path = os.path.relpath(path)
+        if not failures:
+            print(f"✓ {display_path}: {checked} questions")
+            continue
+        file_rules: Dict[str, int] = {}
+        for _, _, issue in failures:
+            file_rules[issue.rule] = file_rules.get(issue.rule, 0) + 1
+            rule_counts[issue.rule] = rule_counts.get(issue.rule, 0) + 1
+        print(f"⚠️  {display_path}: {checked} questions, {len(failures)} problem(s) "
+              f"({', '.join(f'{count} {rule}' for rule, count in sorted(file_rules.items()))})")
+        if args.verbose:
+            for node_id, question_id, issue in failures:
+                print(f"     {node_id} {question_id}: {issue}")
+
+    print(f"\n📋 {len(yaml_files)} files, {total_questions:,} questions validated in {time.perf_counter() - start:.2f}s")
+    if rule_counts:
+        print(f"   Problems: {', '.join(f'{count} {rule}' for rule, count in sorted(rule_counts.items()))}")
+        sys.exit(1)
+    print("   ✅ No problems found")
+
+
+def compile_topics(yaml_files: List[str], force: bool = False, workers: int = 1, verbose: bool = True) -> List[Dict[str, Any]]:
+    """Build the compiled artifact of each topic YAML and update each directory's bank manifest"""
+    with telemetry.timer('compile'):
+        if workers > 1 and len(yaml_files) > 1:
+            # Parsing dominates, so files are spread over processes rather than threads
+            with ProcessPoolExecutor(max_workers=min(workers, len(yaml_files))) as executor:
+                entries = list(executor.map(compile_topic, yaml_files, [force] * len(yaml_files)))
+        else:
+            entries = [compile_topic(path, force) for path in yaml_files]
+
+    by_directory: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for path, entry in zip(yaml_files, entries):
+        by_directory.setdefault(os.path.dirname(path) or '.', {})[os.path.basename(path)] = entry
+        if verbose:
+            action = 'compiled' if entry['compiled'] else 'up to date'
+            print(f"📦 {os.path.relpath(path)} -> {entry['artifact']} ({action}: {entry['nodes']} nodes, "
+                  f"{entry['yamlBytes'] / 1024:.0f} KB -> {entry['bytes'] / 1024:.0f} KB, hash {entry['contentHash']})")
+    for directory, directory_entries in by_directory.items():
+        update_manifest(directory, directory_entries)
+    return entries
+
+
+def compile_main(argv: List[str]):
+    """Build compiled question-bank artifacts for existing topic YAML files"""
+    curriculum_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(
+        prog='generate_questions.py compile',
+        description=f'Build a compact *{ARTIFACT_SUFFIX} artifact (minified JSON, one line per node) per '
+                    'topic YAML, plus a bank-manifest.json with content hashes in each directory',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every topic in the curriculum (unchanged topics are skipped)
+  python generate_questions.py compile
+
+  # One level, rebuilding everything
+  python generate_questions.py compile ../S3/Maths --force
+        """
+    )
+    parser.add_argument('inputs', nargs='*', default=[curriculum_root],
+                        help='YAML files, directories or glob patterns (default: all curriculum content)')
+    parser.add_argument('--force', action='store_true', help='Rebuild artifacts even if their YAML is unchanged')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Files compiled in parallel (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    yaml_files = [path for path in find_yaml_files(args.inputs) if not path.endswith('-TEST.yaml')]
+    if not yaml_files:
+        print(f"ERROR: No YAML files found in: {', '.join(args.inputs)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    entries = compile_topics(yaml_files, args.force, args.workers)
+    compiled = sum(entry['compiled'] for entry in entries)
+    yaml_total = sum(entry['yamlBytes'] for entry in entries)
+    artifact_total = sum(entry['bytes'] for entry in entries)
+    print(f"\n📦 {len(entries)} topics ({compiled} compiled, {len(entries) - compiled} up to date) "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(f"   YAML {yaml_total / 1024:,.0f} KB -> artifacts {artifact_total / 1024:,.0f} KB, "
+          f"{sum(entry['questions'] for entry in entries):,} questions")
+
+
+def load_topic_questions(path: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """(node id, question id, question) for every question in a topic YAML"""
+    data = load_yaml_file(path) or {}
+    questions = []
+    for node in data.get('nodes') or []:
+        if not isinstance(node, dict):
+            continue
+        for position, question in enumerate((node.get('descriptor') or {}).get('preWrittenQuestions') or []):
+            if isinstance(question, dict):
+                questions.append((str(node.get('id')), str(question.get('id', f"#{position + 1}")), question))
+    return questions
+
+
+def verify_chunk(chunk: List[Tuple[str, str, Dict[str, Any]]]) -> Tuple[int, List[Tuple[str, str, List[Any]]]]:
+    """How many questions of a chunk could be checked, and (node id, question id, issues) for those whose
+    answers don't check out"""
+    checked, failures = 0, []
+    for node_id, question_id, question in chunk:
+        checkable, issues = check_answer(question)
+        checked += checkable
+        if issues:
+            failures.append((node_id, question_id, issues))
+    return checked, failures
+
+
+def verify_main(argv: List[str]):
+    """Recompute the answers of every question in existing topic YAML files"""
+    curriculum_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(
+        prog='generate_questions.py verify',
+        description='Recompute the arithmetic in each question\'s steps and check its finalAnswer against its '
+                    'mathTool parameters, across all questions in a process pool',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every topic in the curriculum
+  python generate_questions.py verify
+
+  # One grade, listing every wrong answer
+  python generate_questions.py verify ../S3/Maths --verbose
+        """
+    )
+    parser.add_argument('inputs', nargs='*', default=[curriculum_root],
+                        help='YAML files, directories or glob patterns (default: all curriculum content)')
+    parser.add_argument('--verbose', action='store_true', help='List every wrong answer, not just the counts per file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=200, help='Questions per verification task (default: 200)')
+    args = parser.parse_args(argv)
+
+    yaml_files = [path for path in find_yaml_files(args.inputs) if not path.endswith('-TEST.yaml')]
+    if not yaml_files:
+        print(f"ERROR: No YAML files found in: {', '.join(args.inputs)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    workers = max(1, args.workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        topics = list(executor.map(load_topic_questions, yaml_files))
+        loaded = time.perf_counter()
+        # Every question of every topic goes into one pool of chunks, so a big topic doesn't leave workers idle
+        chunks, owners = [], []
+        for path, questions in zip(yaml_files, topics):
+            for i in range(0, len(questions), max(1, args.chunk_size)):
+                chunks.append(questions[i:i + max(1, args.chunk_size)])
+                owners.append(path)
+        results = list(executor.map(verify_chunk, chunks))
+    verify_seconds = time.perf_counter() - loaded
+
+    failures_by_file: Dict[str, List[Tuple[str, str, List[Any]]]] = {path: [] for path in yaml_files}
+    checked_by_file: Dict[str, int] = {path: 0 for path in yaml_files}
+    for path, (checked, failures) in zip(owners, results):
+        checked_by_file[path] += checked
+        failures_by_file[path].extend(failures)
+    total_questions = sum(len(questions) for questions in topics)
+    for path, questions in zip(yaml_files, topics):
+        failures = failures_by_file[path]
+        display_path = os.path.relpath(path)
+        coverage = f"{len(questions)} questions, {checked_by_file[path]} checked"
+        if not failures:
+            print(f"✓ {display_path}: {coverage}")
+            continue
+        print(f"⚠️  {display_path}: {coverage}, {len(failures)} wrong answer(s)")
+        if args.verbose:
+            for node_id, question_id, issues in failures:
+                print(f"     {node_id} {question_id}: {'; '.join(map(str, issues))}")
+
+    total_seconds = time.perf_counter() - start
+    wrong = sum(len(failures) for failures in failures_by_file.values())
+    checked = sum(checked_by_file.values())
+    print(f"\n🔎 {len(yaml_files)} files, {total_questions:,} questions verified in {total_seconds:.2f}s "
+          f"({total_questions / max(total_seconds, 1e-9):,.0f} questions/sec; "
+          f"{total_questions / max(verify_seconds, 1e-9):,.0f}/sec excluding YAML parsing; workers: {workers})")
+    # Coverage, not a verdict: questions without arithmetic or a determining mathTool can't be checked locally
+    print(f"   Checked: {checked:,} ({checked / max(total_questions, 1):.0%}), "
+          f"not checkable: {total_questions - checked:,}, mismatched: {wrong}")
+    if wrong:
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'validate':
+        validate_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        compile_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'verify':
+        verify_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description='Generate practice questions from exemplars',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -421,6 +1837,24 @@ Examples:
 
   # Resume after crash (auto-detects and skips completed nodes)
   python generate_questions.py ../S3/Maths/s3-math-sets-venn-diagrams-exemplars.json ../S3/Maths/s3-math-sets-venn-diagrams.yaml --nodes all
+
+  # Generate 4 nodes at a time
+  python generate_questions.py ../S3/Maths/s3-math-trigonometry-exemplars.json ../S3/Maths/s3-math-trigonometry.yaml --concurrency 4
+
+  # Forecast tokens, cost and run time without calling the provider
+  python generate_questions.py ../S3/Maths/s3-math-trigonometry-exemplars.json ../S3/Maths/s3-math-trigonometry.yaml --plan --concurrency 4
+
+  # Every topic in a directory (see: python generate_questions.py batch --help)
+  python generate_questions.py batch ../S2/Maths ../S3/Maths --concurrency 6
+
+  # Check existing YAML files (see: python generate_questions.py validate --help)
+  python generate_questions.py validate ../S3/Maths
+
+  # Compiled question-bank artifacts (see: python generate_questions.py compile --help)
+  python generate_questions.py compile ../S3/Maths
+
+  # Recompute the answers in existing YAML files (see: python generate_questions.py verify --help)
+  python generate_questions.py verify ../S3/Maths
         """
     )
 
@@ -430,129 +1864,57 @@ Examples:
 
     # Optional arguments
     parser.add_argument('--nodes', default='all', help='Node IDs to generate (comma-separated) or "all" (default: all)')
-    parser.add_argument('--test', action='store_true', help='Test mode: generate only first 3 nodes')
-    parser.add_argument('--count', type=int, default=5, help='Questions per node (default: 5)')
-    parser.add_argument('--max-retries', type=int, default=3, help='Maximum retry attempts per question (default: 3)')
-    parser.add_argument('--provider', default='gemini', choices=['claude', 'gemini'],
-                        help='AI provider to use (default: gemini)')
+    add_generation_arguments(parser)
 
     args = parser.parse_args()
 
-    # Initialize AI provider
-    print(f"Initializing AI provider: {args.provider}")
-    initialize_ai_provider(args.provider)
-    print()
-
-    # Load exemplars
-    print("Loading exemplar templates...")
-    exemplars = load_exemplars(args.exemplar_file)
-    print(f"Loaded {len(exemplars)} node templates\n")
-
     # Determine output path (handle test mode)
     output_path = args.output_file if not args.test else args.output_file.replace('.yaml', '-TEST.yaml')
 
-    # Load existing YAML if resuming
-    print("Checking for existing progress...")
-    existing_yaml = load_existing_yaml(output_path)
-    completed_node_ids = get_completed_node_ids(existing_yaml)
-
-    if completed_node_ids:
-        print(f"📂 Found existing file with {len(completed_node_ids)} completed nodes")
-        print(f"   Completed: {', '.join(completed_node_ids[:5])}{'...' if len(completed_node_ids) > 5 else ''}")
-        print(f"   Will skip these and continue from where we left off\n")
-    else:
-        print("   No existing file found - starting fresh\n")
-
-    # Determine which nodes to generate
-    if args.test:
-        node_ids = list(exemplars.keys())[:3]
-        print(f"TEST MODE: Generating for first 3 nodes only")
-    elif args.nodes == 'all':
-        node_ids = list(exemplars.keys())
-    else:
-        node_ids = [n.strip() for n in args.nodes.split(',')]
-
-    # Filter out already-completed nodes
-    node_ids_to_generate = [nid for nid in node_ids if nid not in completed_node_ids]
-
-    if not node_ids_to_generate:
-        print("✅ All requested nodes already generated! Nothing to do.")
-        print(f"   Delete {output_path} to regenerate from scratch.")
-        return
-
-    print(f"🔄 {len(node_ids_to_generate)} nodes remaining to generate")
-    print(f"   (Total requested: {len(node_ids)}, Already done: {len(completed_node_ids)})\n")
-
-    # Start with existing nodes
-    all_nodes = existing_yaml.get('nodes', [])
-
-    # NEW: Accumulate all previously generated question texts for anti-repetition
-    all_previous_question_texts = []
-    for node in all_nodes:
-        for q in node.get('descriptor', {}).get('preWrittenQuestions', []):
-            question_text = q.get('problemText', '')
-            if question_text:
-                all_previous_question_texts.append(question_text)
-
-    if all_previous_question_texts:
-        print(f"📝 Loaded {len(all_previous_question_texts)} previous questions for anti-repetition\n")
-
     # Extract topic name for YAML header
     topic_name = extract_topic_name(args.output_file)
 
-    # Auto-save configuration (save after every node)
-    SAVE_INTERVAL = 1
-    nodes_since_last_save = 0
-
-    # Generate questions for each remaining node
-    for idx, node_id in enumerate(node_ids_to_generate, start=len(completed_node_ids) + 1):
-        if node_id not in exemplars:
-            print(f"⚠️  Node {node_id} not found in exemplars, skipping...")
-            continue
+    run = prepare_topic_run(args.exemplar_file, output_path, topic_name, args.nodes, args.test,
+                            args.incremental, args.count)
+    if not run.pending_node_ids:
+        return
+    if args.plan:
+        plan_generation([run], args)
+        return
 
-        exemplar = exemplars[node_id]
+    # Initialize AI provider (only once there is work for it)
+    provider, options = setup_generation(args)
+    seed_dedup_index(options.dedup_index, run)
 
-        # Pass all previous question texts for anti-repetition
-        questions = generate_node_questions(node_id, exemplar, idx, args.provider, args.count, args.max_retries, all_previous_question_texts)
+    if args.concurrency > 1:
+        print(f"⚡ Generating up to {args.concurrency} nodes concurrently\n")
 
-        if questions:
-            yaml_node = create_yaml_node(node_id, idx, exemplar, questions)
-            all_nodes.append(yaml_node)
-            nodes_since_last_save += 1
+    with telemetry.timer('generation'):
+        run_generation([run], provider, options, args.concurrency)
+    completed_node_ids = run.completed_node_ids
 
-            # NEW: Add newly generated question texts to accumulator for next node
-            for q in questions:
-                question_text = q.get('problemText', '')
-                if question_text:
-                    all_previous_question_texts.append(question_text)
-
-            # Auto-save after each node
-            if nodes_since_last_save >= SAVE_INTERVAL:
-                print(f"\n{'='*60}")
-                print(f"💾 Auto-saving progress ({len(all_nodes)} nodes completed)...")
-                print(f"{'='*60}")
-                save_yaml_incremental(output_path, all_nodes, topic_name)
-                nodes_since_last_save = 0
-                print(f"✓ Progress saved to {output_path}")
-                print(f"✓ Safe to resume if interrupted!\n")
-
-    # Final save (if there were any unsaved nodes or if nothing was saved yet)
+    # Write the YAML once from the journaled nodes
     print(f"\n{'='*60}")
     print(f"💾 Saving final output...")
     print(f"{'='*60}\n")
-    save_yaml_incremental(output_path, all_nodes, topic_name)
+    materialize_topic_output(run)
+    if args.compile and os.path.exists(output_path):
+        compile_topics([output_path])
 
     # Calculate newly generated nodes
-    newly_generated = len(all_nodes) - len(completed_node_ids)
+    newly_generated = run.total_nodes() - len(completed_node_ids)
 
     print(f"\n✅ SUCCESS!")
-    print(f"   Total nodes in file: {len(all_nodes)}")
+    print(f"   Total nodes in file: {run.total_nodes()}")
     print(f"   Newly generated: {newly_generated}")
-    print(f"   Total questions: {sum(len(n['descriptor'].get('preWrittenQuestions', [])) for n in all_nodes)}")
+    if run.stale_node_ids:
+        print(f"   Regenerated stale nodes: {run.refreshed}/{len(run.stale_node_ids)}")
+    print(f"   Total questions: {run.total_questions()}")
     print(f"   Output file: {output_path}")
+    finish_generation(options)
     print(f"\nNext steps:")
     print(f"1. Review the generated questions in {output_path}")
-    print(f"2. Validate mathTool parameters")
+    print(f"2. Spot-check the answers the verifier can't recompute (python generate_questions.py verify {output_path})")
     print(f"3. Check for pedagogical quality")
     if args.test:
         print(f"4. If good, run without --test flag to generate all nodes")
@@ -0,0 +1,126 @@
+"""
+Incremental JSON Array Parser for Streamed Question Batches
+
+Providers return a batch as a JSON array of question objects. When streaming,
+JsonArrayStream is fed the text chunk by chunk and hands back each object as
+soon as its closing brace arrives, so questions can be validated while the
+model is still writing the rest - and the stream abandoned at the first sign
+of trouble instead of after the full completion.
+
+Accepted framing: optional whitespace and an optional markdown code fence
+(```json) before the '['; anything after the closing ']' is ignored.
+"""
+
+import json
+from typing import Any, List
+
+
+class StreamFormatError(ValueError):
+    """The streamed text can no longer become a JSON array of objects"""
+
+
+class JsonArrayStream:
+    """Feed text chunks, get back completed top-level objects of the array"""
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0            # Next character to scan
+        self._started = False    # Seen the opening '['
+        self.done = False        # Seen the closing ']'
+        self._depth = 0          # Nesting depth inside the current element
+        self._in_string = False
+        self._escaped = False
+        self._element_start = -1
+        self._expect_value = True  # After '[' or ',' (vs. after an element)
+        self._count = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add a chunk; return the objects completed by it (raises StreamFormatError)"""
+        if self.done:
+            return []
+        self._text += chunk
+        if not self._started and not self._skip_preamble():
+            return []
+        return self._scan()
+
+    def finish(self):
+        """Call when the stream ends; raises StreamFormatError if the array never closed"""
+        if not self.done:
+            raise StreamFormatError(f"Stream ended before the array was closed ({self._count} complete objects)")
+
+    def _skip_preamble(self) -> bool:
+        """Advance past whitespace/code fence to the '['; False if more text is needed"""
+        text = self._text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if char.isspace():
+                self._pos += 1
+            elif text.startswith('```', self._pos):
+                newline = text.find('\n', self._pos)
+                if newline == -1:
+                    return False  # Wait for the rest of the fence line
+                self._pos = newline + 1
+            elif '```'.startswith(text[self._pos:]):
+                return False  # Possibly the start of a fence
+            elif char == '[':
+                self._pos += 1
+                self._started = True
+                return True
+            else:
+                raise StreamFormatError(f"Expected a JSON array, got {text[self._pos:self._pos + 40]!r}")
+        return False
+
+    def _scan(self) -> List[Any]:
+        completed = []
+        text = self._text
+        pos = self._pos
+        while pos < len(text):
+            char = text[pos]
+
+            if self._depth == 0:
+                # Between elements of the top-level array
+                if char.isspace():
+                    pass
+                elif char == '{' and self._expect_value:
+                    self._element_start = pos
+                    self._depth = 1
+                elif char == ']' and (not self._expect_value or self._count == 0):
+                    self.done = True
+                    pos += 1
+                    break
+                elif char == ',' and not self._expect_value:
+                    self._expect_value = True
+                else:
+                    raise StreamFormatError(f"Unexpected {char!r} after {self._count} objects")
+
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    element_text = text[self._element_start:pos + 1]
+                    try:
+                        completed.append(json.loads(element_text))
+                    except json.JSONDecodeError as e:
+                        raise StreamFormatError(f"Object {self._count + 1} is not valid JSON: {e}")
+                    self._count += 1
+                    self._expect_value = False
+            pos += 1
+
+        # Drop text that has been fully consumed
+        keep_from = self._element_start if self._depth > 0 else pos
+        self._text = text[keep_from:]
+        self._pos = pos - keep_from
+        if self._depth > 0:
+            self._element_start = 0
+        return completed
@@ -0,0 +1,88 @@
+"""
+Append-Only Node Journal for the Question Generator
+
+While a topic is being generated, every completed node is appended to a JSONL
+journal next to the output YAML (one fsync'd line per node) instead of
+re-dumping the whole YAML file. The YAML is materialized once at the end of the
+run, after which the journal is removed. If the run crashes, the next run
+replays the journal and continues from there.
+
+A crash mid-append can only damage the last line, which replay drops (and
+compacts away with an atomic rename) - earlier nodes are never at risk.
+"""
+
+import json
+import os
+import tempfile
+from typing import Dict, List
+
+
+def journal_path_for(output_path: str) -> str:
+    """Journal location for an output YAML (hidden sidecar in the same directory)"""
+    directory, filename = os.path.split(output_path)
+    return os.path.join(directory, f".{filename}.journal.jsonl")
+
+
+def _default_file_mode() -> int:
+    """Permissions a plain open(path, 'w') would create (mkstemp always uses 0600)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_file_atomic(path: str, content: str):
+    """Write via a temp file in the same directory, fsync, then os.replace (never leaves a half-written file)"""
+    directory = os.path.dirname(path) or '.'
+    mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else _default_file_mode()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def append_journal_entry(journal_path: str, node: Dict):
+    """Durably append one completed node to the journal"""
+    line = json.dumps({'node': node}, ensure_ascii=False) + "\n"
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def replay_journal(journal_path: str) -> List[Dict]:
+    """Return the nodes recorded in a journal (empty if there is none)"""
+    if not os.path.exists(journal_path):
+        return []
+
+    nodes = []
+    valid_lines = []
+    damaged = False
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                nodes.append(json.loads(line)['node'])
+                valid_lines.append(line if line.endswith("\n") else line + "\n")
+            except (json.JSONDecodeError, KeyError):
+                # Torn write from a crash - everything after it is unreliable
+                damaged = True
+                break
+
+    if damaged:
+        print(f"⚠️  Dropped a partially written entry from {journal_path}")
+        write_file_atomic(journal_path, ''.join(valid_lines))
+
+    return nodes
+
+
+def remove_journal(journal_path: str):
+    """Delete the journal once its nodes are safely in the YAML output"""
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
@@ -0,0 +1,283 @@
+"""
+Prompt Assembly for the Question Generator
+
+A PromptBuilder is created once per node. Everything that only depends on the
+exemplar (node info, exemplar problems, variation rules, mathTool spec,
+guidelines) is rendered in the constructor, so retries only re-assemble the
+parts that change: the question count, the anti-repetition list, the
+questions a retry must avoid (already accepted, or rejected as near-duplicates)
+and the validation problems that got earlier questions rejected.
+
+Prompts are laid out for provider-side prompt caching: a stable prefix, then
+the parts that change from call to call. A built prompt is a Prompt (a str,
+so caching, recording and rate limiting treat it as plain text) that also
+carries its three sections:
+
+- system:   the role, output contract and currency/LaTeX rules - the same for
+            every node of every topic (the question count is not in it)
+- exemplar: the node's exemplar block - the same for every call of a node
+- suffix:   the count, anti-repetition list, exclusions and corrections
+
+Providers that support it cache system + exemplar (see providers.py).
+
+The anti-repetition list is sized by a token budget instead of a fixed number
+of questions: the most recent previous questions are added until the prompt
+would exceed the budget. Token counts are estimated locally (no tokenizer
+dependency) at ~3.5 characters per token, which errs on the high side for the
+mix of English and LaTeX in our prompts.
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 4000
+QUESTION_PREVIEW_CHARS = 200  # Previous questions are truncated to this length
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough local token estimate (no tokenizer needed)"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class Prompt(str):
+    """A prompt's full text, with the cacheable sections it was assembled from"""
+
+    def __new__(cls, system: str, exemplar: str, suffix: str):
+        prompt = super().__new__(cls, system + exemplar + suffix)
+        prompt.system, prompt.exemplar, prompt.suffix = system, exemplar, suffix
+        return prompt
+
+
+@dataclass
+class PromptStats:
+    """Size and assembly cost of the last prompt a builder produced"""
+    chars: int = 0
+    estimated_tokens: int = 0
+    build_ms: float = 0.0
+    previous_included: int = 0
+    previous_available: int = 0
+    prefix_tokens: int = 0  # Estimated tokens in the cacheable system + exemplar prefix
+
+
+class PromptBuilder:
+    """Builds batch-generation prompts for one exemplar within a token budget"""
+
+    def __init__(self, exemplar: Dict[str, Any], token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.last_stats = PromptStats()
+
+        node_parts = [
+            "# NODE INFORMATION\n",
+            f"**Title**: {exemplar['title']}\n",
+            f"**Learning Focus**: {', '.join(exemplar['learningFocus'])}\n",
+            f"**Section**: {exemplar['section']}\n",
+            "\n# EXEMPLAR PROBLEMS (USE AS TEMPLATES, DO NOT COPY)\n",
+        ]
+        for ex in exemplar['exemplarProblems']:
+            node_parts.append(f"\nProblem: {ex['problemText']}\n")
+            if 'correctAnswer' in ex:
+                node_parts.append(f"Answer: {json.dumps(ex['correctAnswer'], indent=2)}\n")
+
+        node_parts.append(f"""
+# VARIATION RULES
+Apply these rules when generating variations:
+
+**Available Options**:
+{json.dumps(exemplar.get('variationRules', {}), indent=2)}
+
+# MATHTOOL SPECIFICATION
+{json.dumps(exemplar.get('mathTool'), indent=2)}
+
+# GENERATION GUIDELINES
+{chr(10).join('- ' + g for g in exemplar.get('generationGuidelines', []))}
+""")
+        self._node_section = ''.join(node_parts)
+
+    @staticmethod
+    def _diversity_header(count: int) -> str:
+        return f"""
+# THIS REQUEST
+
+You are generating {count} diverse practice problems for this node.
+
+# CRITICAL DIVERSITY REQUIREMENTS (FOR BATCH OF {count} QUESTIONS)
+
+**YOU MUST GENERATE {count} QUESTIONS THAT ARE SUBSTANTIALLY DIFFERENT:**
+"""
+
+    @staticmethod
+    def _anti_repetition(questions: List[str]) -> str:
+        parts = [f"""
+
+# ANTI-REPETITION: PREVIOUSLY GENERATED QUESTIONS
+
+**CRITICAL**: The following {len(questions)} questions have ALREADY been generated in previous nodes of this topic.
+
+"""]
+        for i, question in enumerate(questions, 1):
+            parts.append(f"{i}. {question}\n\n")
+        parts.append(f"""
+**YOU MUST NOT repeat contexts/scenarios from above questions:**
+- Review the {len(questions)} questions above carefully
+- Identify which contexts/scenarios were used
+- Try to use DIFFERENT contexts for this batch
+- Rotate through ALL available variation options in the exemplar
+
+""")
+        return ''.join(parts)
+
+    @staticmethod
+    def _closing(count: int) -> str:
+        return f"\n\nGenerate {count} diverse questions now (a JSON array of exactly {count} questions):"
+
+    @staticmethod
+    def _system_section() -> str:
+        return f"""You are generating diverse practice problems for Secondary 3 students.
+Each request describes one curriculum node (node information, exemplar problems,
+variation rules, mathTool specification, generation guidelines), followed by how
+many questions to generate and which questions to avoid.
+
+# REQUIRED OUTPUT FORMAT
+
+Return a JSON array with exactly the number of questions requested:
+
+[
+  {{
+    "problemText": "Question 1 with unique context A...",
+    "avatarIntro": "Encouraging 1-2 sentence intro (ONLY for question 1). This is for TTS service. CRITICAL: It can have only plain text",
+    "mathTool": {{
+      "toolName": "exact tool name from the node's MATHTOOL SPECIFICATION",
+      "parameters": {{ ... exact parameters for this specific problem }}
+    }},
+    "finalAnswer": "The correct answer",
+    "stepByStepGuideline": [
+      "Step 1: Clear explanation...",
+      "Step 2: Next step...",
+      "Step 3: Continue..."
+    ]
+  }},
+  {{
+    "problemText": "Question 2 with DIFFERENT context B...",
+    "mathTool": {{ ... }},
+    "finalAnswer": "...",
+    "stepByStepGuideline": ["...", "...", "..."]
+  }},
+  {{
+    "problemText": "Question 3 with DIFFERENT context C...",
+    "mathTool": {{ ... }},
+    "finalAnswer": "...",
+    "stepByStepGuideline": ["...", "...", "..."]
+  }}
+  ... continue for all requested questions
+]
+
+**CRITICAL RULES**:
+- Return ONLY valid JSON array (no markdown, no code blocks, no extra text)
+- Each question must be mathematically correct
+- avatarIntro ONLY in first question and PLAIN TEXT ONLY (omit from others)
+- mathTool.toolName must exactly match specification
+- Ensure MAXIMUM diversity - use ALL available variation options
+
+**CRITICAL FORMATTING - CURRENCY & LATEX**:
+- CURRENCY: For money amounts, use \\$ (backslash-dollar) so it renders as $
+  - WRONG: "costs $25" ← unescaped $ triggers LaTeX mode, garbles text
+  - CORRECT: "costs \\$25" ← renders properly as: costs $25
+- LATEX: Use $...$ ONLY for complex math expressions (fractions, square roots)
+  - For fractions: $\\frac{{1}}{{2}}$ renders as ½
+  - Simple symbols: Use Unicode instead (×, ÷, °, θ, π)
+
+"""
+
+    @staticmethod
+    def _exclusions(questions: List[str]) -> str:
+        parts = ["""
+
+# QUESTIONS TO AVOID
+
+The following questions are already in this node or were rejected as near-duplicates.
+Do NOT produce these or close variants of them:
+
+"""]
+        for i, question in enumerate(questions, 1):
+            parts.append(f"{i}. {question}\n\n")
+        parts.append("Use clearly different contexts, wording and numbers.\n")
+        return ''.join(parts)
+
+    @staticmethod
+    def _corrections(problems: List[str]) -> str:
+        parts = ["""
+
+# PROBLEMS WITH REJECTED QUESTIONS
+
+Earlier questions for this node were rejected for these reasons. Make sure the new ones do not repeat them:
+
+"""]
+        for problem in problems:
+            parts.append(f"- {problem}\n")
+        return ''.join(parts)
+
+    def _select_previous(self, previous_questions: List[str], available_tokens: int) -> List[str]:
+        """Most recent previous questions (truncated) that fit in the remaining budget, oldest first"""
+        # Fixed cost of the section wrapper with no questions in it
+        remaining = available_tokens - estimate_tokens(self._anti_repetition([]))
+        selected = []
+        for question in reversed(previous_questions):
+            preview = question[:QUESTION_PREVIEW_CHARS] + "..." if len(question) > QUESTION_PREVIEW_CHARS else question
+            cost = estimate_tokens(f"{len(selected) + 1}. {preview}\n\n")
+            if cost > remaining:
+                break
+            selected.append(preview)
+            remaining -= cost
+        selected.reverse()
+        return selected
+
+    def build(self, count: int, previous_questions: Optional[List[str]] = None,
+              exclusions: Optional[List[str]] = None, corrections: Optional[List[str]] = None) -> str:
+        """Assemble the full prompt for a batch of count questions.
+
+        exclusions and corrections are always included in full (they are few, and the reason for the call).
+        """
+        start = time.perf_counter()
+
+        exclusion_section = self._exclusions(exclusions) if exclusions else ''
+        correction_section = self._corrections(corrections) if corrections else ''
+        # Everything that varies between calls goes after the cacheable system + exemplar prefix
+        suffix_parts = [self._diversity_header(count), None, exclusion_section, correction_section,
+                        self._closing(count)]
+        fixed_tokens = (estimate_tokens(SYSTEM_SECTION) + estimate_tokens(self._node_section)
+                        + sum(estimate_tokens(part) for part in suffix_parts if part))
+
+        recent_questions = []
+        if previous_questions:
+            recent_questions = self._select_previous(previous_questions, self.token_budget - fixed_tokens)
+        suffix_parts[1] = self._anti_repetition(recent_questions) if recent_questions else ''
+
+        prompt = Prompt(SYSTEM_SECTION, self._node_section, ''.join(suffix_parts))
+        self.last_stats = PromptStats(
+            chars=len(prompt),
+            estimated_tokens=estimate_tokens(prompt),
+            build_ms=(time.perf_counter() - start) * 1000,
+            previous_included=len(recent_questions),
+            previous_available=len(previous_questions or []),
+            prefix_tokens=estimate_tokens(SYSTEM_SECTION + self._node_section),
+        )
+        return prompt
+
+    def describe_last(self) -> str:
+        """One-line summary of the last prompt for progress output"""
+        stats = self.last_stats
+        line = f"~{stats.estimated_tokens:,} tokens ({stats.chars:,} chars), built in {stats.build_ms:.2f} ms"
+        if stats.previous_available:
+            line += f", {stats.previous_included}/{stats.previous_available} previous questions"
+        if stats.prefix_tokens:
+            line += f", ~{stats.prefix_tokens:,} in the cacheable prefix"
+        if stats.estimated_tokens > self.token_budget:
+            line += f" ⚠️  over {self.token_budget:,}-token budget"
+        return line
+
+
+# Rendered once: byte-identical in every prompt, so providers can cache it across nodes and topics
+SYSTEM_SECTION = PromptBuilder._system_section()
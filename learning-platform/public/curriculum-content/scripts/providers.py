@@ -0,0 +1,780 @@
+"""
+AI Provider Backends for the Question Generator
+
+Every backend implements the same AIProvider interface, so generate_questions.py
+never needs to know which SDK (if any) sits behind a call:
+
+- claude: Anthropic Messages API
+- gemini: Google Generative AI
+- mock:   synthesizes well-formed question batches locally (no network, no keys)
+- replay: serves responses previously captured with --record-file
+
+mock and replay both support simulated latency and failure rates, so throughput,
+retry behaviour and parsing cost can be measured on an offline machine.
+
+Providers can also stream: stream() returns a ProviderStream of text chunks
+(claude and gemini use their SDK's streaming API, mock trickles its output,
+everything else falls back to a single chunk from generate()).
+
+For bulk runs, submit_bulk()/bulk_done()/bulk_results() go through the
+provider's asynchronous batch endpoint (Anthropic Message Batches, Gemini Batch
+Mode). mock and replay run an in-process stand-in job so the bulk path can be
+exercised offline.
+
+SDKs are imported lazily: creating a claude/gemini provider only checks the
+API key and that the package is installed; the SDK is imported and its client
+built on the first call, so runs with nothing to generate (and --plan) never
+pay the import.
+
+Prompts built by prompt_builder.py carry a stable prefix (system instructions,
+then the node's exemplar block) ahead of the per-call suffix. claude sends them
+as a cached system block and a cached user block (cache_control breakpoints),
+gemini as an explicit context cache of the prefix (falling back to
+system_instruction + implicit caching when one can't be created), and the
+simulated providers mimic a prefix cache. Cached prompt tokens are reported in
+ProviderResponse.cached_input_tokens.
+
+Each backend also carries its list prices and a rough latency model (call
+overhead + output decode speed), used by --plan to forecast cost and run time.
+"""
+
+import datetime
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from answer_verifier import ANGLE_TOOLS, expected_values
+
+
+class ProviderError(Exception):
+    """Raised when a provider can't be configured or a call fails.
+
+    kind is an error class from rate_limit (e.g. 'rate_limit', 'transient') when known.
+    """
+
+    def __init__(self, message: str, kind: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+@dataclass
+class ProviderResponse:
+    """Raw completion text plus token usage reported by the provider"""
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0  # Part of input_tokens served from the provider's prompt cache
+
+
+@dataclass
+class BulkResult:
+    """Outcome of one request in a provider batch job (response or error)"""
+    response: Optional[ProviderResponse] = None
+    error: Optional[str] = None
+
+
+class ProviderStream:
+    """A completion arriving as text chunks; usage is filled in by the provider when the stream ends"""
+
+    def __init__(self):
+        self.chunks: Optional[Iterator[str]] = None
+        self.parts: List[str] = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_input_tokens = 0
+        self.finished = False
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.chunks:
+            self.parts.append(chunk)
+            yield chunk
+        self.finished = True
+
+    def close(self):
+        """Stop receiving (closes the underlying connection if the stream is still open)"""
+        if not self.finished and hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+    @property
+    def response(self) -> ProviderResponse:
+        """Everything received so far"""
+        return ProviderResponse(text=''.join(self.parts), input_tokens=self.input_tokens,
+                                output_tokens=self.output_tokens, cached_input_tokens=self.cached_input_tokens)
+
+
+class AIProvider:
+    """Base class for all generation backends"""
+
+    name = ''
+    model = ''
+    display_name = ''
+    # Forecasting (--plan): USD per million tokens, batch API price factor, rough latency model
+    input_price_per_mtok = 0.0
+    output_price_per_mtok = 0.0
+    bulk_price_factor = 1.0
+    cache_read_price_factor = 1.0  # Price of a prompt token read from the prompt cache, relative to input
+    min_cache_tokens = 0  # Shortest prefix the provider will cache
+    call_overhead_seconds = 0.0
+    output_tokens_per_second = 0.0  # 0: output takes no time (offline backends)
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        """Send one prompt and return the completion"""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        """Send one prompt and stream the completion (default: a single chunk from generate())"""
+        stream = ProviderStream()
+        stream.chunks = self._generate_chunks(stream, prompt, temperature, max_tokens)
+        return stream
+
+    def _generate_chunks(self, stream: ProviderStream, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        response = self.generate(prompt, temperature, max_tokens)
+        stream.input_tokens, stream.output_tokens = response.input_tokens, response.output_tokens
+        stream.cached_input_tokens = response.cached_input_tokens
+        yield response.text
+
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        """Submit {request_id: prompt} to the provider's batch API; returns a job id"""
+        raise ProviderError(f"{self.display_name} has no batch API", kind='fatal')
+
+    def bulk_done(self, job_id: str) -> bool:
+        """Whether a batch job has finished processing (successfully or not)"""
+        raise NotImplementedError
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        """Results of a finished batch job by request id (missing ids were not processed)"""
+        raise NotImplementedError
+
+
+def _api_key(*env_vars: str) -> Optional[str]:
+    """Return the first API key found in the given environment variables"""
+    for var in env_vars:
+        if os.environ.get(var):
+            return os.environ[var]
+    return None
+
+
+def _sdk_installed(module: str) -> bool:
+    """Whether an SDK can be imported, without importing it (that happens on the first call)"""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:  # Parent package missing (e.g. no google namespace at all)
+        return False
+
+
+def prompt_sections(prompt: str) -> Tuple[str, str, str]:
+    """(system, exemplar, rest) of a prompt_builder.Prompt; a plain string is all rest"""
+    system, exemplar = getattr(prompt, 'system', ''), getattr(prompt, 'exemplar', '')
+    return system, exemplar, str(prompt)[len(system) + len(exemplar):]
+
+
+def prompt_hash(prompt: str) -> str:
+    """Stable identifier for a prompt (used to match recordings to replays)"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class ClaudeProvider(AIProvider):
+    name = 'claude'
+    model = 'claude-sonnet-4-5-20250929'
+    display_name = 'Claude Sonnet 4.5'
+    input_price_per_mtok = 3.0
+    output_price_per_mtok = 15.0
+    bulk_price_factor = 0.5
+    cache_read_price_factor = 0.1
+    min_cache_tokens = 1024
+    call_overhead_seconds = 2.0
+    output_tokens_per_second = 60.0
+
+    def __init__(self, **options):
+        api_key = _api_key('CLAUDE_API_KEY', 'VITE_CLAUDE_API_KEY')
+        if not api_key:
+            raise ProviderError("CLAUDE_API_KEY or VITE_CLAUDE_API_KEY environment variable not set\n"
+                                "Set it with: export CLAUDE_API_KEY='your-key-here'")
+        if not _sdk_installed('anthropic'):
+            raise ProviderError("anthropic package not installed. Install with: pip install anthropic")
+        self.api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The SDK client, imported and built on first use (worker threads share one)"""
+        with self._client_lock:
+            if self._client is None:
+                import anthropic
+                # Retries are handled by generate_questions (shared limiter, Retry-After aware), not the SDK
+                self._client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
+            return self._client
+
+    def _message_params(self, prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Messages API parameters, with cache breakpoints after the system block and the exemplar block"""
+        params: Dict[str, Any] = {'model': self.model, 'max_tokens': max_tokens, 'temperature': temperature}
+        system, exemplar, rest = prompt_sections(prompt)
+        if not system:
+            params['messages'] = [{"role": "user", "content": prompt}]
+            return params
+        # The system block is shared by every node; system + exemplar by every call of one node
+        params['system'] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        content = [{"type": "text", "text": exemplar, "cache_control": {"type": "ephemeral"}}] if exemplar else []
+        content.append({"type": "text", "text": rest})
+        params['messages'] = [{"role": "user", "content": content}]
+        return params
+
+    @staticmethod
+    def _response(message: Any) -> ProviderResponse:
+        usage = message.usage
+        # input_tokens excludes cache reads and writes; they are added back so every provider reports the full prompt
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        return ProviderResponse(
+            text=message.content[0].text.strip(),
+            input_tokens=usage.input_tokens + cache_read + cache_write,
+            output_tokens=usage.output_tokens,
+            cached_input_tokens=cache_read,
+        )
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        message = self.client.messages.create(**self._message_params(prompt, temperature, max_tokens))
+        return self._response(message)
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        stream = ProviderStream()
+        stream.chunks = self._stream_chunks(stream, prompt, temperature, max_tokens)
+        return stream
+
+    def _stream_chunks(self, stream: ProviderStream, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        # Closing this generator exits the context manager, which closes the HTTP stream
+        with self.client.messages.stream(**self._message_params(prompt, temperature, max_tokens)) as response:
+            for text in response.text_stream:
+                yield text
+            message = response.get_final_message()
+        usage = self._response(message)
+        stream.input_tokens, stream.output_tokens = usage.input_tokens, usage.output_tokens
+        stream.cached_input_tokens = usage.cached_input_tokens
+
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        batch = self.client.messages.batches.create(requests=[
+            {"custom_id": request_id, "params": self._message_params(prompt, temperature, max_tokens)}
+            for request_id, prompt in requests.items()
+        ])
+        return batch.id
+
+    def bulk_done(self, job_id: str) -> bool:
+        return self.client.messages.batches.retrieve(job_id).processing_status == 'ended'
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        results = {}
+        for entry in self.client.messages.batches.results(job_id):
+            if entry.result.type == 'succeeded':
+                results[entry.custom_id] = BulkResult(response=self._response(entry.result.message))
+            else:
+                # errored / canceled / expired
+                results[entry.custom_id] = BulkResult(error=entry.result.type)
+        return results
+
+
+GEMINI_CONTEXT_CACHE_TTL = datetime.timedelta(minutes=10)
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = 120.0  # After a failed cache creation, before trying that prefix again
+GEMINI_BATCH_DONE_STATES = {'JOB_STATE_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'}
+
+
+class GeminiProvider(AIProvider):
+    name = 'gemini'
+    model = 'gemini-3-flash-preview'
+    display_name = 'Gemini Flash 3 Preview'
+    input_price_per_mtok = 0.5
+    output_price_per_mtok = 3.0
+    bulk_price_factor = 0.5
+    cache_read_price_factor = 0.1
+    min_cache_tokens = 1024
+    call_overhead_seconds = 1.0
+    output_tokens_per_second = 150.0
+
+    def __init__(self, **options):
+        api_key = _api_key('GEMINI_API_KEY', 'VITE_GEMINI_API_KEY')
+        if not api_key:
+            raise ProviderError("GEMINI_API_KEY or VITE_GEMINI_API_KEY environment variable not set\n"
+                                "Set it with: export GEMINI_API_KEY='your-key-here'")
+        if not _sdk_installed('google.generativeai'):
+            raise ProviderError("google-generativeai package not installed. Install with: pip install google-generativeai")
+        self.api_key = api_key
+        self._genai = None
+        self._genai_lock = threading.Lock()
+        self._batch_client = None
+        self._bulk_request_ids: Dict[str, List[str]] = {}
+        self._context_caches: Dict[str, Tuple[Any, float]] = {}  # prefix hash -> (CachedContent or None, when)
+        self._context_cache_lock = threading.Lock()
+
+    @property
+    def genai(self):
+        """The google.generativeai module, imported and configured on first use"""
+        with self._genai_lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._genai = genai
+            return self._genai
+
+    def _context_cache(self, system: str, exemplar: str) -> Any:
+        """A context cache holding system + exemplar, created once per prefix and renewed before it expires.
+        None when one can't be created (e.g. a prefix below the model's minimum cache size); a failed
+        prefix is tried again after GEMINI_CONTEXT_CACHE_RETRY_SECONDS"""
+        key = prompt_hash(system + exemplar)
+        with self._context_cache_lock:
+            cached, when = self._context_caches.get(key, (None, 0.0))
+            age = time.time() - when
+            if cached is not None and age < GEMINI_CONTEXT_CACHE_TTL.total_seconds() * 0.8:
+                return cached
+            if cached is None and when and age < GEMINI_CONTEXT_CACHE_RETRY_SECONDS:
+                return None
+        try:
+            from google.generativeai import caching
+            cached = caching.CachedContent.create(model=self.model, system_instruction=system,
+                                                  contents=[exemplar], ttl=GEMINI_CONTEXT_CACHE_TTL)
+        except Exception:
+            cached = None  # Implicit caching still covers the prefix until the next attempt
+        with self._context_cache_lock:
+            self._context_caches[key] = (cached, time.time())
+        return cached
+
+    def _model_for(self, prompt: str) -> Tuple[Any, str]:
+        """The model to call and the contents to send it: the context cache plus the rest of the prompt, or
+        system_instruction plus exemplar and rest when no cache is available"""
+        system, exemplar, rest = prompt_sections(prompt)
+        if not system:
+            return self.genai.GenerativeModel(self.model), prompt
+        cached = self._context_cache(system, exemplar) if exemplar else None
+        if cached is not None:
+            return self.genai.GenerativeModel.from_cached_content(cached_content=cached), rest
+        return self.genai.GenerativeModel(self.model, system_instruction=system), exemplar + rest
+
+    @staticmethod
+    def _usage(usage: Any) -> Tuple[int, int, int]:
+        """(input, output, cached input) tokens from usage_metadata"""
+        return (getattr(usage, 'prompt_token_count', 0) or 0, getattr(usage, 'candidates_token_count', 0) or 0,
+                getattr(usage, 'cached_content_token_count', 0) or 0)
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        model, contents = self._model_for(prompt)
+        response = model.generate_content(
+            contents,
+            generation_config=self.genai.types.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_tokens,
+            )
+        )
+        input_tokens, output_tokens, cached = self._usage(getattr(response, 'usage_metadata', None))
+        return ProviderResponse(text=response.text.strip(), input_tokens=input_tokens,
+                                output_tokens=output_tokens, cached_input_tokens=cached)
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        stream = ProviderStream()
+        stream.chunks = self._stream_chunks(stream, prompt, temperature, max_tokens)
+        return stream
+
+    def _stream_chunks(self, stream: ProviderStream, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        model, contents = self._model_for(prompt)
+        response = model.generate_content(
+            contents,
+            generation_config=self.genai.types.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_tokens,
+            ),
+            stream=True,
+        )
+        usage = None
+        for chunk in response:
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts (e.g. the final finish-reason chunk)
+            if text:
+                yield text
+        stream.input_tokens, stream.output_tokens, stream.cached_input_tokens = self._usage(usage)
+
+    def _batches(self):
+        """Batch Mode lives in the newer google-genai SDK (imported only when bulk mode is used)"""
+        if self._batch_client is None:
+            try:
+                from google import genai as google_genai
+            except ImportError:
+                raise ProviderError("Bulk mode for Gemini needs the google-genai package. "
+                                    "Install with: pip install google-genai", kind='fatal')
+            self._batch_client = google_genai.Client(api_key=self.api_key)
+        return self._batch_client.batches
+
+    @staticmethod
+    def _bulk_request(prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """One inline batch request; the system section goes in system_instruction so implicit caching can share it"""
+        system, exemplar, rest = prompt_sections(prompt)
+        config: Dict[str, Any] = {'temperature': temperature, 'max_output_tokens': max_tokens}
+        if system:
+            config['system_instruction'] = system
+        return {'contents': [{'role': 'user', 'parts': [{'text': exemplar + rest}]}], 'config': config}
+
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        job = self._batches().create(
+            model=self.model,
+            src=[self._bulk_request(prompt, temperature, max_tokens) for prompt in requests.values()],
+            config={'display_name': 'homecampus-question-generator'},
+        )
+        # Inline results come back in request order
+        self._bulk_request_ids[job.name] = list(requests)
+        return job.name
+
+    def bulk_done(self, job_id: str) -> bool:
+        return self._batches().get(name=job_id).state.name in GEMINI_BATCH_DONE_STATES
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        job = self._batches().get(name=job_id)
+        responses = (job.dest.inlined_responses if job.dest else None) or []
+        results = {}
+        for request_id, inlined in zip(self._bulk_request_ids.get(job_id, []), responses):
+            if inlined.response is not None:
+                input_tokens, output_tokens, cached = self._usage(getattr(inlined.response, 'usage_metadata', None))
+                results[request_id] = BulkResult(response=ProviderResponse(
+                    text=(inlined.response.text or '').strip(), input_tokens=input_tokens,
+                    output_tokens=output_tokens, cached_input_tokens=cached))
+            else:
+                results[request_id] = BulkResult(error=str(inlined.error))
+        return results
+
+
+SIMULATED_RETRY_AFTER = 1.0  # Retry-After sent with simulated 429s
+
+
+class SimulatedProvider(AIProvider):
+    """Shared latency/failure simulation for the offline providers"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: Optional[int] = None, **options):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bulk_jobs: Dict[str, Dict[str, Any]] = {}
+        self._cached_prefixes: set = set()
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def _call_delay(self) -> float:
+        return self.latency + (self._roll() * self.jitter if self.jitter else 0.0)
+
+    def _maybe_fail(self):
+        if self.rate_limit_rate and self._roll() < self.rate_limit_rate:
+            raise ProviderError(f"Simulated {self.name} 429 Too Many Requests", kind='rate_limit',
+                                retry_after=SIMULATED_RETRY_AFTER)
+        if self.failure_rate and self._roll() < self.failure_rate:
+            raise ProviderError(f"Simulated {self.name} provider failure", kind='transient')
+
+    def _simulate_call(self):
+        """Sleep for the configured latency, then fail with the configured probability"""
+        delay = self._call_delay()
+        if delay > 0:
+            time.sleep(delay)
+        self._maybe_fail()
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Prompt-cache simulation: the longest of system / system + exemplar seen before is read from cache"""
+        system, exemplar, _ = prompt_sections(prompt)
+        cached = 0
+        with self._lock:
+            for prefix in ([system, system + exemplar] if system else []):
+                key = prompt_hash(prefix)
+                if key in self._cached_prefixes:
+                    cached = self._estimate_tokens(prefix)
+                self._cached_prefixes.add(key)
+        return cached
+
+    def _complete(self, prompt: str) -> str:
+        """Completion text for a prompt, without simulated latency or failures"""
+        raise NotImplementedError
+
+    def _response(self, prompt: str, text: str) -> ProviderResponse:
+        return ProviderResponse(text=text, input_tokens=self._estimate_tokens(prompt),
+                                output_tokens=self._estimate_tokens(text), cached_input_tokens=self._cached_tokens(prompt))
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        self._simulate_call()
+        return self._response(prompt, self._complete(prompt))
+
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        """Stand-in batch job: one simulated latency for the whole job, per-request failures"""
+        with self._lock:
+            job_id = f"{self.name}-bulk-{len(self._bulk_jobs) + 1}"
+            job = {'done': threading.Event(), 'results': {}}
+            self._bulk_jobs[job_id] = job
+
+        def run_job():
+            delay = self._call_delay()
+            if delay > 0:
+                time.sleep(delay)
+            for request_id, prompt in requests.items():
+                try:
+                    self._maybe_fail()
+                    job['results'][request_id] = BulkResult(response=self._response(prompt, self._complete(prompt)))
+                except ProviderError as e:
+                    job['results'][request_id] = BulkResult(error=str(e))
+            job['done'].set()
+
+        threading.Thread(target=run_job, daemon=True).start()
+        return job_id
+
+    def bulk_done(self, job_id: str) -> bool:
+        return self._bulk_jobs[job_id]['done'].is_set()
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        return dict(self._bulk_jobs[job_id]['results'])
+
+
+# Scenario parts for mock questions (co-prime list sizes, so combinations only repeat every 693 questions)
+MOCK_PEOPLE = ['Aisha', 'Ben', 'Chen Wei', 'Divya', 'Farid', 'Grace', 'Hui Min']
+MOCK_PLACES = ['at the park', 'in the library', 'at a hawker centre', 'on a school trip', 'in the science lab',
+               'at the void deck', 'on a hiking trail', 'at the swimming complex', 'in a bakery']
+MOCK_OBJECTS = ['a ladder', 'a kite string', 'a ramp', 'a flag pole', 'a garden plot', 'a water tank',
+                'a bookshelf', 'a bicycle path', 'a tent', 'a poster', 'a fish tank']
+
+
+MOCK_STREAM_CHUNK_CHARS = 64
+
+
+class MockProvider(SimulatedProvider):
+    """Synthesizes valid question batches from the prompt itself"""
+
+    name = 'mock'
+    model = 'mock-1'
+    display_name = 'Mock (offline)'
+
+    def __init__(self, partial_rate: float = 0.0, malformed_rate: float = 0.0, **options):
+        super().__init__(**options)
+        self.partial_rate = partial_rate
+        self.malformed_rate = malformed_rate
+        self._counter = 0
+
+    def _next_serial(self) -> int:
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    @staticmethod
+    def _parse_prompt(prompt: str) -> Dict[str, Any]:
+        """Recover what the generator asked for (count, title, tool spec) from the prompt text"""
+        count_match = re.search(r'generating (\d+) diverse practice problems', prompt)
+        title_match = re.search(r'\*\*Title\*\*: (.+)', prompt)
+        tool_spec = None
+        spec_match = re.search(r'# MATHTOOL SPECIFICATION\n(.*?)\n\n#', prompt, re.DOTALL)
+        if spec_match:
+            try:
+                tool_spec = json.loads(spec_match.group(1))
+            except json.JSONDecodeError:
+                tool_spec = None
+        return {
+            'count': int(count_match.group(1)) if count_match else 5,
+            'title': title_match.group(1).strip() if title_match else 'Practice',
+            'tool_spec': tool_spec if isinstance(tool_spec, dict) else None,
+        }
+
+    def _synthesize_question(self, request: Dict[str, Any], index: int) -> Dict[str, Any]:
+        serial = self._next_serial()
+        a, b = 3 + serial % 17, 4 + (serial * 7) % 23
+        question = {
+            'problemText': (f"{request['title']}: {MOCK_PEOPLE[serial % 7]} measures {MOCK_OBJECTS[serial % 11]} "
+                            f"{MOCK_PLACES[serial % 9]} using the values {a} and {b}."),
+        }
+        if index == 0:
+            question['avatarIntro'] = f"Let's practise {request['title'].lower()} together."
+
+        tool_spec = request['tool_spec']
+        if tool_spec and tool_spec.get('toolName'):
+            # Distinct values per variable; a hypotenuse stays the longest side
+            values = iter([a, b, a + b])
+            parameters = {}
+            for key, value in (tool_spec.get('parameters') or {}).items():
+                if value == 'variable':
+                    value = a + b if key == 'hypotenuse' else next(values, a)
+                parameters[key] = value
+            question['mathTool'] = {'toolName': tool_spec['toolName'], 'parameters': parameters}
+
+            # Answer with what the parameters imply (answer_verifier's formulas), preferring the missing quantity
+            expected = expected_values(question['mathTool'])
+            if expected:
+                given = [value for value in parameters.values() if isinstance(value, (int, float))]
+                answer = next((v for v in expected if all(abs(v - g) > 1e-9 for g in given)), expected[0])
+                unit = '°' if tool_spec['toolName'] in ANGLE_TOOLS else ''
+                question['finalAnswer'] = f"{round(answer, 2):g}{unit}"
+                question['stepByStepGuideline'] = [
+                    f"Step 1: Read the known values from the {tool_spec['toolName']} diagram.",
+                    f"Step 2: Work out the missing value: {round(answer, 2):g}{unit}.",
+                ]
+                return question
+
+        question['finalAnswer'] = str(a + b)
+        question['stepByStepGuideline'] = [
+            f"Step 1: Identify the values {a} and {b}.",
+            f"Step 2: Add them: {a} + {b} = {a + b}.",
+        ]
+        return question
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        stream = ProviderStream()
+        stream.chunks = self._stream_chunks(stream, prompt, temperature, max_tokens)
+        return stream
+
+    def _stream_chunks(self, stream: ProviderStream, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        # Same total latency as generate(): 30% before the first chunk, the rest spread over the output
+        delay = self._call_delay()
+        if delay > 0:
+            time.sleep(delay * 0.3)
+        self._maybe_fail()
+        text = self._complete(prompt)
+        chunks = [text[i:i + MOCK_STREAM_CHUNK_CHARS] for i in range(0, len(text), MOCK_STREAM_CHUNK_CHARS)]
+        for chunk in chunks:
+            if delay > 0:
+                time.sleep(delay * 0.7 / len(chunks))
+            yield chunk
+        stream.input_tokens = self._estimate_tokens(prompt)
+        stream.output_tokens = self._estimate_tokens(text)
+        stream.cached_input_tokens = self._cached_tokens(prompt)
+
+    def _complete(self, prompt: str) -> str:
+        """Completion text for a prompt (possibly short or truncated, per the configured rates)"""
+        request = self._parse_prompt(prompt)
+
+        count = request['count']
+        if self.partial_rate and self._roll() < self.partial_rate:
+            count = max(1, count - 1 - int(self._roll() * (count - 1)))
+
+        text = json.dumps([self._synthesize_question(request, i) for i in range(count)], indent=2)
+
+        if self.malformed_rate and self._roll() < self.malformed_rate:
+            text = text[:len(text) // 2]
+        return text
+
+
+class ReplayProvider(SimulatedProvider):
+    """Serves responses captured with RecordingProvider (--record-file)"""
+
+    name = 'replay'
+    model = 'replay'
+    display_name = 'Replay (offline)'
+
+    def __init__(self, replay_file: Optional[str] = None, **options):
+        super().__init__(**options)
+        if not replay_file or not os.path.exists(replay_file):
+            raise ProviderError(f"Replay file not found: {replay_file} (record one with --record-file)")
+
+        self.by_prompt: Dict[str, str] = {}
+        self.recordings: List[str] = []
+        with open(replay_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.by_prompt[entry['promptHash']] = entry['text']
+                self.recordings.append(entry['text'])
+
+        if not self.recordings:
+            raise ProviderError(f"Replay file is empty: {replay_file}")
+        self._next_index = 0
+
+    def _complete(self, prompt: str) -> str:
+        # Exact prompt match first; otherwise cycle through recordings in order
+        # (prompts drift between runs as the anti-repetition list changes)
+        text = self.by_prompt.get(prompt_hash(prompt))
+        if text is None:
+            with self._lock:
+                text = self.recordings[self._next_index % len(self.recordings)]
+                self._next_index += 1
+        return text
+
+
+class RecordingProvider(AIProvider):
+    """Wraps another provider and appends every response to a JSONL file for later replay"""
+
+    def __init__(self, inner: AIProvider, record_file: str):
+        self.inner = inner
+        self.record_file = record_file
+        self.name = inner.name
+        self.model = inner.model
+        self.display_name = inner.display_name
+        self._lock = threading.Lock()
+        self._bulk_prompts: Dict[str, Dict[str, str]] = {}
+
+    def _record(self, prompt: str, text: str):
+        entry = {'promptHash': prompt_hash(prompt), 'provider': self.inner.name, 'text': text}
+        with self._lock:
+            with open(self.record_file, 'a') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        response = self.inner.generate(prompt, temperature, max_tokens)
+        self._record(prompt, response.text)
+        return response
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        stream = ProviderStream()
+        stream.chunks = self._record_chunks(stream, self.inner.stream(prompt, temperature, max_tokens), prompt)
+        return stream
+
+    def _record_chunks(self, stream: ProviderStream, inner: ProviderStream, prompt: str) -> Iterator[str]:
+        try:
+            yield from inner
+        finally:
+            inner.close()
+        # Only complete responses are recorded (aborted streams never reach this point)
+        stream.input_tokens, stream.output_tokens = inner.input_tokens, inner.output_tokens
+        stream.cached_input_tokens = inner.cached_input_tokens
+        self._record(prompt, inner.response.text.strip())
+
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        job_id = self.inner.submit_bulk(requests, temperature, max_tokens)
+        self._bulk_prompts[job_id] = dict(requests)
+        return job_id
+
+    def bulk_done(self, job_id: str) -> bool:
+        return self.inner.bulk_done(job_id)
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        results = self.inner.bulk_results(job_id)
+        prompts = self._bulk_prompts.pop(job_id, {})
+        for request_id, result in results.items():
+            if result.response and request_id in prompts:
+                self._record(prompts[request_id], result.response.text)
+        return results
+
+
+# Registry of available backends (name -> class)
+PROVIDERS = {
+    'claude': ClaudeProvider,
+    'gemini': GeminiProvider,
+    'mock': MockProvider,
+    'replay': ReplayProvider,
+}
+
+
+def create_provider(name: str, record_file: Optional[str] = None, **options) -> AIProvider:
+    """Instantiate a registered provider, optionally recording its responses"""
+    if name not in PROVIDERS:
+        raise ProviderError(f"Unknown provider '{name}'. Use one of: {', '.join(PROVIDERS)}")
+
+    provider = PROVIDERS[name](**options)
+    if record_file:
+        provider = RecordingProvider(provider, record_file)
+    return provider
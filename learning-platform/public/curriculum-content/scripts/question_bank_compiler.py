@@ -0,0 +1,117 @@
+"""
+Compiled Question-Bank Artifacts
+
+`generate_questions.py compile` (or --compile after a generation run) turns
+each topic YAML into a compact artifact next to it, x.yaml -> x.bank.jsonl:
+
+- Line 1 is a header: the topic's metadata (every top-level key except nodes),
+  the YAML's sourceHash, and {id, title, questions} per node
+- Every following line is one node as minified JSON, in YAML order
+
+Each directory gets a bank-manifest.json: per YAML file, the artifact name,
+its content hash (for cache-busting URLs), size and node count. A topic whose
+YAML hasn't changed since its artifact was built (sourceHash in the header) is
+not recompiled.
+
+No app loader reads the artifacts or the manifest yet (yamlPathLoader.ts still
+parses the YAML and loads every node of a topic at once), so there is no
+per-node offset table or reader until one does; see the README's Compiled
+Question Banks section.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from node_journal import write_file_atomic
+from yaml_store import file_sha256, load_yaml_file
+
+ARTIFACT_SUFFIX = '.bank.jsonl'
+MANIFEST_FILENAME = 'bank-manifest.json'
+FORMAT_VERSION = 2  # 2: no node offset table
+
+
+def artifact_path_for(yaml_path: str) -> str:
+    """x.yaml -> x.bank.jsonl"""
+    return os.path.splitext(yaml_path)[0] + ARTIFACT_SUFFIX
+
+
+def _minified(value: Any) -> str:
+    # default=str: unquoted YAML dates load as date objects
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def read_header(artifact_path: str) -> Optional[Dict[str, Any]]:
+    """The header line of an artifact (None if missing or unreadable)"""
+    try:
+        with open(artifact_path, 'rb') as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    return header if isinstance(header, dict) and header.get('version') == FORMAT_VERSION else None
+
+
+def _manifest_entry(artifact_path: str, header: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'artifact': os.path.basename(artifact_path),
+        'contentHash': file_sha256(artifact_path)[:16],
+        'bytes': os.path.getsize(artifact_path),
+        'nodes': len(header['nodes']),
+        'questions': sum(node['questions'] for node in header['nodes']),
+        'sourceHash': header['sourceHash'],
+    }
+
+
+def compile_topic(yaml_path: str, force: bool = False) -> Dict[str, Any]:
+    """Build a topic's artifact (unless it's up to date). Returns its manifest entry plus 'compiled' and 'yamlBytes'."""
+    artifact_path = artifact_path_for(yaml_path)
+    source_hash = file_sha256(yaml_path)[:16]
+    yaml_bytes = os.path.getsize(yaml_path)
+
+    header = None if force else read_header(artifact_path)
+    if header and header.get('sourceHash') == source_hash:
+        return {**_manifest_entry(artifact_path, header), 'compiled': False, 'yamlBytes': yaml_bytes}
+
+    data = load_yaml_file(yaml_path) or {}
+    nodes = [node for node in data.get('nodes') or [] if isinstance(node, dict)]
+    lines: List[bytes] = []
+    table = []
+    for node in nodes:
+        questions = (node.get('descriptor') or {}).get('preWrittenQuestions') or []
+        table.append({'id': str(node.get('id')), 'title': node.get('title'), 'questions': len(questions)})
+        lines.append((_minified(node) + "\n").encode('utf-8'))
+
+    header = {
+        'format': 'question-bank',
+        'version': FORMAT_VERSION,
+        'source': os.path.basename(yaml_path),
+        'sourceHash': source_hash,
+        'topic': {key: value for key, value in data.items() if key != 'nodes'},
+        'nodes': table,
+    }
+    header_line = (_minified(header) + "\n").encode('utf-8')
+    write_file_atomic(artifact_path, (header_line + b''.join(lines)).decode('utf-8'))
+    return {**_manifest_entry(artifact_path, header), 'compiled': True, 'yamlBytes': yaml_bytes}
+
+
+def update_manifest(directory: str, entries: Dict[str, Dict[str, Any]]):
+    """Merge {yaml filename: manifest entry} into a directory's bank-manifest.json"""
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    manifest: Dict[str, Any] = {'version': FORMAT_VERSION, 'files': {}}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+    manifest['version'] = FORMAT_VERSION
+    files = manifest.setdefault('files', {})
+    for filename, entry in entries.items():
+        files[filename] = {key: value for key, value in entry.items() if key not in ('compiled', 'yamlBytes')}
+    # Drop entries whose YAML is gone
+    for filename in [name for name in files if not os.path.exists(os.path.join(directory, name))]:
+        del files[filename]
+    manifest['files'] = dict(sorted(files.items()))
+    manifest['manifestHash'] = hashlib.sha256(_minified(manifest['files']).encode('utf-8')).hexdigest()[:16]
+    write_file_atomic(path, json.dumps(manifest, indent=2, ensure_ascii=False) + "\n")
@@ -0,0 +1,221 @@
+"""
+Generated Question Validator
+
+Checks question objects against the output contract in the generation prompt
+(prompt_builder.py) and the node's mathTool specification from its exemplar.
+A QuestionValidator is compiled once per node: the spec is turned into a list
+of small per-parameter checks, so validating a question is a handful of dict
+lookups and two precompiled regex scans (a few microseconds).
+
+Rules:
+- problem_text:  problemText is a non-empty string
+- final_answer:  finalAnswer is present and non-empty
+- steps:         stepByStepGuideline is a non-empty list of non-empty strings
+- avatar_intro:  avatarIntro only on the node's first question, plain text only
+- currency:      money amounts use \\$ (an unescaped $25 starts LaTeX math mode)
+- tool_name:     mathTool.toolName matches the specification
+- parameters:    every specified parameter is present with the right type
+                 ("variable" in the spec accepts any non-null value)
+- answer:        (optional) the finalAnswer is recomputed from the steps and
+                 mathTool parameters (answer_verifier.py)
+
+Text fields may also be written as speech/display pairs ({speech.text,
+display.content} or {speech, display}, as in the hand-edited S1 topics); the display text is what gets checked.
+
+Failures are used by the generator to re-request just the failing slots, and
+by `generate_questions.py validate` to check existing YAML files.
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from yaml_store import load_yaml_file
+
+EXEMPLAR_SUFFIX = '-exemplars.json'
+VARIABLE = 'variable'
+
+# $ followed by an amount and then a non-math character: "$25 ", "$3.50," (not "$30^\circ$" or "$2x$")
+_MONEY = re.compile(r'(?<!\\)\$(\d+(?:,\d{3})*(?:\.\d+)?)(?=[\s;!?)]|[.,](?![\d.])|$)')
+_UNESCAPED_DOLLAR = re.compile(r'(?<!\\)\$')
+# Anything in a $...$ segment that makes it math rather than two prices
+_MATH_CONTENT = re.compile(r'[\\^_=+\-*/×÷<>{}()]')
+_NOT_PLAIN = re.compile(r'[$\\]')
+
+
+@dataclass
+class Issue:
+    """One rule a question broke"""
+    rule: str
+    message: str
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def display_text(value: Any) -> Optional[str]:
+    """The text shown to students: a plain string or the display.content of a speech/display pair"""
+    if isinstance(value, dict):
+        value = value.get('display.content', value.get('display'))
+    return value if isinstance(value, str) else None
+
+
+def find_unescaped_currency(text: str) -> Optional[str]:
+    """The first money amount written with an unescaped $, if any"""
+    for match in _MONEY.finditer(text):
+        closing = _UNESCAPED_DOLLAR.search(text, match.end())
+        # "$25 and $30" is two prices; "$5 + 3$" is math
+        if closing is None or not _MATH_CONTENT.search(text, match.end(), closing.start()):
+            return match.group(0)
+    return None
+
+
+def _parameter_check(name: str, spec_value: Any) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Compile one mathTool parameter of the spec into a check over a parameters dict"""
+    if spec_value == VARIABLE or spec_value is None:
+        accepts, expected = (lambda value: value is not None), 'a value'
+    elif isinstance(spec_value, bool):
+        accepts, expected = (lambda value: isinstance(value, bool)), 'true/false'
+    elif isinstance(spec_value, (int, float)):
+        accepts, expected = (lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)), 'a number'
+    elif isinstance(spec_value, str):
+        accepts, expected = (lambda value: isinstance(value, str)), 'a string'
+    elif isinstance(spec_value, list):
+        accepts, expected = (lambda value: isinstance(value, list)), 'a list'
+    else:
+        accepts, expected = (lambda value: isinstance(value, dict)), 'an object'
+
+    def check(parameters: Dict[str, Any]) -> Optional[str]:
+        if name not in parameters:
+            return f"mathTool parameter '{name}' is missing"
+        if not accepts(parameters[name]):
+            return f"mathTool parameter '{name}' should be {expected}, got {json.dumps(parameters[name])[:40]}"
+        return None
+
+    return check
+
+
+class QuestionValidator:
+    """Validates generated questions for one node (compiled from its exemplar)"""
+
+    def __init__(self, exemplar: Optional[Dict[str, Any]] = None,
+                 checks: Sequence[Callable[[Dict[str, Any]], List[Issue]]] = ()):
+        # Extra whole-question checks (e.g. answer_verifier.verify_question), run once the contract holds
+        self.checks = list(checks)
+        math_tool = (exemplar or {}).get('mathTool')
+        self.tool_name: Optional[str] = None
+        self._parameter_checks: List[Callable[[Dict[str, Any]], Optional[str]]] = []
+        # Exemplars without a toolName only describe when to use a tool (usage/purpose notes)
+        if isinstance(math_tool, dict) and isinstance(math_tool.get('toolName'), str):
+            self.tool_name = math_tool['toolName']
+            parameters = math_tool.get('parameters')
+            if isinstance(parameters, dict):
+                self._parameter_checks = [_parameter_check(name, value) for name, value in parameters.items()]
+
+    def validate(self, question: Any, position: int = 0) -> List[Issue]:
+        """Issues with a question at the given 0-based position in its node (empty list = valid)"""
+        if not isinstance(question, dict):
+            return [Issue('problem_text', f"expected an object, got {type(question).__name__}")]
+        issues = []
+
+        problem_text = display_text(question.get('problemText'))
+        if not problem_text or not problem_text.strip():
+            issues.append(Issue('problem_text', "missing problemText"))
+
+        final_answer = question.get('finalAnswer')
+        if isinstance(final_answer, (int, float)) and not isinstance(final_answer, bool):
+            final_answer = str(final_answer)
+        elif final_answer is None or display_text(final_answer) is not None:
+            final_answer = display_text(final_answer)
+            if not final_answer or not final_answer.strip():
+                issues.append(Issue('final_answer', "missing finalAnswer"))
+        else:
+            issues.append(Issue('final_answer', f"finalAnswer should be text, got {type(final_answer).__name__}"
+                                                " (multi-part answer?)"))
+            final_answer = None
+
+        steps = question.get('stepByStepGuideline')
+        if not isinstance(steps, list) or not steps:
+            issues.append(Issue('steps', "missing stepByStepGuideline"))
+            steps = []
+        else:
+            steps = [display_text(step) for step in steps]
+            if not all(step and step.strip() for step in steps):
+                issues.append(Issue('steps', "stepByStepGuideline has empty or non-text steps"))
+
+        intro = question.get('avatarIntro')
+        if intro is not None:
+            if position > 0:
+                issues.append(Issue('avatar_intro', f"avatarIntro on question {position + 1} (only the first question has one)"))
+            elif not isinstance(intro, str) or _NOT_PLAIN.search(intro):
+                issues.append(Issue('avatar_intro', "avatarIntro must be plain text (no LaTeX or $)"))
+
+        for field_name, text in [('problemText', problem_text), ('finalAnswer', final_answer)] + \
+                                [('stepByStepGuideline', step) for step in steps]:
+            if isinstance(text, str) and '$' in text:
+                amount = find_unescaped_currency(text)
+                if amount:
+                    issues.append(Issue('currency', f"unescaped currency {amount!r} in {field_name} (use \\$)"))
+                    break
+
+        if self.tool_name:
+            issues.extend(self._validate_math_tool(question.get('mathTool')))
+        for check in self.checks if not issues else []:
+            issues.extend(check(question))
+        return issues
+
+    def _validate_math_tool(self, math_tool: Any) -> List[Issue]:
+        if not isinstance(math_tool, dict):
+            return [Issue('tool_name', f"missing mathTool (expected {self.tool_name!r})")]
+        if math_tool.get('toolName') != self.tool_name:
+            return [Issue('tool_name', f"mathTool.toolName is {math_tool.get('toolName')!r}, expected {self.tool_name!r}")]
+        parameters = math_tool.get('parameters')
+        if not isinstance(parameters, dict):
+            return [Issue('parameters', "mathTool.parameters is missing")]
+        issues = []
+        for check in self._parameter_checks:
+            problem = check(parameters)
+            if problem:
+                issues.append(Issue('parameters', problem))
+        return issues
+
+    def validate_batch(self, questions: List[Any], first_position: int = 0) -> Dict[int, List[Issue]]:
+        """{slot: issues} for the invalid questions of a batch starting at first_position in the node"""
+        failures = {}
+        for slot, question in enumerate(questions):
+            issues = self.validate(question, first_position + slot)
+            if issues:
+                failures[slot] = issues
+        return failures
+
+
+def exemplar_path_for(yaml_path: str) -> str:
+    """x.yaml -> x-exemplars.json (the topic's exemplar file, if it has one)"""
+    return os.path.splitext(yaml_path)[0] + EXEMPLAR_SUFFIX
+
+
+def validate_yaml_file(path: str) -> Tuple[int, List[Tuple[str, str, Issue]]]:
+    """Validate every question in a topic YAML. Returns (questions checked, [(node id, question id, issue)])."""
+    exemplars = {}
+    exemplar_path = exemplar_path_for(path)
+    if os.path.exists(exemplar_path):
+        with open(exemplar_path, 'r', encoding='utf-8') as f:
+            exemplars = json.load(f)
+
+    data = load_yaml_file(path) or {}
+    checked = 0
+    failures = []
+    for node in data.get('nodes') or []:
+        if not isinstance(node, dict):
+            continue
+        node_id = str(node.get('id'))
+        validator = QuestionValidator(exemplars.get(node_id))
+        questions = (node.get('descriptor') or {}).get('preWrittenQuestions') or []
+        for position, question in enumerate(questions):
+            checked += 1
+            question_id = question.get('id', f"#{position + 1}") if isinstance(question, dict) else f"#{position + 1}"
+            for issue in validator.validate(question, position):
+                failures.append((node_id, str(question_id), issue))
+    return checked, failures
@@ -0,0 +1,279 @@
+"""
+Request Rate Limiting and Retry Policy for the Question Generator
+
+A single RateLimiter is shared by every worker (and every topic in batch mode),
+so the whole process stays under the provider's quotas no matter how many nodes
+are in flight. It holds two token buckets - requests/min and tokens/min - and a
+global pause that is set whenever the provider answers 429, so one worker's
+Retry-After holds back all of them instead of each finding out separately.
+
+Failures are classified so retries can react to what went wrong:
+
+- rate_limit: 429 / quota exhausted - wait for Retry-After (or back off)
+- transient:  network errors, timeouts, 5xx/overloaded - jittered exponential backoff
+- parse:      the response arrived but wasn't a usable batch - retry immediately
+- fatal:      bad request, auth, permissions - retrying won't help; also any
+              exception that isn't a known provider/network failure (a
+              KeyError or TypeError is a bug, not something to wait out)
+"""
+
+import email.utils
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+from json_stream import StreamFormatError
+from prompt_builder import estimate_tokens
+from providers import AIProvider, BulkResult, ProviderError, ProviderResponse, ProviderStream
+
+RATE_LIMIT = 'rate_limit'
+TRANSIENT = 'transient'
+PARSE = 'parse'
+FATAL = 'fatal'
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+DEFAULT_RATE_LIMIT_PAUSE = 10.0  # When a 429 comes without Retry-After
+TRANSIENT_ERROR_NAMES = ('Connection', 'Timeout', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServer',
+                         'Overloaded', 'ServerError', 'RemoteProtocol', 'ReadError', 'WriteError')
+
+# Seconds the current thread's last provider call waited on the limiter (see take_throttled_seconds)
+_thread_state = threading.local()
+
+
+def take_throttled_seconds() -> float:
+    """How long this thread's calls waited on a RateLimiter since the last time this was asked (then reset),
+    so callers can time provider calls without the throttling"""
+    seconds = getattr(_thread_state, 'throttled', 0.0)
+    _thread_state.throttled = 0.0
+    return seconds
+
+
+def classify_error(error: BaseException) -> str:
+    """Map an exception from a provider call or response parsing to an error class"""
+    if isinstance(error, ProviderError) and error.kind:
+        return error.kind
+    if isinstance(error, (json.JSONDecodeError, StreamFormatError)):
+        return PARSE
+
+    # anthropic's APIStatusError has status_code; google.api_core exceptions have an HTTP code
+    status = getattr(error, 'status_code', None)
+    if not isinstance(status, int):
+        status = getattr(error, 'code', None)
+    if isinstance(status, int):
+        if status == 429:
+            return RATE_LIMIT
+        if status in (408, 409) or status >= 500:
+            return TRANSIENT
+        if 400 <= status < 500:
+            return FATAL
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    name = type(error).__name__
+    if 'ResourceExhausted' in name or 'RateLimit' in name:
+        return RATE_LIMIT
+    # SDK errors without a status code: anthropic.APIConnectionError/APITimeoutError/InternalServerError,
+    # google.api_core ServiceUnavailable/DeadlineExceeded/InternalServerError, httpx transport errors
+    if any(part in name for part in TRANSIENT_ERROR_NAMES):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Retry-After from the error (seconds or HTTP date), if the provider sent one"""
+    if isinstance(error, ProviderError) and error.retry_after is not None:
+        return error.retry_after
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('retry-after') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(error_class: str, attempt: int, retry_after: Optional[float] = None) -> float:
+    """Seconds to wait before retrying after failed attempt number `attempt` (1-based)"""
+    if error_class == PARSE:
+        return 0.0
+    if error_class == RATE_LIMIT and retry_after is not None:
+        # A little jitter on top so the workers don't all come back at the same instant
+        return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+    window = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    if error_class == RATE_LIMIT:
+        window = max(window, DEFAULT_RATE_LIMIT_PAUSE)
+    return random.uniform(window / 2, window)
+
+
+@dataclass
+class RateLimitMetrics:
+    """Where worker time went: waiting on the limiter, inside provider calls, or backing off"""
+    calls: int = 0
+    throttled_seconds: float = 0.0
+    working_seconds: float = 0.0
+    backoff_seconds: float = 0.0
+    rate_limited: int = 0
+    transient_errors: int = 0
+
+    def summary(self) -> str:
+        waiting = self.throttled_seconds + self.backoff_seconds
+        total = waiting + self.working_seconds
+        return (f"{self.calls} calls, {self.working_seconds:.1f}s in calls, {self.throttled_seconds:.1f}s throttled, "
+                f"{self.backoff_seconds:.1f}s backing off ({waiting / total if total else 0:.0%} waiting), "
+                f"{self.rate_limited} rate-limited, {self.transient_errors} transient errors")
+
+
+class TokenBucket:
+    """Refills at rate_per_minute up to one minute's worth; callers reserve and wait out any deficit"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self._rate = rate_per_minute / 60.0
+        self._tokens = rate_per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.rate_per_minute, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount (going into debt if needed); return seconds until the debt is repaid"""
+        self._refill(now)
+        self._tokens -= amount
+        return max(0.0, -self._tokens / self._rate)
+
+    def adjust(self, amount: float, now: float):
+        """Correct an earlier reservation once the real cost is known (positive = used more)"""
+        self._refill(now)
+        self._tokens -= amount
+
+
+class RateLimiter:
+    """Shared requests/min + tokens/min limiter with a global pause for 429s"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.metrics = RateLimitMetrics()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def describe(self) -> str:
+        limits = []
+        if self.requests:
+            limits.append(f"{self.requests.rate_per_minute:g} requests/min")
+        if self.tokens:
+            limits.append(f"{self.tokens.rate_per_minute:g} tokens/min")
+        return ', '.join(limits)
+
+    def acquire(self, estimated_tokens: int = 0):
+        """Block until the caller may start a request expected to use estimated_tokens"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens and estimated_tokens:
+                wait = max(wait, self.tokens.reserve(estimated_tokens, now))
+            self.metrics.calls += 1
+            self.metrics.throttled_seconds += wait
+        if wait > 0:
+            _thread_state.throttled = getattr(_thread_state, 'throttled', 0.0) + wait
+            time.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Charge the tokens/min bucket for the difference between the estimate and real usage"""
+        if self.tokens and actual_tokens:
+            with self._lock:
+                self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def pause(self, seconds: float):
+        """Hold back every worker for the given time (after a 429)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def record_error(self, error_class: str):
+        with self._lock:
+            if error_class == RATE_LIMIT:
+                self.metrics.rate_limited += 1
+            elif error_class == TRANSIENT:
+                self.metrics.transient_errors += 1
+
+    def record_work(self, seconds: float):
+        with self._lock:
+            self.metrics.working_seconds += seconds
+
+    def record_backoff(self, seconds: float):
+        with self._lock:
+            self.metrics.backoff_seconds += seconds
+
+
+class RateLimitedProvider(AIProvider):
+    """Wraps a provider so every call waits for the shared limiter and reports 429s back to it"""
+
+    def __init__(self, inner: AIProvider, limiter: RateLimiter):
+        self.inner = inner
+        self.limiter = limiter
+        self.name = inner.name
+        self.model = inner.model
+        self.display_name = inner.display_name
+
+    def _on_error(self, error: BaseException):
+        error_class = classify_error(error)
+        self.limiter.record_error(error_class)
+        if error_class == RATE_LIMIT:
+            retry_after = retry_after_seconds(error)
+            self.limiter.pause(retry_after if retry_after is not None else DEFAULT_RATE_LIMIT_PAUSE)
+
+    def generate(self, prompt: str, temperature: float, max_tokens: int) -> ProviderResponse:
+        estimated = estimate_tokens(prompt)
+        self.limiter.acquire(estimated)
+        start = time.perf_counter()
+        try:
+            response = self.inner.generate(prompt, temperature, max_tokens)
+        except Exception as e:
+            self._on_error(e)
+            raise
+        finally:
+            self.limiter.record_work(time.perf_counter() - start)
+        self.limiter.settle(estimated, response.input_tokens + response.output_tokens)
+        return response
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> ProviderStream:
+        estimated = estimate_tokens(prompt)
+        self.limiter.acquire(estimated)
+        stream = ProviderStream()
+        stream.chunks = self._limited_chunks(stream, self.inner.stream(prompt, temperature, max_tokens), estimated)
+        return stream
+
+    def _limited_chunks(self, stream: ProviderStream, inner: ProviderStream, estimated: int) -> Iterator[str]:
+        start = time.perf_counter()
+        try:
+            yield from inner
+        except Exception as e:
+            self._on_error(e)
+            raise
+        finally:
+            inner.close()
+            self.limiter.record_work(time.perf_counter() - start)
+        stream.input_tokens, stream.output_tokens = inner.input_tokens, inner.output_tokens
+        stream.cached_input_tokens = inner.cached_input_tokens
+        self.limiter.settle(estimated, inner.input_tokens + inner.output_tokens)
+
+    # Batch jobs are queued and paced by the provider itself, so they bypass the limiter
+    def submit_bulk(self, requests: Dict[str, str], temperature: float, max_tokens: int) -> str:
+        return self.inner.submit_bulk(requests, temperature, max_tokens)
+
+    def bulk_done(self, job_id: str) -> bool:
+        return self.inner.bulk_done(job_id)
+
+    def bulk_results(self, job_id: str) -> Dict[str, BulkResult]:
+        return self.inner.bulk_results(job_id)
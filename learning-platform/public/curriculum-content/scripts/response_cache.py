@@ -0,0 +1,125 @@
+"""
+Content-Addressed Response Cache for the Question Generator
+
+Stores provider responses on disk keyed by a SHA-256 of everything that
+determines the completion: provider, model, temperature, max_tokens, prompt
+(plus the retry attempt, so a re-run replays the same sequence of responses
+instead of serving the same rejected batch to every retry).
+
+The cache is size-bounded: entries are evicted least-recently-used first, using
+file mtimes (touched on every hit) so the LRU order survives between runs.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'homecampus-question-generator', 'responses')
+DEFAULT_MAX_MB = 500
+
+
+def cache_key(provider: str, model: str, temperature: float, max_tokens: int, prompt: str, attempt: int = 1,
+              candidate: int = 0) -> str:
+    """Hash the inputs that fully determine a completion (candidate: which of K parallel samples)"""
+    inputs = [provider, model, temperature, max_tokens, attempt, prompt]
+    if candidate:
+        inputs.append(candidate)  # Keys of single-candidate runs stay as they were
+    payload = json.dumps(inputs, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """On-disk LRU cache of raw provider responses"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # path -> size, ordered oldest (least recently used) first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU order from file mtimes"""
+        found = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.path, stat.st_size))
+
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key (and mark it recently used), or None"""
+        path = self._path(key)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except (OSError, json.JSONDecodeError):
+                # Deleted or corrupted behind our back - treat as a miss
+                self._total_bytes -= self._entries.pop(path)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry atomically, then evict old entries until under the size limit"""
+        path = self._path(key)
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            if path in self._entries:
+                self._total_bytes -= self._entries.pop(path)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self.writes += 1
+
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+                self.evictions += 1
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.writes} writes, {self.evictions} evictions, "
+                f"{self._total_bytes / (1024 * 1024):.1f} MB in {self.cache_dir}")
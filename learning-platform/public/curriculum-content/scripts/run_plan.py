@@ -0,0 +1,131 @@
+"""
+Generation Run Planning (--plan)
+
+Forecasts a run from the prompts it would send, without calling a provider or
+importing its SDK. generate_questions.py builds the first-attempt prompt of
+every pending node exactly as a real run would and adds one call per prompt:
+
+- prompt tokens:  estimated from the built prompt (prompt_builder.estimate_tokens);
+                  the cacheable prefix (system + exemplar sections) counts as
+                  read from the prompt cache when it has been sent before - the
+                  system section after the first node, the whole prefix for
+                  every candidate after the first - and is at least the
+                  provider's minimum cacheable size
+- output tokens:  questions requested x OUTPUT_TOKENS_PER_QUESTION (generated
+                  questions in the curriculum average ~245 tokens as JSON),
+                  capped at the max output tokens of a call
+- cost:           the provider's list prices (providers.py), cached prompt
+                  tokens at its cache-read price, x its batch discount in bulk
+                  mode (cache writes are priced as ordinary input)
+- wall clock:     per-call latency (overhead + output tokens / decode speed),
+                  nodes handed to --concurrency workers in queue order, and
+                  never faster than --rpm / --tpm allow
+
+Retries and re-requested slots come on top: the plan covers first attempts
+(x --candidates) only.
+"""
+
+import heapq
+from dataclasses import dataclass, field
+from typing import List, Optional, Type
+
+from providers import AIProvider
+
+OUTPUT_TOKENS_PER_QUESTION = 250
+OUTPUT_OVERHEAD_TOKENS = 20  # The surrounding JSON array / code fence
+
+
+def expected_output_tokens(count: int, max_tokens: int) -> int:
+    """Output tokens a batch of count questions should take (a call can't return more than max_tokens)"""
+    return min(count * OUTPUT_TOKENS_PER_QUESTION + OUTPUT_OVERHEAD_TOKENS, max_tokens)
+
+
+@dataclass
+class RunPlan:
+    """Forecast of the provider calls a run would make"""
+    provider: Type[AIProvider]
+    mode: str = 'interactive'
+    simulated_latency: float = 0.0  # mock/replay: seconds per call (--mock-latency + half the jitter)
+    calls: int = 0
+    nodes: int = 0
+    questions: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0  # Part of prompt_tokens expected to be read from the prompt cache
+    output_tokens: int = 0
+    truncation_risk: int = 0  # Nodes whose expected output doesn't fit in one call
+    node_seconds: List[float] = field(default_factory=list)  # Per node, in work-queue order
+
+    def call_seconds(self, output_tokens: int) -> float:
+        if self.simulated_latency or not self.provider.output_tokens_per_second:
+            return self.simulated_latency
+        return self.provider.call_overhead_seconds + output_tokens / self.provider.output_tokens_per_second
+
+    def cacheable(self, prefix_tokens: int) -> int:
+        return prefix_tokens if prefix_tokens >= self.provider.min_cache_tokens else 0
+
+    def add_node(self, prompt_tokens: int, count: int, max_tokens: int, candidates: int = 1,
+                 system_tokens: int = 0, exemplar_tokens: int = 0):
+        """One pending node: candidates parallel calls of the same prompt (system_tokens + exemplar_tokens
+        of it being the cacheable prefix)"""
+        output_tokens = expected_output_tokens(count, max_tokens)
+        # Every node after the first shares the system section; every candidate after the first the whole prefix
+        if self.nodes:
+            self.cached_prompt_tokens += self.cacheable(system_tokens)
+        self.cached_prompt_tokens += (candidates - 1) * self.cacheable(system_tokens + exemplar_tokens)
+        if count * OUTPUT_TOKENS_PER_QUESTION + OUTPUT_OVERHEAD_TOKENS > max_tokens:
+            self.truncation_risk += 1
+        self.nodes += 1
+        self.questions += count
+        self.calls += candidates
+        self.prompt_tokens += prompt_tokens * candidates
+        self.output_tokens += output_tokens * candidates
+        self.node_seconds.append(self.call_seconds(output_tokens))  # Candidates run side by side
+
+    def cost(self) -> float:
+        """Estimated USD at list prices"""
+        factor = self.provider.bulk_price_factor if self.mode == 'bulk' else 1.0
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        cached_price = self.provider.input_price_per_mtok * self.provider.cache_read_price_factor
+        return factor * (uncached * self.provider.input_price_per_mtok + self.cached_prompt_tokens * cached_price
+                         + self.output_tokens * self.provider.output_price_per_mtok) / 1_000_000
+
+    def wall_clock(self, concurrency: int = 1, rpm: Optional[float] = None, tpm: Optional[float] = None) -> float:
+        """Projected seconds for the interactive run: worker schedule, bounded below by the rate limits"""
+        workers = [0.0] * max(1, concurrency)
+        for seconds in self.node_seconds:
+            heapq.heappush(workers, heapq.heappop(workers) + seconds)  # Next node goes to the first free worker
+        seconds = max(workers)
+        if rpm:
+            seconds = max(seconds, self.calls / rpm * 60)
+        if tpm:
+            seconds = max(seconds, (self.prompt_tokens + self.output_tokens) / tpm * 60)
+        return seconds
+
+    def describe(self, concurrency: int = 1, rpm: Optional[float] = None, tpm: Optional[float] = None) -> List[str]:
+        """Summary lines for the console"""
+        lines = [
+            f"Nodes: {self.nodes:,} ({self.questions:,} questions) in {self.calls:,} call(s) to "
+            f"{self.provider.display_name or self.provider.name}",
+            f"Prompt tokens: {self.prompt_tokens:,} (~{self.prompt_tokens // max(1, self.calls):,} per call, "
+            f"~{self.cached_prompt_tokens:,} from the prompt cache)",
+            f"Expected output tokens: {self.output_tokens:,} (~{OUTPUT_TOKENS_PER_QUESTION} per question)",
+        ]
+        if self.provider.input_price_per_mtok or self.provider.output_price_per_mtok:
+            pricing = f"${self.provider.input_price_per_mtok:g} in / ${self.provider.output_price_per_mtok:g} out per M tokens"
+            if self.cached_prompt_tokens and self.provider.cache_read_price_factor != 1.0:
+                pricing += f", cache reads x{self.provider.cache_read_price_factor:g}"
+            if self.mode == 'bulk':
+                pricing += f", x{self.provider.bulk_price_factor:g} batch discount"
+            lines.append(f"Estimated cost: ${self.cost():,.2f} ({pricing})")
+        else:
+            lines.append("Estimated cost: $0.00 (offline provider)")
+        if self.mode == 'bulk':
+            lines.append("Wall clock: set by the provider's batch queue (usually well under its 24h limit)")
+        else:
+            limits = ', '.join(part for part in [f"{rpm:g} rpm" if rpm else '', f"{tpm:g} tpm" if tpm else ''] if part)
+            lines.append(f"Projected wall clock: {self.wall_clock(concurrency, rpm, tpm) / 60:,.1f} min "
+                         f"at concurrency {concurrency}{f' ({limits})' if limits else ''}")
+        if self.truncation_risk:
+            lines.append(f"⚠️  {self.truncation_risk} node(s) expect more output than one call allows "
+                         f"(lower --count or expect partial batches)")
+        return lines
@@ -0,0 +1,129 @@
+"""
+Run Telemetry for the Question Generator
+
+A process-wide recorder collects stage timings (prompt build, provider call,
+parse, dedup check, backoff, journal append, YAML write, ...), counters (tokens,
+calls, cache hits, retries, errors by class) and one row per generated node.
+Recording is a perf_counter() pair and a list append, so it is always on; the
+report is only written when asked for (--report):
+
+- .json: run info, totals, per-stage count/total/p50/p95/max, and every node row
+- .csv:  one row per node (timings, calls, retries, tokens) for spreadsheets/diffing
+
+Comparing the JSON reports of two runs shows where a regression came from.
+"""
+
+import csv
+import io
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from node_journal import write_file_atomic
+
+NODE_CSV_FIELDS = [
+    'topic', 'nodeId', 'questions', 'seconds', 'calls', 'retries', 'cachedCalls', 'inputTokens',
+    'cachedInputTokens', 'outputTokens', 'providerSeconds', 'backoffSeconds', 'firstQuestionSeconds', 'salvaged', 'duplicatesReplaced', 'invalid', 'errors',
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Telemetry:
+    """Thread-safe collector for stage timings, counters and per-node rows"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.run_info: Dict[str, Any] = {}
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.nodes: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time a block as one sample of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_sample(stage, time.perf_counter() - start)
+
+    def add_sample(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def count(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_node(self, row: Dict[str, Any]):
+        with self._lock:
+            self.nodes.append(row)
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """count/total/p50/p95/max seconds per stage"""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        return {
+            stage: {
+                'count': len(values),
+                'total': round(sum(values), 6),
+                'p50': round(percentile(values, 0.50), 6),
+                'p95': round(percentile(values, 0.95), 6),
+                'max': round(values[-1], 6),
+            }
+            for stage, values in sorted(samples.items())
+        }
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {name: int(value) if float(value).is_integer() else round(value, 6)
+                        for name, value in sorted(self.counters.items())}
+            nodes = list(self.nodes)
+        return {
+            'run': {
+                **self.run_info,
+                'startedAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                'wallSeconds': round(time.perf_counter() - self._started, 3),
+            },
+            'totals': counters,
+            'stages': self.stage_summary(),
+            'nodes': nodes,
+        }
+
+    def write_report(self, path: str):
+        """Write the report as CSV (per-node rows) if path ends in .csv, otherwise as JSON"""
+        if path.lower().endswith('.csv'):
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=NODE_CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            with self._lock:
+                for row in self.nodes:
+                    writer.writerow({**row, 'errors': ';'.join(f"{k}={v}" for k, v in sorted(row.get('errors', {}).items()))})
+            write_file_atomic(path, buffer.getvalue())
+        else:
+            write_file_atomic(path, json.dumps(self.report(), indent=2, ensure_ascii=False) + "\n")
+
+    def summary_lines(self) -> List[str]:
+        """Stage latency table for the end-of-run output"""
+        lines = [f"   {'stage':<16} {'count':>6} {'total':>9} {'p50':>9} {'p95':>9}"]
+        for stage, summary in self.stage_summary().items():
+            lines.append(f"   {stage:<16} {summary['count']:>6} {summary['total']:>8.2f}s "
+                         f"{summary['p50'] * 1000:>7.1f}ms {summary['p95'] * 1000:>7.1f}ms")
+        return lines
+
+
+# Shared by every module of the generator (one run per process)
+recorder = Telemetry()
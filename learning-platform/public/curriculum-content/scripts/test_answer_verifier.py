@@ -0,0 +1,96 @@
+"""
+Checks for answer_verifier.py (python -m pytest test_answer_verifier.py)
+"""
+
+from answer_verifier import check_answer, check_arithmetic, verify_question
+
+
+def angles_on_line(final_answer, steps):
+    return {
+        'mathTool': {'toolName': 'anglesOnLine', 'parameters': {'angles': [38, 'm']}},
+        'finalAnswer': final_answer,
+        'stepByStepGuideline': steps,
+    }
+
+
+def test_correct_final_answer_passes():
+    question = angles_on_line('m = 142°', ['Angles on a straight line add up to 180°.', 'm = 180° - 38° = 142°'])
+    assert check_answer(question) == (True, [])
+
+
+def test_wrong_final_answer_is_rejected_even_when_steps_reach_the_right_value():
+    question = angles_on_line('m = 157.81°', ['Angles on a straight line add up to 180°.', 'm = 180° - 38° = 142°'])
+    issues = verify_question(question)
+    assert [issue.rule for issue in issues] == ['answer']
+
+
+def test_offset_from_an_expected_value_in_the_steps_passes():
+    question = {
+        'mathTool': {'toolName': 'elevationDepression', 'parameters': {'angle': 50, 'height': 'h', 'distance': '60 m'}},
+        'finalAnswer': '73.1 m',
+        'stepByStepGuideline': ['h = 60 × tan(50°) ≈ 71.508 m', 'H ≈ 71.508 + 1.6 = 73.108 m'],
+    }
+    assert verify_question(question) == []
+
+
+def test_arithmetic_slip_is_rejected():
+    question = {'finalAnswer': '42', 'stepByStepGuideline': ['12 + 29 = 42']}
+    assert [issue.rule for issue in verify_question(question)] == ['answer']
+
+
+def test_question_without_numbers_is_not_checked():
+    assert check_answer({'finalAnswer': 'Yes, they are similar', 'stepByStepGuideline': []}) == (False, [])
+
+
+# Skip rules: each real corpus string below must be skipped, and the near miss next to it must still be checked
+
+def test_powers_and_variables_before_an_equation_are_skipped():
+    assert check_arithmetic('Step 1: Algebraically solve the equation $x^2 - 9 = 0$.') is None
+    assert check_arithmetic('Step 1: Work out $y = 2 - 9 = 0$.') is not None
+
+
+def test_ratios_are_skipped():
+    assert check_arithmetic('Simplify by dividing both by 3: 9 ÷ 3 : 6 ÷ 3 = 3 : 2') is None
+    assert check_arithmetic('Simplify by dividing both by 3: 9 ÷ 3 = 2') is not None
+
+
+def test_mixed_numbers_are_skipped():
+    assert check_arithmetic('Step 2: Find net change: 1 5/8 - 1 1/4 = 1 5/8 - 1 2/8 = 3/8 (net gain).') is None
+    assert check_arithmetic('Step 2: Find net change: 5/8 - 2/8 = 1/8 (net gain).') is not None
+
+
+def test_results_continuing_the_expression_are_skipped():
+    assert check_arithmetic('$175 = 25 \\times 7 = 5^2 \\times 7$') is None
+    assert check_arithmetic('$175 = 25 \\times 7 = 165$') is not None
+    # Degrees are not a power
+    assert check_arithmetic('$4(20) - 10 = 80 - 10 = 70^{\\circ}$') is None
+    assert check_arithmetic('$4(20) - 10 = 80 - 10 = 60^{\\circ}$') is not None
+
+
+def test_remainders_are_skipped():
+    assert check_arithmetic('Check 14: 72 ÷ 14 = 5 R 2. The division is not exact.') is None
+    assert check_arithmetic('34 ÷ 8 = 4 remainder 2 (Not a multiple)') is None
+    assert check_arithmetic('Step 4: Calculate: 24/8 - 3/8 = 21/8 = 2 5/8 litres.') is None
+    assert check_arithmetic('Check 14: 72 ÷ 14 = 6. The division is not exact.') is not None
+
+
+def test_stem_and_leaf_values_are_skipped():
+    assert check_arithmetic('The values are 35 + 1 = 351; 35 + 4 = 354; 35 + 7 = 357; 35 + 8 = 358.') is None
+    assert check_arithmetic('The values are 35 + 1 = 37.') is not None
+
+
+def test_fraction_of_a_total_is_skipped_but_percentages_are_checked():
+    assert check_arithmetic('Step 5: If 11/60 of total = 22, then 1/60 = 2, so total = 120 beads.') is None
+    assert check_arithmetic('3/5 = 60%') is None
+    assert check_arithmetic('3/5 = 65%') is not None
+    # Percentage points
+    assert check_arithmetic('estimate the charge at Hour 4: 46 - 18 = 28%.') is None
+
+
+def test_chains_negatives_and_fraction_results_are_checked():
+    assert check_arithmetic('Sum the values: 12 + 15 + 15 + 18 + 19 + 20 + 21 + 22 + 23 + 150 = 305.') is not None
+    assert check_arithmetic("Liam's current age is $13 \\times 12 + 9 = 165$ months.") is None
+    assert check_arithmetic('$-6 + 1 = -5$.') is None
+    assert check_arithmetic('$-6 + 1 = -7$.') is not None
+    assert check_arithmetic('P(prime) = 4/16 = 1/4.') is None
+    assert check_arithmetic('P(prime) = 4/16 = 1/3.') is not None
@@ -0,0 +1,55 @@
+"""
+Checks for the node generation loop in generate_questions.py (python -m pytest test_generate_questions.py)
+"""
+
+import json
+import os
+
+import generate_questions as gq
+from providers import MockProvider
+from telemetry import recorder as telemetry
+
+EXEMPLAR_FILE = os.path.join(os.path.dirname(__file__), '..', 'S2', 'Maths', 's2-math-pythagoras-exemplars.json')
+
+
+class ScriptedProvider(MockProvider):
+    """Mock provider that returns a fixed number of questions per call, whatever was asked for"""
+
+    def __init__(self, counts):
+        super().__init__(seed=1)
+        self.counts = list(counts)
+
+    def _complete(self, prompt: str) -> str:
+        request = self._parse_prompt(prompt)
+        return json.dumps([self._synthesize_question(request, i) for i in range(self.counts.pop(0))])
+
+
+def generate_node(provider, count=5, max_retries=3):
+    with open(EXEMPLAR_FILE, 'r', encoding='utf-8') as f:
+        exemplar = json.load(f)['pythagoras-node-2']
+    options = gq.GenerationOptions(count=count, max_retries=max_retries, cache=None)
+    questions = gq.generate_node_questions('pythagoras-node-2', exemplar, 2, provider, [], options,
+                                           log=lambda *args, **kwargs: None)
+    return questions, telemetry.nodes[-1]
+
+
+def test_questions_kept_across_retries_are_counted_once():
+    # 2 of 5, then 1 of the missing 3, then the last 2
+    questions, row = generate_node(ScriptedProvider([2, 1, 2]))
+    assert len(questions) == 5
+    assert [q['id'] for q in questions] == [f"q2-{i}" for i in range(1, 6)]
+    # 2 kept through the second call, 3 through the third; counted once each, not 2 + 3
+    assert row['salvaged'] == 3
+    assert row['calls'] == 3
+
+
+def test_nothing_is_salvaged_when_the_first_batch_is_complete():
+    questions, row = generate_node(ScriptedProvider([5]))
+    assert len(questions) == 5
+    assert row['salvaged'] == 0
+
+
+def test_partial_batch_is_kept_when_retries_run_out():
+    questions, row = generate_node(ScriptedProvider([2, 1]), max_retries=2)
+    assert len(questions) == 3
+    assert row['salvaged'] == 2
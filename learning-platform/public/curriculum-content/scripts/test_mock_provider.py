@@ -0,0 +1,28 @@
+"""
+Checks for the offline mock provider (python -m pytest test_mock_provider.py)
+"""
+
+import os
+
+import generate_questions as gq
+from answer_verifier import verify_question
+from providers import MockProvider
+
+EXEMPLAR_FILE = os.path.join(os.path.dirname(__file__), '..', 'S2', 'Maths', 's2-math-pythagoras-exemplars.json')
+
+
+def test_mock_answers_pass_the_answer_check():
+    provider = MockProvider(seed=1)
+    request = {'title': 'Pythagoras', 'tool_spec': {'toolName': 'rightTriangle',
+                                                    'parameters': {'opposite': 'variable', 'adjacent': 'variable'}}}
+    for index in range(20):
+        assert verify_question(provider._synthesize_question(request, index)) == []
+
+
+def test_mock_run_completes_every_node(tmp_path):
+    run = gq.prepare_topic_run(EXEMPLAR_FILE, str(tmp_path / 'out.yaml'), 'Test')
+    options = gq.GenerationOptions(count=5, max_retries=1)
+    gq.generate_pending_nodes([run], MockProvider(seed=1), options, 1)
+
+    assert len(run.new_nodes) == len(run.exemplars)
+    assert all(len(node['descriptor']['preWrittenQuestions']) == 5 for node in run.new_nodes)
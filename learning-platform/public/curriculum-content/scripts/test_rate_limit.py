@@ -0,0 +1,95 @@
+"""
+Checks for rate_limit.py (python -m pytest test_rate_limit.py)
+"""
+
+import json
+
+from json_stream import StreamFormatError
+from providers import ProviderError
+from rate_limit import (BACKOFF_MAX_SECONDS, DEFAULT_RATE_LIMIT_PAUSE, FATAL, PARSE, RATE_LIMIT, TRANSIENT,
+                        RateLimiter, backoff_delay, classify_error, retry_after_seconds, take_throttled_seconds)
+
+
+class StatusError(Exception):
+    """An SDK error carrying an HTTP status, like anthropic's APIStatusError"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_provider_error_kind_wins():
+    assert classify_error(ProviderError("quota", kind=RATE_LIMIT)) == RATE_LIMIT
+    assert classify_error(ProviderError("no key")) == FATAL
+
+
+def test_http_status_codes():
+    assert classify_error(StatusError(429)) == RATE_LIMIT
+    assert classify_error(StatusError(503)) == TRANSIENT
+    assert classify_error(StatusError(408)) == TRANSIENT
+    assert classify_error(StatusError(400)) == FATAL
+    assert classify_error(StatusError(401)) == FATAL
+
+
+def test_parse_errors():
+    assert classify_error(json.JSONDecodeError("bad", "[", 0)) == PARSE
+    assert classify_error(StreamFormatError("not an array")) == PARSE
+
+
+def test_errors_without_a_status_are_classified_by_type_or_name():
+    assert classify_error(TimeoutError()) == TRANSIENT
+    assert classify_error(ConnectionResetError()) == TRANSIENT
+    assert classify_error(APIConnectionError()) == TRANSIENT
+    assert classify_error(ResourceExhausted()) == RATE_LIMIT
+
+
+def test_unknown_errors_are_not_retried():
+    assert classify_error(ValueError("bug in our code")) == FATAL
+    assert classify_error(KeyError('text')) == FATAL
+
+
+def test_retry_after_header():
+    error = StatusError(429)
+    error.response = Response({'retry-after': '7'})
+    assert retry_after_seconds(error) == 7.0
+    assert retry_after_seconds(ProviderError("slow down", kind=RATE_LIMIT, retry_after=2.5)) == 2.5
+    assert retry_after_seconds(StatusError(429)) is None
+
+
+def test_parse_errors_retry_immediately():
+    assert backoff_delay(PARSE, 3) == 0.0
+
+
+def test_backoff_grows_with_the_attempt_and_is_capped():
+    for attempt in range(1, 12):
+        window = min(BACKOFF_MAX_SECONDS, 2 ** attempt)
+        assert window / 2 <= backoff_delay(TRANSIENT, attempt) <= window
+
+
+def test_rate_limit_backoff_honours_retry_after_and_a_minimum_pause():
+    assert 5.0 <= backoff_delay(RATE_LIMIT, 1, retry_after=5.0) <= 6.0
+    assert DEFAULT_RATE_LIMIT_PAUSE / 2 <= backoff_delay(RATE_LIMIT, 1) <= DEFAULT_RATE_LIMIT_PAUSE
+
+
+def test_throttled_time_is_reported_once_per_thread():
+    limiter = RateLimiter(requests_per_minute=600)  # A minute's worth (600) goes out without waiting
+    take_throttled_seconds()
+    for _ in range(600):
+        limiter.acquire()
+    assert take_throttled_seconds() < 0.05
+    limiter.acquire()  # The bucket is empty: this one waits ~0.1s for a refill
+    assert 0.05 < take_throttled_seconds() <= 0.2
+    assert take_throttled_seconds() == 0.0
@@ -0,0 +1,100 @@
+"""
+Checks for yaml_store.py splicing and --incremental regeneration (python -m pytest test_yaml_store.py)
+"""
+
+import json
+import os
+
+import generate_questions as gq
+from providers import MockProvider
+from yaml_store import _node_item_spans, load_yaml_file, splice_nodes
+
+EXEMPLAR_FILE = os.path.join(os.path.dirname(__file__), '..', 'S2', 'Maths', 's2-math-pythagoras-exemplars.json')
+
+TOPIC_YAML = """# Topic - Unified Practice Path
+
+nodes:
+- id: node-1
+  nodeNumber: 1
+  title: First   # reviewed by hand
+  descriptor:
+    preWrittenQuestions:
+    - problemText: 'Q1'
+# Section two
+- id: node-2
+  nodeNumber: 2
+  title: Second
+- id: node-4
+  nodeNumber: 4
+  title: Fourth
+"""
+
+
+def item_texts(text):
+    return {node_id: text[start:end] for node_id, _, start, end, _ in _node_item_spans(text)}
+
+
+def test_splice_replaces_one_node_and_keeps_every_other_byte():
+    text, nodes = splice_nodes(TOPIC_YAML, [{'id': 'node-2', 'nodeNumber': 2, 'title': 'Second (regenerated)'}])
+    assert [node['id'] for node in nodes] == ['node-1', 'node-2', 'node-4']
+    assert nodes[1]['title'] == 'Second (regenerated)'
+    before, after = item_texts(TOPIC_YAML), item_texts(text)
+    assert after['node-1'] == before['node-1'] and after['node-4'] == before['node-4']
+    assert '# Section two\n' in text and '# reviewed by hand' in text
+
+
+def test_splice_inserts_by_node_number():
+    text, nodes = splice_nodes(TOPIC_YAML, [{'id': 'node-3', 'nodeNumber': 3, 'title': 'Third'},
+                                            {'id': 'node-5', 'nodeNumber': 5, 'title': 'Fifth'}])
+    assert [node['id'] for node in nodes] == ['node-1', 'node-2', 'node-3', 'node-4', 'node-5']
+    assert text.startswith(TOPIC_YAML[:TOPIC_YAML.index('- id: node-4')])
+
+
+def test_splice_declines_layouts_it_cannot_edit_safely():
+    assert splice_nodes('nodes: [{id: node-1, nodeNumber: 1}]\n', [{'id': 'node-1', 'nodeNumber': 1}]) is None
+    assert splice_nodes('- just a list\n', [{'id': 'node-1', 'nodeNumber': 1}]) is None
+
+
+def generate(exemplar_file, output_path, incremental=False):
+    run = gq.prepare_topic_run(exemplar_file, output_path, 'Test', test=True, incremental=incremental)
+    gq.generate_pending_nodes([run], MockProvider(seed=1), gq.GenerationOptions(count=5, max_retries=2))
+    gq.materialize_topic_output(run)
+    return run
+
+
+def test_incremental_run_regenerates_only_the_stale_node(tmp_path):
+    with open(EXEMPLAR_FILE, 'r', encoding='utf-8') as f:
+        exemplars = json.load(f)
+    exemplar_file, output_path = str(tmp_path / 'topic-exemplars.json'), str(tmp_path / 'topic.yaml')
+    with open(exemplar_file, 'w', encoding='utf-8') as f:
+        json.dump(exemplars, f)
+    generate(exemplar_file, output_path)
+
+    # A hand edit to the file, and a changed exemplar for node 2
+    with open(output_path, 'r', encoding='utf-8') as f:
+        text = f.read().replace('- id: pythagoras-node-2', '# checked by the maths team\n- id: pythagoras-node-2')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    old_texts = {node['id']: [q['problemText'] for q in node['descriptor']['preWrittenQuestions']]
+                 for node in load_yaml_file(output_path)['nodes']}
+    exemplars['pythagoras-node-2']['title'] += ' (revised)'
+    with open(exemplar_file, 'w', encoding='utf-8') as f:
+        json.dump(exemplars, f)
+
+    run = gq.prepare_topic_run(exemplar_file, output_path, 'Test', test=True, incremental=True)
+    assert run.stale_node_ids == ['pythagoras-node-2']
+    # The stale node's old questions don't count against its replacement
+    assert not set(old_texts['pythagoras-node-2']) & set(run.previous_question_texts)
+    assert set(old_texts['pythagoras-node-1']) <= set(run.previous_question_texts)
+
+    generate(exemplar_file, output_path, incremental=True)
+    with open(output_path, 'r', encoding='utf-8') as f:
+        new_text = f.read()
+    before, after = item_texts(text), item_texts(new_text)
+    assert after['pythagoras-node-1'] == before['pythagoras-node-1']
+    assert after['pythagoras-node-3'] == before['pythagoras-node-3']
+    assert after['pythagoras-node-2'] != before['pythagoras-node-2']
+    assert '# checked by the maths team\n' in new_text
+    nodes = load_yaml_file(output_path)['nodes']
+    assert [node['id'] for node in nodes] == ['pythagoras-node-1', 'pythagoras-node-2', 'pythagoras-node-3']
+    assert nodes[1]['title'].endswith('(revised)')
@@ -0,0 +1,93 @@
+"""
+Exam Paper File Helpers
+
+Shared by the exam-paper scripts (filter_exam_questions.py, exam_hash_index.py,
+exam_index.py, exam_transaction.py): atomic writes, which files under
+exam-papers hold questions (and which changed since an index last saw them),
+and reading the questions out of any exam-paper file shape:
+
+- papers and bucket files: {"questions": [...]}
+- topic files (raw/n1.json, processed/n1.json, ...): {"questions": {"Paper 1": [...], ...}}
+- bucket shards: one question per line (.jsonl)
+"""
+
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+SHARD_SUFFIX = '.jsonl'
+
+
+def _default_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_file_atomic(path: str, content: str, sync: bool = True, tmp_path: Optional[str] = None):
+    """Write via a temp file in the same directory, then os.replace (never leaves a half-written file).
+    sync=False skips the fsync, for writes already made durable by a transaction log (exam_transaction.py),
+    and tmp_path names the temp file so that log can record it."""
+    directory = os.path.dirname(path) or '.'
+    mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else _default_file_mode()
+    if tmp_path:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    else:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def is_exam_file(name: str) -> bool:
+    """Papers, topic and bucket files and shards; hidden files (the indexes, manifests, temp files) are not"""
+    return not name.startswith('.') and (name.endswith('.json') or name.endswith(SHARD_SUFFIX))
+
+
+def file_changed(entry: Optional[Dict[str, Any]], stat: os.stat_result) -> bool:
+    """Whether a file's size/mtime differ from what an index entry ({'size', 'mtimeNs', ...}) recorded"""
+    return not entry or entry['size'] != stat.st_size or entry['mtimeNs'] != stat.st_mtime_ns
+
+
+def changed_exam_files(root: str, entries: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """Compare the exam files under root with an index's entries (relative path -> entry).
+
+    Returns the paths of files that are new or changed, and the relative paths of
+    entries whose file is gone.
+    """
+    changed, seen = [], set()
+    for directory, subdirs, names in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if not d.startswith('.'))
+        for name in sorted(filter(is_exam_file, names)):
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root)
+            seen.add(relative)
+            if file_changed(entries.get(relative), os.stat(path)):
+                changed.append(path)
+    return changed, sorted(set(entries) - seen)
+
+
+def questions_of(data: Any) -> List[Dict[str, Any]]:
+    """The questions in a parsed paper, bucket or topic file"""
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if isinstance(questions, dict):
+        questions = [q for paper in questions.values() if isinstance(paper, list) for q in paper]
+    return [q for q in questions or [] if isinstance(q, dict)]
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Every question in an exam-paper JSON file or JSONL shard"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(SHARD_SUFFIX):
+            return [json.loads(line) for line in f if line.strip()]
+        return questions_of(json.load(f))
@@ -0,0 +1,153 @@
+"""
+Exam Question Content-Hash Index
+
+A persistent index of a content hash for every question in every exam-paper
+file under o-level/exam-papers (raw, processed, QA, and the bucket shards).
+
+- The hash covers the normalized stem and part texts (case, whitespace and
+  Unicode forms folded), not ids or numbering, so a re-extracted or restored
+  copy of a question hashes the same as the original
+- The index is stored in exam-papers/.exam-questions.hashes.json with each
+  file's size and mtime; a refresh only re-reads files that changed
+- Lookups (is this question already in that bucket? which questions appear
+  under more than one id?) are dict/set operations: O(n) over the corpus, no
+  pairwise comparison
+
+Used by filter_exam_questions.py to make moves idempotent and for its
+--find-duplicates mode.
+"""
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from exam_files import SHARD_SUFFIX, changed_exam_files, file_changed, load_questions, write_file_atomic
+
+INDEX_FILENAME = '.exam-questions.hashes.json'
+INDEX_VERSION = 1
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(text: Any) -> str:
+    if not isinstance(text, str):
+        return ''
+    return _WHITESPACE.sub('', unicodedata.normalize('NFKC', text).lower())
+
+
+def question_hash(question: Dict[str, Any]) -> Optional[str]:
+    """Content hash of a question's stem and part texts (None if it has no text at all)"""
+    texts = [_normalize(question.get('stem'))]
+    texts.extend(_normalize(part.get('questionText')) for part in question.get('parts') or [] if isinstance(part, dict))
+    if not any(texts):
+        return None
+    return hashlib.sha1('\x1f'.join(texts).encode('utf-8')).hexdigest()[:16]
+
+
+class HashIndex:
+    """Content hashes of every question under an exam-papers directory, cached on disk"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, INDEX_FILENAME)
+        # Relative path -> {'size', 'mtimeNs', 'questions': [[hash, questionId], ...]}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, root: str) -> 'HashIndex':
+        """The saved index (empty if missing or from another version), refreshed against the files on disk"""
+        index = cls(root)
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('version') == INDEX_VERSION and isinstance(saved.get('files'), dict):
+                index.files = saved['files']
+        except (OSError, json.JSONDecodeError, AttributeError):
+            pass
+        index.refresh()
+        return index
+
+    def refresh(self) -> int:
+        """Re-hash files that were added or changed since the last refresh. Returns how many were read."""
+        changed, removed = changed_exam_files(self.root, self.files)
+        for relative in removed:
+            del self.files[relative]
+            self.dirty = True
+        return sum(self.update_file(path) for path in changed)
+
+    def update_file(self, path: str) -> bool:
+        """Re-hash one file if its size/mtime changed (or drop it if it's gone). Returns True if it was read."""
+        relative = os.path.relpath(path, self.root)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if self.files.pop(relative, None) is not None:
+                self.dirty = True
+            return False
+        if not file_changed(self.files.get(relative), stat):
+            return False
+        try:
+            questions = load_questions(path)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+            questions = []  # Not an exam file we can read; recorded so it isn't re-read every run
+        self.files[relative] = {
+            'size': stat.st_size,
+            'mtimeNs': stat.st_mtime_ns,
+            'questions': [[h, q.get('questionId')] for q in questions for h in [question_hash(q)] if h],
+        }
+        self.dirty = True
+        return True
+
+    def save(self):
+        if self.dirty:
+            write_file_atomic(self.path, json.dumps({'version': INDEX_VERSION, 'files': self.files},
+                                                    separators=(',', ':')) + "\n")
+            self.dirty = False
+
+    def entries(self) -> Iterator[Tuple[str, str, Optional[str]]]:
+        """(hash, relative path, questionId) for every indexed question"""
+        for relative, entry in self.files.items():
+            for question_hash_, question_id in entry['questions']:
+                yield question_hash_, relative, question_id
+
+    def bucket_hashes(self, raw_relative: str, bucket: str) -> Set[str]:
+        """Hashes already in a bucket: its legacy JSON file plus all of its shards"""
+        legacy = os.path.join(raw_relative, bucket + '.json')
+        shard_dir = os.path.join(raw_relative, bucket) + os.sep
+        hashes = set()
+        for relative, entry in self.files.items():
+            if relative == legacy or (relative.startswith(shard_dir) and relative.endswith(SHARD_SUFFIX)):
+                hashes.update(h for h, _ in entry['questions'])
+        return hashes
+
+    def find_duplicates(self) -> List[Dict[str, Any]]:
+        """Questions whose content appears under more than one questionId, or more than once in one file.
+
+        A question's copies in the pipeline's other files (raw paper -> topic file -> processed -> QA)
+        share its questionId and are not duplicates."""
+        ids: Dict[str, Set[Optional[str]]] = defaultdict(set)
+        locations: Dict[str, List[Tuple[str, Optional[str]]]] = defaultdict(list)
+        per_file: Dict[Tuple[str, str], int] = defaultdict(int)
+        for question_hash_, relative, question_id in self.entries():
+            ids[question_hash_].add(question_id)
+            locations[question_hash_].append((relative, question_id))
+            per_file[(question_hash_, relative)] += 1
+
+        repeated: Dict[str, List[str]] = defaultdict(list)
+        for (question_hash_, relative), count in per_file.items():
+            if count > 1:
+                repeated[question_hash_].append(relative)
+
+        groups = []
+        for question_hash_ in sorted(set(h for h, found in ids.items() if len(found) > 1) | set(repeated)):
+            groups.append({
+                'hash': question_hash_,
+                'questionIds': sorted(str(i) for i in ids[question_hash_]),
+                'repeatedIn': sorted(repeated.get(question_hash_, [])),
+                'locations': sorted(set(locations[question_hash_]), key=lambda item: (item[0], str(item[1]))),
+            })
+        return groups
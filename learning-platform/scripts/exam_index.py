@@ -0,0 +1,294 @@
+"""
+Exam Question Query Index
+
+An on-disk inverted index over every question part in every exam-paper file
+under o-level/exam-papers (raw papers, topic files and bucket shards,
+processed, QA), so questions can be found without loading and scanning the
+files:
+
+- One record per question part (a question without parts is one record) with
+  its questionId, partId, marks and file
+- Postings (value -> record positions) per field: school, year, paper, topic,
+  answerType, hasDiagram, marks, stage (raw/processed/QA) and the word tokens
+  of the stem and part text (LaTeX commands dropped)
+- school/year/paper come from the questionId (N2-acsi-2024-p1-q1), falling
+  back to the paper's file name (acsi-2024-paper-1-2.json) and its "Paper 1"
+
+The index is stored in exam-papers/.exam-questions.index.json as one segment
+per file, with the file's size and mtime. Loading it re-indexes only the
+files that changed (all of them in parallel, one process per file, on the
+first build), and a query intersects postings segment by segment: a few
+milliseconds over the whole corpus.
+
+Usage:
+  # Every drawing part in a 2024 raw paper
+  python3 scripts/exam_index.py answerType=drawing year=2024 stage=raw
+
+  # Diagram questions about bearings in topic G3 or G4, as JSON
+  python3 scripts/exam_index.py hasDiagram=true topic=G3,G4 --text bearing --json
+
+  # Index statistics (values per field), rebuilding from scratch
+  python3 scripts/exam_index.py --rebuild
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from exam_files import changed_exam_files, load_questions, write_file_atomic
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'curriculum-content',
+                            'o-level', 'exam-papers')
+INDEX_FILENAME = '.exam-questions.index.json'
+INDEX_VERSION = 1
+
+FIELDS = ['school', 'year', 'paper', 'topic', 'answerType', 'hasDiagram', 'marks', 'stage']
+TEXT_FIELD = 'token'
+
+_QUESTION_ID = re.compile(r'^(?P<topic>[A-Za-z]+\d+)-(?P<school>.+)-(?P<year>\d{4})-p(?P<paper>\d+)-q\d+$')
+_PAPER_FILE = re.compile(r'^(?P<school>.+?)-(?P<year>\d{4})-paper')
+_PAPER_NAME = re.compile(r'(\d+)')
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+')
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: Any) -> Set[str]:
+    """Lowercase word/number tokens of a text (LaTeX commands and single letters dropped)"""
+    if not isinstance(text, str):
+        return set()
+    return {token for token in _TOKEN.findall(_LATEX_COMMAND.sub(' ', text).lower()) if len(token) > 1}
+
+
+def question_fields(question: Dict[str, Any], relative: str) -> Dict[str, str]:
+    """The question-level field values of a question found in the given file"""
+    fields = {'stage': relative.split(os.sep, 1)[0]}
+    match = _QUESTION_ID.match(str(question.get('questionId') or ''))
+    if match:
+        fields.update(school=match.group('school').lower(), year=match.group('year'), paper=match.group('paper'),
+                      topic=match.group('topic').upper())
+    else:
+        file_match = _PAPER_FILE.match(os.path.basename(relative))
+        if file_match:
+            fields.update(school=file_match.group('school').lower(), year=file_match.group('year'))
+        paper = _PAPER_NAME.search(str(question.get('paper') or ''))
+        if paper:
+            fields['paper'] = paper.group(1)
+    if question.get('topicID'):
+        fields['topic'] = str(question['topicID']).upper()
+    if isinstance(question.get('hasDiagram'), bool):
+        fields['hasDiagram'] = str(question['hasDiagram']).lower()
+    return fields
+
+
+def index_file(path: str, root: str) -> Dict[str, Any]:
+    """One file's segment: its records and the postings over them"""
+    relative = os.path.relpath(path, root)
+    stat = os.stat(path)
+    segment: Dict[str, Any] = {'size': stat.st_size, 'mtimeNs': stat.st_mtime_ns, 'records': [], 'postings': {}}
+    try:
+        questions = load_questions(path)
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return segment  # Not an exam file we can read; recorded so it isn't re-read every load
+
+    postings: Dict[str, Dict[str, List[int]]] = {}
+    for question in questions:
+        fields = question_fields(question, relative)
+        stem_tokens = tokenize(question.get('stem'))
+        parts = [part for part in question.get('parts') or [] if isinstance(part, dict)] or [{}]
+        for part in parts:
+            position = len(segment['records'])
+            segment['records'].append({'questionId': question.get('questionId'), 'partId': part.get('partId'),
+                                       'marks': part.get('marks', question.get('totalMarks'))})
+            values = dict(fields)
+            if part.get('answerType'):
+                values['answerType'] = str(part['answerType'])
+            if isinstance(part.get('marks'), (int, float)):
+                values['marks'] = f"{part['marks']:g}"
+            for field, value in values.items():
+                postings.setdefault(field, {}).setdefault(value, []).append(position)
+            for token in stem_tokens | tokenize(part.get('questionText')):
+                postings.setdefault(TEXT_FIELD, {}).setdefault(token, []).append(position)
+    segment['postings'] = postings
+    return segment
+
+
+class ExamIndex:
+    """Inverted index over the question parts under an exam-papers directory, cached on disk"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, INDEX_FILENAME)
+        self.segments: Dict[str, Dict[str, Any]] = {}  # Relative path -> segment (see index_file)
+        self.dirty = False
+        self.reindexed = 0  # Files read by the last refresh
+
+    @classmethod
+    def load(cls, root: str, workers: int = 1, rebuild: bool = False) -> 'ExamIndex':
+        """The saved index (empty if missing, from another version or rebuild), refreshed against the files on disk"""
+        index = None if rebuild else cls.load_saved(root)
+        index = index or cls(root)
+        index.refresh(workers)
+        return index
+
+    @classmethod
+    def load_saved(cls, root: str) -> Optional['ExamIndex']:
+        """The saved index as it is (no refresh), or None if there is none - lets writers such as
+        filter_exam_questions.py keep an existing index current without building one"""
+        index = cls(root)
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(saved, dict) or saved.get('version') != INDEX_VERSION or not isinstance(saved.get('segments'), dict):
+            return None
+        index.segments = saved['segments']
+        return index
+
+    def refresh(self, workers: int = 1) -> int:
+        """Re-index files that were added or changed since the last refresh. Returns how many were read."""
+        changed, removed = changed_exam_files(self.root, self.segments)
+        for relative in removed:
+            del self.segments[relative]
+            self.dirty = True
+
+        if workers > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(changed))) as executor:
+                segments = list(executor.map(index_file, changed, [self.root] * len(changed)))
+        else:
+            segments = [index_file(path, self.root) for path in changed]
+        for path, segment in zip(changed, segments):
+            self.segments[os.path.relpath(path, self.root)] = segment
+            self.dirty = True
+        self.reindexed = len(changed)
+        return len(changed)
+
+    def update_file(self, path: str):
+        """Re-index one file right away (or drop it if it's gone)"""
+        relative = os.path.relpath(path, self.root)
+        if os.path.exists(path):
+            self.segments[relative] = index_file(path, self.root)
+        else:
+            self.segments.pop(relative, None)
+        self.dirty = True
+
+    def save(self):
+        if self.dirty:
+            write_file_atomic(self.path, json.dumps({'version': INDEX_VERSION, 'segments': self.segments},
+                                                    separators=(',', ':')) + "\n")
+            self.dirty = False
+
+    def query(self, filters: Optional[Dict[str, List[str]]] = None, text: str = '') -> List[Dict[str, Any]]:
+        """Records matching every filter (a field matches any of its values) and containing every text token.
+
+        Each result is the part's record plus its 'file' (relative to the index root)."""
+        conditions = [(field, [str(value) for value in values]) for field, values in (filters or {}).items()]
+        conditions.extend((TEXT_FIELD, [token]) for token in sorted(tokenize(text)))
+        results = []
+        for relative, segment in sorted(self.segments.items()):
+            matching: Optional[Set[int]] = None
+            # Rarest condition first, so the candidate set shrinks as fast as possible
+            for positions in sorted((self._positions(segment, field, values) for field, values in conditions), key=len):
+                matching = positions if matching is None else matching & positions
+                if not matching:
+                    break
+            if matching is None:
+                matching = set(range(len(segment['records'])))
+            results.extend({**segment['records'][position], 'file': relative} for position in sorted(matching))
+        return results
+
+    @staticmethod
+    def _positions(segment: Dict[str, Any], field: str, values: List[str]) -> Set[int]:
+        postings = segment['postings'].get(field, {})
+        if field == 'school':
+            values = [value.lower() for value in values]
+        elif field == 'topic':
+            values = [value.upper() for value in values]
+        positions: Set[int] = set()
+        for value in values:
+            positions.update(postings.get(value, []))
+        return positions
+
+    def field_values(self, field: str) -> Dict[str, int]:
+        """{value: number of records} for one field across the corpus"""
+        counts: Dict[str, int] = {}
+        for segment in self.segments.values():
+            for value, positions in segment['postings'].get(field, {}).items():
+                counts[value] = counts.get(value, 0) + len(positions)
+        return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+    def __len__(self) -> int:
+        return sum(len(segment['records']) for segment in self.segments.values())
+
+
+def parse_filters(expressions: List[str]) -> Dict[str, List[str]]:
+    """["answerType=drawing", "year=2023,2024"] -> {'answerType': ['drawing'], 'year': ['2023', '2024']}"""
+    filters: Dict[str, List[str]] = {}
+    for expression in expressions:
+        field, separator, values = expression.partition('=')
+        if not separator or field not in FIELDS:
+            raise ValueError(f"Invalid filter {expression!r}: use FIELD=VALUE[,VALUE...] with FIELD one of "
+                             f"{', '.join(FIELDS)}")
+        filters.setdefault(field, []).extend(value.strip() for value in values.split(',') if value.strip())
+    return filters
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Query the exam-paper questions through an on-disk inverted index')
+    parser.add_argument('filters', nargs='*', help=f"FIELD=VALUE[,VALUE...] filters ({', '.join(FIELDS)})")
+    parser.add_argument('--text', default='', help='Words that must all appear in the stem or part text')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='exam-papers directory to index')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Files indexed in parallel')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore the saved index and index every file again')
+    parser.add_argument('--json', action='store_true', help='Print the matching parts as JSON')
+    parser.add_argument('--limit', type=int, default=50, help='Parts listed (0 = all; default: 50)')
+    args = parser.parse_args()
+
+    try:
+        filters = parse_filters(args.filters)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+    if not os.path.isdir(args.root):
+        print(f"ERROR: {args.root} is not a directory")
+        return 1
+
+    start = time.perf_counter()
+    index = ExamIndex.load(os.path.abspath(args.root), args.workers, args.rebuild)
+    index.save()
+    loaded = time.perf_counter()
+
+    if not filters and not args.text:
+        print(f"Index: {len(index.segments)} files, {len(index):,} question parts "
+              f"(loaded in {(loaded - start) * 1000:.0f} ms, {index.reindexed} file(s) re-indexed)")
+        for field in FIELDS:
+            values = index.field_values(field)
+            shown = ', '.join(f"{value} ({count})" for value, count in list(values.items())[:12])
+            print(f"  {field}: {shown}{', ...' if len(values) > 12 else ''}")
+        return 0
+
+    results = index.query(filters, args.text)
+    query_ms = (time.perf_counter() - loaded) * 1000
+    shown = results if args.limit <= 0 else results[:args.limit]
+    if args.json:
+        print(json.dumps(shown, indent=2, ensure_ascii=False))
+    else:
+        for record in shown:
+            part = f" ({record['partId']})" if record.get('partId') else ''
+            print(f"  {record['questionId']}{part}  {record.get('marks') or '-'} mark(s)  {record['file']}")
+        if len(shown) < len(results):
+            print(f"  ... {len(results) - len(shown)} more (--limit 0 to list all)")
+    questions = len({(record['file'], record['questionId']) for record in results})
+    print(f"{len(results)} part(s) in {questions} question(s); query {query_ms:.1f} ms, index load "
+          f"{(loaded - start) * 1000:.0f} ms ({index.reindexed} file(s) re-indexed)",
+          file=sys.stderr if args.json else sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Exam Question Routing Rules
+
+Declarative rules that decide which bucket an exam question moves to, compiled
+once into a single-pass classifier (used by filter_exam_questions.py).
+
+A rule set is a JSON list; each rule names a bucket and a `when` condition:
+
+    [
+      {"bucket": "1. questions_require_drawing", "when": {"parts.answerType": "drawing"},
+       "countField": "totalFilteredQuestions", "note": "..."},
+      {"bucket": "3. questions-with-tables", "when": {"any": [
+          {"diagramDescription": {"regex": "(?i)\\btable\\b"}},
+          {"parts.questionText": {"regex": "(?i)\\bthe table\\b"}}]}}
+    ]
+
+Conditions:
+- {"field.path": value}      the field equals value (true/false/null match exactly)
+- {"field.path": {"in": [..]}}, {"regex": ".."}, {"exists": true|false}
+- several fields in one dict must all match; {"any": [..]}, {"all": [..]}, {"not": {..}} combine them
+- a path segment that hits a list matches if any element does ("parts.answerType"
+  is true when any part has that answerType)
+
+Semantics: "first" routes a question to the first matching rule's bucket (rule
+order is priority); "all" routes it to every matching bucket.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+FIRST_MATCH = 'first'
+MULTI_MATCH = 'all'
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        # Drawing comes first: a drawing question with a diagram still can't be answered
+        'bucket': '1. questions_require_drawing',
+        'when': {'parts.answerType': 'drawing'},
+        'countField': 'totalFilteredQuestions',
+        'note': "Questions requiring drawing input are stored here separately. These questions will be re-enabled "
+                "when the application supports drawing capabilities.",
+    },
+    {
+        'bucket': '2. questions-with-diagrams',
+        'when': {'hasDiagram': True},
+        'countField': 'totalDiagramQuestions',
+        'note': "Questions with diagrams (hasDiagram: true) are stored here separately. These questions require "
+                "visual elements like graphs, geometric figures, or tables that need to be rendered alongside the "
+                "question text.",
+    },
+]
+_MISSING = object()
+
+
+class RuleError(ValueError):
+    """A rule set that can't be compiled"""
+
+
+@dataclass
+class Rule:
+    """One compiled routing rule"""
+    bucket: str
+    matches: Predicate
+    count_field: str = 'totalQuestions'
+    note: str = ''
+
+
+def field_values(value: Any, path: List[str]) -> Iterator[Any]:
+    """Every value at a dotted path, fanning out over lists"""
+    if not path:
+        if isinstance(value, list):
+            yield from value
+        else:
+            yield value
+        return
+    if isinstance(value, list):
+        for item in value:
+            yield from field_values(item, path)
+    elif isinstance(value, dict):
+        child = value.get(path[0], _MISSING)
+        if child is not _MISSING:
+            yield from field_values(child, path[1:])
+
+
+def _value_test(condition: Any, where: str) -> Callable[[Any], bool]:
+    """Compile the condition on one field into a test of a single value"""
+    if not isinstance(condition, dict):
+        if isinstance(condition, bool) or condition is None:
+            return lambda value: value is condition
+        return lambda value: value == condition and not isinstance(value, bool)
+    if len(condition) != 1:
+        raise RuleError(f"{where}: expected one operator, got {sorted(condition)}")
+    operator, operand = next(iter(condition.items()))
+    if operator == 'in':
+        if not isinstance(operand, list):
+            raise RuleError(f"{where}: 'in' needs a list")
+        tests = [_value_test(option, where) for option in operand]
+        return lambda value: any(test(value) for test in tests)
+    if operator == 'regex':
+        try:
+            pattern = re.compile(operand)
+        except (re.error, TypeError) as e:
+            raise RuleError(f"{where}: bad regex {operand!r} ({e})")
+        return lambda value: isinstance(value, str) and pattern.search(value) is not None
+    raise RuleError(f"{where}: unknown operator {operator!r}")
+
+
+def compile_condition(when: Any, where: str = 'when') -> Predicate:
+    """Compile a `when` dict into a predicate over a question"""
+    if not isinstance(when, dict) or not when:
+        raise RuleError(f"{where}: expected a non-empty object")
+    predicates: List[Predicate] = []
+    for key, condition in when.items():
+        if key in ('any', 'all'):
+            if not isinstance(condition, list) or not condition:
+                raise RuleError(f"{where}.{key}: expected a non-empty list")
+            parts = [compile_condition(c, f"{where}.{key}[{i}]") for i, c in enumerate(condition)]
+            combine = any if key == 'any' else all
+            predicates.append(lambda q, parts=parts, combine=combine: combine(p(q) for p in parts))
+        elif key == 'not':
+            inner = compile_condition(condition, f"{where}.not")
+            predicates.append(lambda q, inner=inner: not inner(q))
+        else:
+            path = key.split('.')
+            if isinstance(condition, dict) and set(condition) == {'exists'}:
+                wanted = bool(condition['exists'])
+                predicates.append(lambda q, path=path, wanted=wanted:
+                                  any(v is not None for v in field_values(q, path)) == wanted)
+            else:
+                test = _value_test(condition, f"{where}.{key}")
+                predicates.append(lambda q, path=path, test=test: any(test(v) for v in field_values(q, path)))
+
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda q: all(p(q) for p in predicates)
+
+
+def compile_rules(specs: List[Dict[str, Any]]) -> List[Rule]:
+    if not isinstance(specs, list) or not specs:
+        raise RuleError("a rule set is a non-empty list of rules")
+    rules = []
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not isinstance(spec.get('bucket'), str) or not spec['bucket']:
+            raise RuleError(f"rule {i + 1}: needs a 'bucket' name")
+        rules.append(Rule(bucket=spec['bucket'], matches=compile_condition(spec.get('when'), f"rule {i + 1}.when"),
+                          count_field=spec.get('countField', 'totalQuestions'), note=spec.get('note', '')))
+    return rules
+
+
+def load_rules(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Rule specs from a JSON file (the built-in drawing/diagram rules if path is None)"""
+    if path is None:
+        return DEFAULT_RULES
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Classifier:
+    """Routes questions to buckets with one pass over the compiled rules"""
+
+    def __init__(self, specs: List[Dict[str, Any]], mode: str = FIRST_MATCH):
+        if mode not in (FIRST_MATCH, MULTI_MATCH):
+            raise RuleError(f"unknown match mode {mode!r}")
+        self.rules = compile_rules(specs)
+        self.buckets = list(dict.fromkeys(rule.bucket for rule in self.rules))
+        self.first_match = mode == FIRST_MATCH
+
+    def classify(self, question: Dict[str, Any]) -> List[str]:
+        """Buckets the question goes to (empty: it stays in its paper)"""
+        buckets = []
+        for rule in self.rules:
+            if rule.matches(question) and rule.bucket not in buckets:
+                buckets.append(rule.bucket)
+                if self.first_match:
+                    break
+        return buckets
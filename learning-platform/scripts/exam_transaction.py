@@ -0,0 +1,131 @@
+"""
+Transactional Multi-File Writes for the Exam-Paper Scripts
+
+A run of filter_exam_questions.py touches many files (papers, bucket shards,
+bucket JSON files); they must change together or not at all, otherwise
+questions are lost from a paper before reaching their bucket, or duplicated.
+
+A FileTransaction stages every write and delete in memory, then commits with
+a write-ahead manifest (one JSONL file next to the data):
+
+1. The manifest is written with the full new content of every file and a
+   closing commit record, then fsync'd once: this is the commit point
+2. Each file is replaced via its temp file (named in the manifest) +
+   os.replace, with no per-file fsync; the manifest already holds the data
+3. The replaced files and their directories are fsync'd, then the manifest is
+   removed
+
+recover() runs at the start of the next run: a manifest with its commit
+record is replayed (replaying is idempotent, and rewrites the recorded temp
+files), a torn one (no commit record: the run died before its commit point,
+so no file or temp file was touched yet) is discarded. Only temp files this
+transaction names are ever removed - never another writer's.
+"""
+
+import glob
+import json
+import os
+import uuid
+from typing import Dict, List, Optional
+
+from exam_files import write_file_atomic
+
+MANIFEST_FILENAME = '.filter-exam.manifest.jsonl'
+MANIFEST_VERSION = 1
+
+
+def _flush_to_disk(paths: List[str]):
+    """fsync the replaced files, then their directories so the renames and deletes are durable too"""
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb+') as f:
+                os.fsync(f.fileno())
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # Windows: directories can't be opened for fsync
+    for directory in sorted({os.path.dirname(path) for path in paths}):
+        if os.path.isdir(directory):
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def _apply(operations: List[Dict]):
+    for operation in operations:
+        if operation.get('delete'):
+            if os.path.exists(operation['path']):
+                os.remove(operation['path'])
+        else:
+            os.makedirs(os.path.dirname(operation['path']) or '.', exist_ok=True)
+            write_file_atomic(operation['path'], operation['content'], sync=False, tmp_path=operation.get('tmp'))
+    _flush_to_disk([operation['path'] for operation in operations])
+
+
+def read_manifest(manifest_path: str) -> Optional[List[Dict]]:
+    """The operations of a committed manifest, or None if it's missing or torn"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if len(records) < 2 or records[0].get('version') != MANIFEST_VERSION:
+        return None
+    operations, commit = records[1:-1], records[-1]
+    if commit.get('commit') != len(operations):
+        return None
+    return operations
+
+
+def recover(manifest_path: str) -> int:
+    """Finish (or discard) a run that was interrupted mid-commit. Returns how many files were restored."""
+    # The manifest's own temp file, if the run died while writing it
+    directory, filename = os.path.split(os.path.abspath(manifest_path))
+    for tmp_path in glob.glob(os.path.join(glob.escape(directory), f".{glob.escape(filename)}.*.tmp")):
+        os.remove(tmp_path)
+    if not os.path.exists(manifest_path):
+        return 0
+    operations = read_manifest(manifest_path)
+    if operations:
+        _apply(operations)  # Rewrites and renames the recorded temp files; none can be left over
+    os.remove(manifest_path)
+    return len(operations or [])
+
+
+class FileTransaction:
+    """Writes and deletes that are committed all together with one fsync'd manifest"""
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.operations: Dict[str, Dict] = {}  # Path -> last staged operation (later stages win)
+
+    def write(self, path: str, content: str):
+        path = os.path.abspath(path)
+        self.operations[path] = {'path': path, 'content': content}
+
+    def delete(self, path: str):
+        path = os.path.abspath(path)
+        self.operations[path] = {'path': path, 'delete': True}
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def commit(self) -> List[str]:
+        """Make every staged change durable and apply it. Returns the paths touched."""
+        if not self.operations:
+            return []
+        operations = list(self.operations.values())
+        token = uuid.uuid4().hex[:12]
+        for operation in operations:
+            if not operation.get('delete'):
+                directory, filename = os.path.split(operation['path'])
+                operation['tmp'] = os.path.join(directory, f".{filename}.{token}.tmp")
+        lines = [json.dumps({'version': MANIFEST_VERSION})]
+        lines.extend(json.dumps(operation, ensure_ascii=False) for operation in operations)
+        lines.append(json.dumps({'commit': len(operations)}))
+        # The commit point: once this fsync returns, recover() can always finish the run
+        write_file_atomic(self.manifest_path, "\n".join(lines) + "\n")
+        _apply(operations)
+        os.remove(self.manifest_path)
+        self.operations = {}
+        return [operation['path'] for operation in operations]
@@ -1,88 +1,344 @@
+"""
+Exam Paper Filter
+
+Moves questions the app can't serve yet out of every exam paper in
+o-level/exam-papers/raw, in one pass. Routing is a rule set (exam_rules.py,
+or a JSON file via --rules) compiled once into a single-pass classifier; the
+built-in rules are:
+
+1. Questions with any part of answerType "drawing" -> "1. questions_require_drawing"
+2. Questions with hasDiagram=true                 -> "2. questions-with-diagrams"
+
+--match first (default) routes a question to the first matching rule's bucket;
+--match all copies it to every matching bucket.
+
+Papers are filtered in parallel (one process per paper). Each paper only reads
+itself and writes its own bucket shards, so the cost of a run scales with the
+questions being moved, not with the size of the buckets:
+
+- Buckets are a legacy JSON file plus a directory of JSONL shards, one shard per
+  source paper (e.g. "raw/2. questions-with-diagrams/acsi-2024-paper-1-2.jsonl")
+- Workers only compute new file contents; the run commits every paper and
+  shard together as one transaction (exam_transaction.py: a write-ahead
+  manifest fsync'd once, then temp file + os.replace per file). A run that
+  dies mid-commit is finished by the next run; one that dies before its
+  commit point changed nothing
+- --compact folds the shards back into the legacy JSON files (the only step
+  that rewrites a whole bucket; run it when a single file is needed)
+
+Moves are idempotent by content: exam_hash_index.py keeps a content hash of
+every question under exam-papers, so a question from a restored or
+re-extracted paper that is already in its bucket leaves the paper without
+being added again, and --compact keeps one copy of each question (the
+bucket's total is its real size). --find-duplicates lists questions whose
+content appears under more than one questionId across raw/processed/QA.
+If the query index (exam_index.py) has been built, every file a run changes is
+re-indexed in it as well, so queries never see a stale paper or bucket.
+
+Usage:
+  python3 scripts/filter_exam_questions.py [RAW_DIR] [--workers N] [--dry-run]
+  python3 scripts/filter_exam_questions.py --rules my-rules.json --match all --dry-run
+  python3 scripts/filter_exam_questions.py --compact
+  python3 scripts/filter_exam_questions.py --find-duplicates
+"""
+
+import argparse
+import glob
 import json
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from exam_files import SHARD_SUFFIX, load_questions
+from exam_hash_index import HashIndex, question_hash
+from exam_index import ExamIndex
+from exam_rules import FIRST_MATCH, MULTI_MATCH, Classifier, RuleError, compile_rules, load_rules
+from exam_transaction import MANIFEST_FILENAME, FileTransaction, recover
+
+DEFAULT_RAW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'curriculum-content',
+                               'o-level', 'exam-papers', 'raw')
+
+# Set once per worker process by init_worker (compiled rules hold closures, which don't pickle)
+_classifier: Optional[Classifier] = None
+_bucket_hashes: Dict[str, Set[str]] = {}
+
 
-def filter_exam_questions(source_file, drawing_file, diagram_file):
-    """
-    Filters questions from source_file:
-    1. Moves questions with answerType="drawing" to drawing_file.
-    2. Moves questions with hasDiagram=true to diagram_file.
-    """
+def init_worker(rule_specs: List[Dict[str, Any]], mode: str, bucket_hashes: Dict[str, Set[str]]):
+    global _classifier, _bucket_hashes
+    _classifier = Classifier(rule_specs, mode)
+    _bucket_hashes = bucket_hashes
+
+
+def detect_indent(text: str) -> int:
+    """Indent width of a pretty-printed JSON file (papers use 2 or 4)"""
+    for line in text.splitlines()[1:]:
+        stripped = line.lstrip(' ')
+        if stripped:
+            return (len(line) - len(stripped)) or 2
+    return 2
+
+
+def shard_path(raw_dir: str, bucket: str, paper_name: str) -> str:
+    return os.path.join(raw_dir, bucket, paper_name + SHARD_SUFFIX)
+
+
+def appended_shard(path: str, questions: List[Dict[str, Any]]) -> Optional[str]:
+    """A paper's shard with questions appended (skipping content already there), or None if nothing is new"""
+    existing = ''
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = f.read()
+    known = {question_hash(json.loads(line)) for line in existing.splitlines() if line.strip()}
+    new = [q for q in questions if (h := question_hash(q)) is None or h not in known]
+    if not new:
+        return None
+    return existing + ''.join(json.dumps(q, ensure_ascii=False) + "\n" for q in new)
+
+
+def filter_paper(paper_path: str, raw_dir: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Work out one paper's moves into its bucket shards (runs in a worker process).
+    Nothing is written here: the new file contents come back in result['writes'] for the run's transaction."""
+    buckets = _classifier.buckets
+    paper_name = os.path.splitext(os.path.basename(paper_path))[0]
+    result = {'paper': paper_name, 'moved': {bucket: 0 for bucket in buckets}, 'kept': 0, 'scanned': 0,
+              'alreadyInBucket': 0, 'classifySeconds': 0.0, 'writes': {}, 'error': None}
     try:
-        with open(source_file, 'r') as f:
-            source_data = json.load(f)
-        
-        with open(drawing_file, 'r') as f:
-            drawing_data = json.load(f)
-
-        with open(diagram_file, 'r') as f:
-            diagram_data = json.load(f)
-
-    except FileNotFoundError as e:
-        print(f"Error: File not found - {e}")
-        return
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON - {e}")
-        return
-
-    questions_to_keep = []
-    drawing_questions_to_move = []
-    diagram_questions_to_move = []
-
-    for question in source_data.get('questions', []):
-        is_drawing = False
-        if 'parts' in question:
-            for part in question['parts']:
-                if part.get('answerType') == 'drawing':
-                    is_drawing = True
-                    break
-        
-        if is_drawing:
-            drawing_questions_to_move.append(question)
-            continue # Skip further checks if it's a drawing question
-
-        if question.get('hasDiagram') is True:
-            diagram_questions_to_move.append(question)
-            continue # Skip further checks if it's a diagram question
-        
-        questions_to_keep.append(question)
-
-    # Update source data
-    source_data['questions'] = questions_to_keep
-
-    # Update drawing data
-    if 'questions' not in drawing_data:
-        drawing_data['questions'] = []
-    drawing_data['questions'].extend(drawing_questions_to_move)
-    drawing_data['totalFilteredQuestions'] = len(drawing_data['questions'])
-
-    # Update diagram data
-    if 'questions' not in diagram_data:
-        diagram_data['questions'] = []
-    diagram_data['questions'].extend(diagram_questions_to_move)
-    diagram_data['totalDiagramQuestions'] = len(diagram_data['questions'])
-
-    # Write back to files
+        with open(paper_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        data = json.loads(text)
+    except (OSError, json.JSONDecodeError) as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    to_keep = []
+    to_move: Dict[str, List[Dict[str, Any]]] = {bucket: [] for bucket in buckets}
+    start = time.perf_counter()
+    for question in data['questions']:
+        routed = _classifier.classify(question)
+        for bucket in routed:
+            to_move[bucket].append(question)
+        if not routed:
+            to_keep.append(question)
+    result['classifySeconds'] = time.perf_counter() - start
+    result['scanned'] = len(data['questions'])
+    result['kept'] = len(to_keep)
+
+    # Questions whose content is already in the bucket (a restored or re-extracted paper) only leave the paper
+    to_append: Dict[str, List[Dict[str, Any]]] = {}
+    for bucket, questions in to_move.items():
+        known = _bucket_hashes.get(bucket, set())
+        to_append[bucket] = [q for q in questions if (h := question_hash(q)) is None or h not in known]
+        result['alreadyInBucket'] += len(questions) - len(to_append[bucket])
+        result['moved'][bucket] = len(questions)
+
+    if dry_run or not any(to_move.values()):
+        return result  # Nothing to move: the paper is not rewritten
+
+    for bucket, new in to_append.items():
+        if new:
+            path = shard_path(raw_dir, bucket, paper_name)
+            content = appended_shard(path, new)
+            if content is not None:
+                result['writes'][path] = content
+    data['questions'] = to_keep
+    result['writes'][paper_path] = json.dumps(data, indent=detect_indent(text), ensure_ascii=False) + "\n"
+    return result
+
+
+def find_papers(raw_dir: str, buckets: List[str]) -> Tuple[List[str], List[str]]:
+    """(exam papers, other JSON files) in raw_dir. Papers hold a flat questions list; topic files
+    (n1.json, ...) group questions by paper and are skipped, as are the bucket files."""
+    papers, skipped = [], []
+    for path in sorted(glob.glob(os.path.join(raw_dir, '*.json'))):
+        if os.path.splitext(os.path.basename(path))[0] in buckets:
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            skipped.append(path)
+            continue
+        if isinstance(data, dict) and isinstance(data.get('questions'), list):
+            papers.append(path)
+        else:
+            skipped.append(path)
+    return papers, skipped
+
+
+def compact_buckets(raw_dir: str, rule_specs: List[Dict[str, Any]],
+                    transaction: FileTransaction) -> Dict[str, Tuple[int, int]]:
+    """Stage folding every bucket's shards into its legacy JSON file and removing them, keeping one copy of
+    each question's content. Returns {bucket: (questions added, duplicates dropped)}."""
+    results = {}
+    for rule in compile_rules(rule_specs):
+        bucket, count_field, note = rule.bucket, rule.count_field, rule.note
+        if bucket in results:
+            continue
+        shards = sorted(glob.glob(os.path.join(raw_dir, bucket, '*' + SHARD_SUFFIX)))
+        legacy_path = os.path.join(raw_dir, bucket + '.json')
+        data = {'note': note, 'questions': []}
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        existing = data.get('questions') or []
+
+        questions = []
+        known = set()
+        added = dropped = 0
+        candidates = [(q, False) for q in existing] + [(q, True) for shard in shards for q in load_questions(shard)]
+        for question, from_shard in candidates:
+            key = question_hash(question) or question.get('questionId')
+            if key is not None and key in known:
+                dropped += 1
+                continue
+            known.add(key)
+            questions.append(question)
+            added += from_shard
+        results[bucket] = (added, dropped)
+        if not shards and not dropped:
+            continue
+
+        data['questions'] = questions
+        if shards:
+            data['source'] = os.path.splitext(os.path.basename(shards[-1]))[0]
+        data[count_field] = len(questions)
+        transaction.write(legacy_path, json.dumps(data, indent=4, ensure_ascii=False) + "\n")
+        for shard in shards:
+            transaction.delete(shard)
+    return results
+
+
+def remove_empty_shard_dirs(raw_dir: str, buckets: List[str]):
+    for bucket in buckets:
+        shard_dir = os.path.join(raw_dir, bucket)
+        if os.path.isdir(shard_dir) and not os.listdir(shard_dir):
+            os.rmdir(shard_dir)
+
+
+def print_duplicates(index: HashIndex) -> int:
+    """List questions whose content appears under several ids or repeats within a file. Returns the group count."""
+    groups = index.find_duplicates()
+    for group in groups:
+        print(f"  {group['hash']}: {', '.join(group['questionIds'])}")
+        for relative, question_id in group['locations']:
+            repeated = " (repeated in this file)" if relative in group['repeatedIn'] else ""
+            print(f"      {relative}  {question_id}{repeated}")
+    total = sum(len(entry['questions']) for entry in index.files.values())
+    print(f"{len(groups)} duplicate groups among {total} indexed questions in {len(index.files)} files")
+    return len(groups)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Move questions the app cannot serve yet out of the raw exam papers')
+    parser.add_argument('raw_dir', nargs='?', default=DEFAULT_RAW_DIR, help='Directory of raw exam paper JSON files')
+    parser.add_argument('--rules', help='JSON rule set (default: the built-in drawing/diagram rules)')
+    parser.add_argument('--match', choices=[FIRST_MATCH, MULTI_MATCH], default=FIRST_MATCH,
+                        help='Route to the first matching bucket, or to all of them')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Papers filtered in parallel')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would move without writing anything')
+    parser.add_argument('--compact', action='store_true', help='Fold bucket shards into the legacy JSON bucket files')
+    parser.add_argument('--find-duplicates', action='store_true',
+                        help='List questions whose content appears under more than one id (all exam-paper folders)')
+    args = parser.parse_args()
+    raw_dir = os.path.normpath(args.raw_dir)
+
+    if not os.path.isdir(raw_dir):
+        print(f"Error: {raw_dir} is not a directory")
+        return 1
     try:
-        with open(source_file, 'w') as f:
-            json.dump(source_data, f, indent=4)
-        
-        with open(drawing_file, 'w') as f:
-            json.dump(drawing_data, f, indent=4)
-
-        with open(diagram_file, 'w') as f:
-            json.dump(diagram_data, f, indent=4)
-            
-        print(f"Moved {len(drawing_questions_to_move)} drawing questions to {drawing_file}")
-        print(f"Moved {len(diagram_questions_to_move)} diagram questions to {diagram_file}")
-        print(f"Remaining {len(questions_to_keep)} questions in {source_file}")
-
-    except Exception as e:
-        print(f"Error writing files: {e}")
+        rule_specs = load_rules(args.rules)
+        buckets = Classifier(rule_specs, args.match).buckets  # Compile once here so bad rules fail before any work
+    except (OSError, json.JSONDecodeError, RuleError) as e:
+        print(f"Error: invalid rules - {e}")
+        return 1
+
+    # Finish the commit of an interrupted run before reading anything
+    manifest_path = os.path.join(raw_dir, MANIFEST_FILENAME)
+    restored = recover(manifest_path)
+    if restored:
+        print(f"Recovered an interrupted run: {restored} file changes re-applied")
+    transaction = FileTransaction(manifest_path)
+
+    # Content hashes of everything under exam-papers (raw, processed, QA, bucket shards)
+    exam_root = os.path.dirname(raw_dir)
+    raw_relative = os.path.relpath(raw_dir, exam_root)
+    index = HashIndex.load(exam_root)
+    # The query index (exam_index.py), if one has been built, is kept current file by file too
+    query_index = ExamIndex.load_saved(exam_root)
+
+    if args.find_duplicates:
+        print_duplicates(index)
+        index.save()
+        return 0
+
+    if args.compact:
+        for bucket, (added, dropped) in compact_buckets(raw_dir, rule_specs, transaction).items():
+            print(f"Compacted {added} questions into {bucket}.json ({dropped} duplicates dropped)")
+        for path in transaction.commit():
+            index.update_file(path)
+            if query_index:
+                query_index.update_file(path)
+        remove_empty_shard_dirs(raw_dir, buckets)
+        index.save()
+        if query_index:
+            query_index.save()
+        return 0
+
+    papers, skipped = find_papers(raw_dir, buckets)
+    print(f"Filtering {len(papers)} papers in {raw_dir} ({len(skipped)} other files skipped, "
+          f"{len(buckets)} buckets, {args.match}-match)")
+    if not papers:
+        return 0
+
+    totals = {bucket: 0 for bucket in buckets}
+    scanned = 0
+    classify_seconds = 0.0
+    already_in_bucket = 0
+    errors = 0
+    bucket_hashes = {bucket: index.bucket_hashes(raw_relative, bucket) for bucket in buckets}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(papers))),
+                             initializer=init_worker, initargs=(rule_specs, args.match, bucket_hashes)) as pool:
+        results = pool.map(filter_paper, papers, [raw_dir] * len(papers), [args.dry_run] * len(papers))
+        for result in results:
+            if result['error']:
+                errors += 1
+                print(f"  Error in {result['paper']}: {result['error']}")
+                continue
+            moved = result['moved']
+            scanned += result['scanned']
+            classify_seconds += result['classifySeconds']
+            already_in_bucket += result['alreadyInBucket']
+            for path, content in result['writes'].items():
+                transaction.write(path, content)
+            # A dry run summarizes every paper; a real run only lists the papers it changed
+            if args.dry_run or any(moved.values()):
+                routed = ', '.join(f"{count} -> {bucket}" for bucket, count in moved.items() if count) or 'nothing to move'
+                print(f"  {result['paper']}: {routed}; {result['kept']} of {result['scanned']} remaining")
+            for bucket, count in moved.items():
+                totals[bucket] += count
+    # Every paper's moves land together: one manifest fsync for the whole run
+    for path in transaction.commit():
+        index.update_file(path)
+        if query_index:
+            query_index.update_file(path)
+    elapsed = time.perf_counter() - start
+
+    verb = "Would move" if args.dry_run else "Moved"
+    for bucket, count in totals.items():
+        print(f"{verb} {count} questions to {bucket}/")
+    if already_in_bucket:
+        print(f"{already_in_bucket} of them were already in their bucket (removed from the paper, not added again)")
+    print(f"Scanned {scanned} questions in {elapsed:.2f}s ({scanned / max(elapsed, 1e-9):,.0f} questions/sec; "
+          f"classifier alone {scanned / max(classify_seconds, 1e-9):,.0f} questions/sec)")
+    if not args.dry_run:
+        index.save()
+        if query_index:
+            query_index.save()
+    return 1 if errors else 0
+
 
 if __name__ == "__main__":
-    base_path = "/Users/farhat/Documents/AI Systems/AITutor/aicampus/learning-platform/public/curriculum-content/o-level/exam-papers/raw/"
-    source_path = os.path.join(base_path, "zhonghua-2024-paper-1-2.json")
-    drawing_path = os.path.join(base_path, "1. questions_require_drawing.json")
-    diagram_path = os.path.join(base_path, "2. questions-with-diagrams.json")
-    
-    filter_exam_questions(source_path, drawing_path, diagram_path)
+    sys.exit(main())
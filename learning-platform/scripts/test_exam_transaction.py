@@ -0,0 +1,114 @@
+"""
+Checks for exam_transaction.py crash recovery (python -m pytest test_exam_transaction.py)
+"""
+
+import json
+import os
+
+import pytest
+
+import exam_transaction
+from exam_transaction import MANIFEST_FILENAME, FileTransaction, read_manifest, recover
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def papers(tmp_path):
+    """Two papers and a bucket file, plus the manifest path next to them"""
+    for name in ('paper-1.json', 'paper-2.json', 'bucket.json'):
+        (tmp_path / name).write_text(json.dumps({'questions': [name]}), encoding='utf-8')
+    return tmp_path, str(tmp_path / MANIFEST_FILENAME)
+
+
+def stage_move(transaction, root):
+    transaction.write(str(root / 'paper-1.json'), '{"questions": []}')
+    transaction.write(str(root / 'bucket.json'), '{"questions": ["moved"]}')
+    transaction.write(str(root / 'shards' / 'b-1.jsonl'), '"moved"\n')
+    transaction.delete(str(root / 'paper-2.json'))
+
+
+def crash_after(monkeypatch, writes):
+    """Make the transaction's writes die after `writes` successful ones, leaving a half-written temp file"""
+    real_write = exam_transaction.write_file_atomic
+    done = []
+
+    def write(path, content, sync=True, tmp_path=None):
+        if len(done) == writes:
+            # Unnamed temp files are named like write_file_atomic's mkstemp ones
+            tmp_path = tmp_path or os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.x1y2z3.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content[:3])
+            raise OSError("simulated crash")
+        done.append(path)
+        real_write(path, content, sync, tmp_path)
+
+    monkeypatch.setattr(exam_transaction, 'write_file_atomic', write)
+
+
+def test_commit_applies_everything_and_removes_the_manifest(papers):
+    root, manifest = papers
+    transaction = FileTransaction(manifest)
+    stage_move(transaction, root)
+    assert len(transaction.commit()) == 4
+    assert read(root / 'bucket.json') == '{"questions": ["moved"]}'
+    assert not (root / 'paper-2.json').exists()
+    assert not os.path.exists(manifest)
+
+
+def test_crash_partway_through_applying_is_finished_by_recover(papers, monkeypatch):
+    root, manifest = papers
+    transaction = FileTransaction(manifest)
+    stage_move(transaction, root)
+    crash_after(monkeypatch, 2)  # The manifest and paper-1 are written, then the bucket write dies
+    with pytest.raises(OSError):
+        transaction.commit()
+    assert read_manifest(manifest) is not None
+    assert read(root / 'paper-1.json') == '{"questions": []}'
+    assert json.loads(read(root / 'bucket.json')) == {'questions': ['bucket.json']}
+    monkeypatch.undo()
+
+    assert recover(manifest) == 4
+    assert read(root / 'paper-1.json') == '{"questions": []}'
+    assert read(root / 'bucket.json') == '{"questions": ["moved"]}'
+    assert read(root / 'shards' / 'b-1.jsonl') == '"moved"\n'
+    assert not (root / 'paper-2.json').exists()
+    assert not os.path.exists(manifest)
+    assert not [name for name in os.listdir(root) if name.endswith('.tmp')]
+    assert recover(manifest) == 0  # Nothing left to do
+
+
+def test_torn_manifest_is_discarded_without_touching_files(papers):
+    root, manifest = papers
+    transaction = FileTransaction(manifest)
+    stage_move(transaction, root)
+    transaction.commit()
+    before = {name: read(root / name) for name in ('paper-1.json', 'bucket.json')}
+    # A manifest cut off before its commit record: the run died before its commit point
+    with open(manifest, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'version': 1}) + "\n" + json.dumps({'path': str(root / 'bucket.json'), 'content': 'x'}))
+
+    assert recover(manifest) == 0
+    assert {name: read(root / name) for name in before} == before
+    assert not os.path.exists(manifest)
+
+
+def test_crash_while_writing_the_manifest_leaves_the_files_alone(papers, monkeypatch):
+    root, manifest = papers
+    transaction = FileTransaction(manifest)
+    stage_move(transaction, root)
+    crash_after(monkeypatch, 0)
+    with pytest.raises(OSError):
+        transaction.commit()
+    monkeypatch.undo()
+    assert not os.path.exists(manifest)
+    (root / '.paper-1.json.other-writer.tmp').write_text('in flight', encoding='utf-8')
+
+    assert recover(manifest) == 0
+    assert json.loads(read(root / 'paper-1.json')) == {'questions': ['paper-1.json']}
+    assert (root / 'paper-2.json').exists()
+    # Only the manifest's own temp file is cleaned up, never another writer's
+    assert sorted(name for name in os.listdir(root) if name.endswith('.tmp')) == ['.paper-1.json.other-writer.tmp']